@@ -7,9 +7,8 @@
 #include "ns3/applications-module.h"
 
 #include <fstream>
-#include <sstream>
 #include <vector>
-#include <unordered_map>
+#include <cstdlib>
 #include <cstring>
 
 using namespace ns3;
@@ -27,74 +26,91 @@ struct IntentRow {
   int targetLane;
 };
 
-static std::vector<MobilityRow> ReadMobilityCsv(const std::string &path) {
-  std::vector<MobilityRow> rows;
-  std::ifstream f(path.c_str());
-  if (!f.is_open()) { NS_FATAL_ERROR("Cannot open mobility trace: " << path); }
-  std::string line;
-  std::getline(f, line);
-  while (std::getline(f, line)) {
-    if (line.empty()) continue;
-    std::stringstream ss(line);
-    std::string tok;
-    MobilityRow r{};
-    std::getline(ss, tok, ','); r.t = std::stod(tok);
-    std::getline(ss, tok, ','); r.nodeId = (uint32_t)std::stoul(tok);
-    std::getline(ss, tok, ','); r.x = std::stod(tok);
-    std::getline(ss, tok, ','); r.y = std::stod(tok);
-    std::getline(ss, tok, ','); r.v = std::stod(tok);
-    std::getline(ss, tok, ','); r.psi = std::stod(tok);
-    std::getline(ss, tok, ','); r.laneIdx = std::stoi(tok);
-    rows.push_back(r);
-  }
-  return rows;
+// Parses one "t,node_id,x,y,v,psi,lane_idx" line in place (no per-token strings).
+static bool ParseMobilityLine(const char *s, MobilityRow &r) {
+  char *end = nullptr;
+  r.t = std::strtod(s, &end);        if (end == s || *end != ',') return false; s = end + 1;
+  r.nodeId = (uint32_t)std::strtoul(s, &end, 10); if (end == s || *end != ',') return false; s = end + 1;
+  r.x = std::strtod(s, &end);        if (end == s || *end != ',') return false; s = end + 1;
+  r.y = std::strtod(s, &end);        if (end == s || *end != ',') return false; s = end + 1;
+  r.v = std::strtod(s, &end);        if (end == s || *end != ',') return false; s = end + 1;
+  r.psi = std::strtod(s, &end);      if (end == s || *end != ',') return false; s = end + 1;
+  r.laneIdx = (int)std::strtol(s, &end, 10);
+  return end != s;
 }
 
-static std::vector<IntentRow> ReadIntentCsv(const std::string &path) {
-  std::vector<IntentRow> rows;
+// Intents bucketed by sender so each app gets its own schedule in one pass.
+static std::vector<std::vector<IntentRow>> ReadIntentCsv(const std::string &path, uint32_t nNodes) {
+  std::vector<std::vector<IntentRow>> bySender(nNodes);
   std::ifstream f(path.c_str());
-  if (!f.is_open()) { return rows; }
+  if (!f.is_open()) { return bySender; }
   std::string line;
   std::getline(f, line);
   while (std::getline(f, line)) {
     if (line.empty()) continue;
-    std::stringstream ss(line);
-    std::string tok;
+    const char *s = line.c_str();
+    char *end = nullptr;
     IntentRow r{};
-    std::getline(ss, tok, ','); r.t = std::stod(tok);
-    std::getline(ss, tok, ','); r.sender = (uint32_t)std::stoul(tok);
-    std::getline(ss, tok, ','); r.targetLane = std::stoi(tok);
-    rows.push_back(r);
+    r.t = std::strtod(s, &end);                     if (*end != ',') continue; s = end + 1;
+    r.sender = (uint32_t)std::strtoul(s, &end, 10); if (*end != ',') continue; s = end + 1;
+    r.targetLane = (int)std::strtol(s, &end, 10);
+    if (r.sender < nNodes) bySender[r.sender].push_back(r);
   }
-  return rows;
+  return bySender;
 }
 
-static std::unordered_map<uint32_t, double> gV;
-static std::unordered_map<uint32_t, double> gPsi;
-static std::unordered_map<uint32_t, int> gLane;
+// Latest kinematics per node (indexed by node id), read by BuildAndSend.
+static std::vector<double> gV;
+static std::vector<double> gPsi;
+static std::vector<int> gLane;
 
+// Streams mobility_ns3.csv (sorted by t) and keeps one pending event: each tick
+// applies every row with that timestamp, then schedules the next tick.
 class TraceMobilityPlayer {
 public:
-  TraceMobilityPlayer(NodeContainer nodes, std::vector<MobilityRow> rows)
-      : m_nodes(nodes), m_rows(std::move(rows)) {}
+  TraceMobilityPlayer(NodeContainer nodes, const std::string &path)
+      : m_nodes(nodes), m_f(path.c_str()) {
+    if (!m_f.is_open()) { NS_FATAL_ERROR("Cannot open mobility trace: " << path); }
+    std::getline(m_f, m_line);
+    gV.assign(nodes.GetN(), 0.0);
+    gPsi.assign(nodes.GetN(), 0.0);
+    gLane.assign(nodes.GetN(), -1);
+  }
   void Start() {
-    for (const auto &r : m_rows) {
-      Simulator::Schedule(Seconds(r.t), &TraceMobilityPlayer::Apply, this,
-                          r.nodeId, r.x, r.y, r.v, r.psi, r.laneIdx);
-    }
+    if (ReadNext()) Simulator::Schedule(Seconds(m_next.t), &TraceMobilityPlayer::Tick, this);
   }
 private:
-  void Apply(uint32_t nodeId, double x, double y, double v, double psi, int laneIdx) {
-    Ptr<Node> n = m_nodes.Get(nodeId);
+  bool ReadNext() {
+    while (std::getline(m_f, m_line)) {
+      if (m_line.empty()) continue;
+      if (ParseMobilityLine(m_line.c_str(), m_next)) return true;
+    }
+    m_f.close();
+    return false;
+  }
+  void Tick() {
+    const double t = m_next.t;
+    bool more = true;
+    while (more && m_next.t == t) {
+      Apply(m_next);
+      more = ReadNext();
+    }
+    if (more) Simulator::Schedule(Seconds(m_next.t) - Simulator::Now(), &TraceMobilityPlayer::Tick, this);
+  }
+  void Apply(const MobilityRow &r) {
+    if (r.nodeId >= m_nodes.GetN()) return;
+    Ptr<Node> n = m_nodes.Get(r.nodeId);
     Ptr<MobilityModel> mm = n->GetObject<MobilityModel>();
     Ptr<ConstantPositionMobilityModel> c = DynamicCast<ConstantPositionMobilityModel>(mm);
-    if (c) c->SetPosition(Vector(x, y, 0.0));
-    gV[nodeId] = v;
-    gPsi[nodeId] = psi;
-    gLane[nodeId] = laneIdx;
+    if (c) c->SetPosition(Vector(r.x, r.y, 0.0));
+    gV[r.nodeId] = r.v;
+    gPsi[r.nodeId] = r.psi;
+    gLane[r.nodeId] = r.laneIdx;
   }
   NodeContainer m_nodes;
-  std::vector<MobilityRow> m_rows;
+  std::ifstream m_f;
+  std::string m_line;
+  MobilityRow m_next{};
 };
 
 class BeaconIntentApp : public Application {
@@ -145,9 +161,11 @@ private:
 
     double v = 0.0, psi = 0.0;
     int laneIdx = -1;
-    if (gV.find(sender) != gV.end()) v = gV[sender];
-    if (gPsi.find(sender) != gPsi.end()) psi = gPsi[sender];
-    if (gLane.find(sender) != gLane.end()) laneIdx = gLane[sender];
+    if (sender < gV.size()) {
+      v = gV[sender];
+      psi = gPsi[sender];
+      laneIdx = gLane[sender];
+    }
 
     uint8_t buf[PAYLOAD_SIZE];
     std::memset(buf, 0, PAYLOAD_SIZE);
@@ -176,7 +194,9 @@ private:
   }
 
   void SendIntent(int targetLaneIdx) {
-    BuildAndSend(2, targetLaneIdx);
+    // Intent events are queued at setup, ahead of the mobility tick for the same
+    // instant; re-queue so the intent carries that tick's position.
+    Simulator::ScheduleNow(&BeaconIntentApp::BuildAndSend, this, (uint8_t)2, targetLaneIdx);
   }
 
   void HandleRead(Ptr<Socket> socket) {
@@ -269,21 +289,15 @@ int main(int argc, char **argv) {
   { std::ofstream clear(rxLogPath.c_str(), std::ios::out); }
   { std::ofstream clear(txLogPath.c_str(), std::ios::out); }
 
-  auto mobRows = ReadMobilityCsv(mobPath);
-  TraceMobilityPlayer player(nodes, mobRows);
+  TraceMobilityPlayer player(nodes, mobPath);
   player.Start();
 
-  auto intents = ReadIntentCsv(intentPath);
+  auto intents = ReadIntentCsv(intentPath, nNodes);
 
   for (uint32_t i = 0; i < nNodes; i++) {
     Ptr<BeaconIntentApp> app = CreateObject<BeaconIntentApp>();
     app->Configure(4444, hz, rxLogPath, txLogPath);
-
-    std::vector<IntentRow> mine;
-    for (const auto &it : intents) {
-      if (it.sender == i) mine.push_back(it);
-    }
-    app->ScheduleIntents(mine);
+    app->ScheduleIntents(intents[i]);
 
     nodes.Get(i)->AddApplication(app);
     app->SetStartTime(Seconds(0.05));
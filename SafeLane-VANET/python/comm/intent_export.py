@@ -1,25 +1,86 @@
 from __future__ import annotations
 import argparse
+import sys
 from pathlib import Path
+from typing import List, Optional
+import numpy as np
 import pandas as pd
 
+from python.utils.action_log import load_actions
+
+INTENT_FIELDS = ["t_tx","sender_id","target_lane_idx"]
+# Intent trigger: DEFER (coordination_conflict) and EXECUTE
+INTENT_ACTIONS = ("DEFER","EXECUTE")
+
 def lane_idx(lane_id: str) -> int:
     if isinstance(lane_id, str) and "_" in lane_id:
         try: return int(lane_id.rsplit("_", 1)[1])
         except: return -1
     return -1
 
+def lane_idx_series(lane_ids: pd.Series) -> pd.Series:
+    '''Vectorized lane_idx(): integer suffix after the last "_", else -1.'''
+    if isinstance(lane_ids.dtype, pd.CategoricalDtype):
+        # parse each distinct lane id once, then gather by code
+        cats = lane_idx_series(pd.Series(lane_ids.cat.categories, dtype=object)).to_numpy()
+        codes = lane_ids.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, cats[codes] if len(cats) else -1, -1), index=lane_ids.index)
+    s = lane_ids.where(lane_ids.map(type) == str)
+    idx = s.str.rsplit("_", n=1).str[1].str.extract(r"^\s*([+-]?\d+)\s*$", expand=False)
+    return pd.to_numeric(idx, errors="coerce").fillna(-1).astype(int)
+
+class IntentScheduleWriter:
+    '''
+    ns-3 intent.csv written while the closed loop runs. Rows arrive tick by
+    tick, so sorting each tick's rows by sender before writing keeps the file
+    in its final (t_tx, sender_id) order; no post-pass over actions.csv.
+    '''
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "w", encoding="utf-8")     # "\n" rows, same bytes as export_intents()
+        self._fh.write(",".join(INTENT_FIELDS) + "\n")
+        self._t: Optional[float] = None
+        self._buf: List[tuple] = []
+        self.rows = 0
+
+    def write(self, row: dict):
+        '''row: an actions.csv row (t, ego_node, action, target_lane_idx).'''
+        if row["action"] not in INTENT_ACTIONS or row["target_lane_idx"] < 0:
+            return
+        if row["t"] != self._t:
+            self._drain()
+            self._t = row["t"]
+        self._buf.append((int(row["ego_node"]), int(row["target_lane_idx"])))
+
+    def _drain(self):
+        for sender, lane in sorted(self._buf):
+            self._fh.write(f"{float(self._t)},{sender},{lane}\n")
+        self.rows += len(self._buf)
+        self._buf = []
+
+    def memory_bytes(self) -> int:
+        return sys.getsizeof(self._buf) + sum(sys.getsizeof(r) for r in self._buf)
+
+    def flush(self) -> int:
+        self._drain()
+        self._fh.flush()
+        return self._fh.tell()
+
+    def close(self):
+        self._drain()
+        self._fh.close()
+
 def export_intents(actions_csv: str, out_csv: str):
-    df = pd.read_csv(actions_csv)
+    df = load_actions(actions_csv, usecols=["t","ego_id","ego_node","target_lane","action"])
     if "target_lane" not in df.columns:
         raise ValueError("actions.csv must contain target_lane column")
 
-    df = df[df["target_lane"].notna()].copy()
-    df["target_lane_idx"] = df["target_lane"].apply(lane_idx)
+    df = df[df["target_lane"].notna()]
+    df = df.assign(target_lane_idx=lane_idx_series(df["target_lane"]))
     df = df[df["target_lane_idx"] >= 0]
 
-    # Intent trigger: DEFER (coordination_conflict) and EXECUTE
-    key = df[df["action"].isin(["DEFER","EXECUTE"])].copy()
+    key = df[df["action"].isin(INTENT_ACTIONS)].copy()
     if "ego_node" in key.columns:
         key.rename(columns={"ego_node":"sender_id"}, inplace=True)
     elif "ego_id" in key.columns:
@@ -28,8 +89,8 @@ def export_intents(actions_csv: str, out_csv: str):
     else:
         raise ValueError("actions.csv must include ego_node or ego_id")
 
-    key["t_tx"] = pd.to_numeric(key["t"], errors="coerce")
-    out = key[["t_tx","sender_id","target_lane_idx"]].dropna().sort_values(["t_tx","sender_id"])
+    key["t_tx"] = key["t"]
+    out = key[INTENT_FIELDS].dropna().sort_values(["t_tx","sender_id"])
     Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(out_csv, index=False)
     print(f"[OK] wrote intent schedule: {out_csv} rows={len(out)}")
@@ -0,0 +1,332 @@
+from __future__ import annotations
+import argparse
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, List, Mapping
+import numpy as np
+
+from python.comm.trace_cache import (CommTrace, RX_DTYPES, TX_DTYPES, _csr, empty_comm_trace,
+                                     load_comm_trace)
+
+# BeaconIntentApp payload (ns3/scratch/safelane_trace_wave.cc), packed little-endian, 53 bytes
+PAYLOAD_FIELDS = [("msg_type","<i1"), ("sender_id","<i4"), ("t_tx","<f8"), ("x","<f8"), ("y","<f8"),
+                  ("v","<f8"), ("psi","<f8"), ("lane_idx","<i4"), ("target_lane_idx","<i4")]
+# RX record: the received payload + receiver-side metadata (one packets.csv row)
+RX_RECORD = np.dtype(PAYLOAD_FIELDS + [("t_rx","<f8"), ("receiver_id","<i4"), ("dropped","<i1")])
+# TX record: the sent payload (one tx.csv row)
+TX_RECORD = np.dtype(PAYLOAD_FIELDS)
+
+MAGIC = 0x534C52494E470001          # "SLRING" + layout version
+# header words (uint64); producer- and consumer-owned counters sit on separate 64-byte lines
+H_MAGIC, H_RX_CAP, H_TX_CAP = 0, 1, 2
+H_RX_HEAD, H_RX_TAIL, H_TX_HEAD, H_TX_TAIL, H_WATERMARK, H_CLOSED = 8, 16, 24, 32, 40, 48
+HEADER_BYTES = 512
+
+@dataclass
+class CommBatch:
+    '''Newly delivered rows, as column mappings (structured ring views or trace slices).'''
+    rx: List[Mapping[str, np.ndarray]] = field(default_factory=list)
+    tx: List[Mapping[str, np.ndarray]] = field(default_factory=list)
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)      # Python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # the producer owns the segment: keep the resource tracker from unlinking it when we exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class _Ring:
+    '''One SPSC ring of fixed-size records; head/tail are monotonic record counters.'''
+    def __init__(self, buf, offset: int, cap: int, dtype: np.dtype, hdr: np.ndarray, h_head: int, h_tail: int):
+        self.slots = np.ndarray((cap,), dtype=dtype, buffer=buf, offset=offset)
+        self.cap = cap
+        self.hdr, self.h_head, self.h_tail = hdr, h_head, h_tail
+
+    def free(self) -> int:
+        return self.cap - int(self.hdr[self.h_head] - self.hdr[self.h_tail])
+
+    def write(self, rec: np.ndarray) -> int:
+        '''Producer: copies as many of `rec` as fit, then publishes them; returns the count.'''
+        n = min(len(rec), self.free())
+        if n:
+            head = int(self.hdr[self.h_head])
+            i = head % self.cap
+            m = min(n, self.cap - i)
+            self.slots[i:i + m] = rec[:m]
+            self.slots[:n - m] = rec[m:n]
+            self.hdr[self.h_head] = head + n       # publish after the records are in place
+        return n
+
+    def views(self, head: int) -> List[np.ndarray]:
+        '''Consumer: zero-copy views of [tail, head), in order (two when wrapping).'''
+        tail = int(self.hdr[self.h_tail])
+        n = head - tail
+        if n <= 0:
+            return []
+        i = tail % self.cap
+        m = min(n, self.cap - i)
+        return [self.slots[i:i + m]] + ([self.slots[:n - m]] if n > m else [])
+
+    def release(self, n: int):
+        if n:
+            self.hdr[self.h_tail] = self.hdr[self.h_tail] + np.uint64(n)
+
+class ShmCommRing:
+    '''
+    Lock-free single-producer / single-consumer shared-memory link between a
+    network simulator (producer) and the closed loop (consumer):
+      - an RX ring of RX_RECORD (one per packets.csv row) and a TX ring of
+        TX_RECORD (one per tx.csv row), records pushed in event-time order
+        (t_rx / t_tx);
+      - a watermark: the producer's simulated time, advanced after every
+        record up to it is published; `closed` once it has finished.
+    Each counter has exactly one writer (head/watermark/closed: producer,
+    tail: consumer) and is an aligned 8-byte word on its own cache line.
+    Records are stored before the head that publishes them; a native
+    producer should store head and watermark with release semantics
+    (std::atomic_ref<uint64_t>).
+    The producer creates (and finally unlinks) the segment; the consumer attaches.
+    '''
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm, self.owner = shm, owner
+        self.hdr = np.ndarray((HEADER_BYTES // 8,), dtype=np.uint64, buffer=shm.buf)
+        self.wm = np.ndarray((1,), dtype=np.float64, buffer=shm.buf, offset=H_WATERMARK * 8)
+        if int(self.hdr[H_MAGIC]) != MAGIC:
+            raise ValueError(f"shared memory {shm.name!r} is not a comm ring (or has another layout version)")
+        rx_cap, tx_cap = int(self.hdr[H_RX_CAP]), int(self.hdr[H_TX_CAP])
+        self.rx = _Ring(shm.buf, HEADER_BYTES, rx_cap, RX_RECORD, self.hdr, H_RX_HEAD, H_RX_TAIL)
+        self.tx = _Ring(shm.buf, HEADER_BYTES + rx_cap * RX_RECORD.itemsize, tx_cap, TX_RECORD,
+                        self.hdr, H_TX_HEAD, H_TX_TAIL)
+
+    @classmethod
+    def create(cls, name: str, rx_capacity: int = 1 << 16, tx_capacity: int = 1 << 14) -> "ShmCommRing":
+        size = HEADER_BYTES + rx_capacity * RX_RECORD.itemsize + tx_capacity * TX_RECORD.itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        hdr = np.ndarray((HEADER_BYTES // 8,), dtype=np.uint64, buffer=shm.buf)
+        hdr[:] = 0
+        np.ndarray((1,), dtype=np.float64, buffer=shm.buf, offset=H_WATERMARK * 8)[0] = -np.inf
+        hdr[H_RX_CAP], hdr[H_TX_CAP] = rx_capacity, tx_capacity
+        hdr[H_MAGIC] = MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, timeout_s: float = 10.0) -> "ShmCommRing":
+        '''Waits up to timeout_s for the producer to create the segment.'''
+        until = time.monotonic() + timeout_s
+        while True:
+            try:
+                return cls(_attach(name), owner=False)
+            except (FileNotFoundError, ValueError):        # not created / not initialized yet
+                if time.monotonic() > until:
+                    raise TimeoutError(f"no comm ring {name!r} after {timeout_s}s (is the producer running?)")
+                time.sleep(0.01)
+
+    # ---- producer ----
+
+    def push(self, ring: _Ring, rec: np.ndarray, timeout_s: float = 10.0):
+        '''Writes all of `rec`, waiting while the ring is full (the consumer releases each drain).'''
+        until = time.monotonic() + timeout_s
+        while len(rec):
+            n = ring.write(rec)
+            rec = rec[n:]
+            if len(rec):
+                if time.monotonic() > until:
+                    raise TimeoutError(f"comm ring {self.shm.name!r} full for {timeout_s}s "
+                                       f"(consumer gone, or one tick holds more records than the ring?)")
+                time.sleep(0.0002)
+
+    def advance(self, t: float):
+        self.wm[0] = float(t)
+
+    def close(self):
+        if self.owner:
+            self.hdr[H_CLOSED] = 1
+        self.hdr = self.wm = self.rx = self.tx = None      # views must go before the mapping
+        try:
+            self.shm.close()
+        except BufferError:
+            pass                                           # a drained batch is still referenced
+        if self.owner:
+            self.shm.unlink()
+
+    # ---- consumer ----
+
+    @property
+    def watermark(self) -> float:
+        return float(self.wm[0])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.hdr[H_CLOSED])
+
+def _upto(views: List[np.ndarray], col: str, t: float) -> List[np.ndarray]:
+    out = []
+    for v in views:
+        n = int(np.searchsorted(v[col], t, side="right"))
+        if n:
+            out.append(v[:n])
+        if n < len(v):
+            break
+    return out
+
+class RingSource:
+    '''
+    Live comm source: each drain(t) returns the records with event time <= t
+    as zero-copy views into the ring, after waiting (up to timeout_s) for the
+    producer's watermark to reach t. Views stay valid until the next drain(),
+    which releases their slots; a tick's records must therefore fit in the ring.
+    '''
+    live = True
+
+    def __init__(self, name: str, timeout_s: float = 10.0):
+        self.ring = ShmCommRing.attach(name, timeout_s=timeout_s)
+        self.timeout_s = float(timeout_s)
+        self._held = (0, 0)
+        self.records = 0
+
+    def drain(self, t: float) -> CommBatch:
+        ring = self.ring
+        ring.rx.release(self._held[0])
+        ring.tx.release(self._held[1])
+        until = time.monotonic() + self.timeout_s
+        while ring.watermark < t and not ring.closed:
+            if time.monotonic() > until:
+                raise TimeoutError(f"comm ring producer stuck at t={ring.watermark:.3f} < {t:.3f} "
+                                   f"(ring full? rx capacity {ring.rx.cap})")
+            time.sleep(0.0002)
+        # heads after the watermark: every record up to it is published
+        rx = _upto(ring.rx.views(int(ring.hdr[H_RX_HEAD])), "t_rx", t)
+        tx = _upto(ring.tx.views(int(ring.hdr[H_TX_HEAD])), "t_tx", t)
+        self._held = (sum(len(v) for v in rx), sum(len(v) for v in tx))
+        self.records += self._held[0]
+        return CommBatch(rx=rx, tx=tx)
+
+    def close(self):
+        self.ring.rx.release(self._held[0])
+        self.ring.tx.release(self._held[1])
+        self.ring.close()
+
+class FileSource:
+    '''The finished-trace counterpart of RingSource: drains a CommTrace as zero-copy column slices.'''
+    live = False
+
+    def __init__(self, trace: CommTrace, rx_pos: int = 0):
+        self.trace = trace
+        self.rx_pos = int(rx_pos)
+        self.tx_pos = int(np.searchsorted(trace.tx["t_tx"], trace.rx["t_rx"][rx_pos - 1], side="right")) if rx_pos else 0
+        self.range = (self.rx_pos, self.rx_pos)
+
+    def drain(self, t: float) -> CommBatch:
+        rx_end = int(np.searchsorted(self.trace.rx["t_rx"], t, side="right"))
+        tx_end = int(np.searchsorted(self.trace.tx["t_tx"], t, side="right"))
+        self.range = (self.rx_pos, rx_end)
+        batch = CommBatch(rx=[{c: a[self.rx_pos:rx_end] for c, a in self.trace.rx.items()}],
+                          tx=[{c: a[self.tx_pos:tx_end] for c, a in self.trace.tx.items()}])
+        self.rx_pos, self.tx_pos = rx_end, tx_end
+        return batch
+
+    def close(self):
+        pass
+
+class LiveTrace:
+    '''
+    CommTrace over the last keep_s of live records, rebuilt as they arrive,
+    so TrueKpiComputer windows work unchanged on a RingSource.
+    '''
+    def __init__(self, keep_s: float):
+        self.keep_s = float(keep_s)
+        self.snap = empty_comm_trace()
+
+    def append(self, batch: CommBatch, t: float):
+        def merge(cols, chunks, dtypes, tcol):
+            a = int(np.searchsorted(cols[tcol], t - self.keep_s, side="right"))
+            return {c: np.concatenate([cols[c][a:]] + [np.asarray(ch[c], dtype=dt) for ch in chunks])
+                    for c, dt in dtypes.items()}
+        rx = merge(self.snap.rx, batch.rx, RX_DTYPES, "t_rx")
+        tx = merge(self.snap.tx, batch.tx, TX_DTYPES, "t_tx")
+        self.snap = CommTrace(rx, tx, *_csr(rx["receiver_id"], rx["t_rx"]), *_csr(tx["sender_id"], tx["t_tx"]))
+
+    def memory_bytes(self) -> int:
+        return self.snap.memory_bytes()
+
+    @property
+    def rx(self) -> Dict[str, np.ndarray]:
+        return self.snap.rx
+
+    @property
+    def tx(self) -> Dict[str, np.ndarray]:
+        return self.snap.tx
+
+    @property
+    def rcv_ptr(self) -> np.ndarray:
+        return self.snap.rcv_ptr
+
+    def rx_window(self, receiver_id: int, t0: float, t1: float) -> np.ndarray:
+        return self.snap.rx_window(receiver_id, t0, t1)
+
+    def tx_window(self, sender_id: int, t0: float, t1: float) -> np.ndarray:
+        return self.snap.tx_window(sender_id, t0, t1)
+
+def _records(cols: Mapping[str, np.ndarray], dtype: np.dtype) -> np.ndarray:
+    rec = np.zeros(len(cols["t_tx"]), dtype=dtype)
+    for c in dtype.names:
+        if c in cols:                           # tx.csv has no kinematics: those payload fields stay 0
+            rec[c] = cols[c]
+    return rec
+
+def produce_from_trace(name: str, trace: CommTrace, dt: float = 0.1, speed: float = 0.0,
+                       rx_capacity: int = 1 << 16, tx_capacity: int = 1 << 14, timeout_s: float = 10.0):
+    '''
+    Stand-in producer: replays a finished trace into a new ring tick by tick
+    (dt of simulated time; speed = sim seconds per wall second, 0 = unpaced).
+    '''
+    rx, tx = _records(trace.rx, RX_RECORD), _records(trace.tx, TX_RECORD)
+    ring = ShmCommRing.create(name, rx_capacity=rx_capacity, tx_capacity=tx_capacity)
+    try:
+        t_end = max([0.0] + [float(a[-1]) for a in (rx["t_rx"], tx["t_tx"]) if len(a)])
+        i = j = 0
+        t = 0.0
+        t0 = time.monotonic()
+        while True:
+            if speed > 0:
+                time.sleep(max(0.0, t0 + t / speed - time.monotonic()))
+            j1 = int(np.searchsorted(tx["t_tx"], t, side="right"))
+            i1 = int(np.searchsorted(rx["t_rx"], t, side="right"))
+            ring.push(ring.tx, tx[j:j1], timeout_s)
+            ring.push(ring.rx, rx[i:i1], timeout_s)
+            ring.advance(t)
+            i, j = i1, j1
+            if t > t_end:
+                break
+            t = round(t + dt, 9)
+        # let the consumer drain the tail before the segment goes away
+        until = time.monotonic() + timeout_s
+        while (ring.rx.free() < ring.rx.cap or ring.tx.free() < ring.tx.cap) and time.monotonic() < until:
+            time.sleep(0.01)
+    finally:
+        ring.close()
+    return len(rx), len(tx)
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay packets.csv/tx.csv into a shared-memory comm ring "
+                                             "(stand-in for a live network simulator)")
+    ap.add_argument("--name", default="safelane_comm")
+    ap.add_argument("--packets_csv", default="out/ns3/packets.csv")
+    ap.add_argument("--tx_csv", default="out/ns3/tx.csv")
+    ap.add_argument("--dt", type=float, default=0.1, help="simulated seconds per published watermark step")
+    ap.add_argument("--speed", type=float, default=0.0, help="sim seconds per wall second (0: unpaced)")
+    ap.add_argument("--rx_capacity", type=int, default=1 << 16)
+    ap.add_argument("--tx_capacity", type=int, default=1 << 14)
+    ap.add_argument("--timeout_s", type=float, default=10.0)
+    args = ap.parse_args()
+    trace = load_comm_trace(args.packets_csv, args.tx_csv)
+    n_rx, n_tx = produce_from_trace(args.name, trace, dt=args.dt, speed=args.speed, rx_capacity=args.rx_capacity,
+                                    tx_capacity=args.tx_capacity, timeout_s=args.timeout_s)
+    print(f"[OK] comm ring {args.name}: {n_rx} rx / {n_tx} tx records published")
+
+if __name__ == "__main__":
+    main()
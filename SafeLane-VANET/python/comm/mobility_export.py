@@ -3,6 +3,10 @@ import argparse
 from pathlib import Path
 import pandas as pd
 
+from python.sumo.traci_adapter import SumoAdapter, SUMO_BACKENDS
+from python.sumo.synthetic import make_synthetic
+from python.utils.config import load_yaml
+
 def lane_index_from_lane_id(lane_id: str) -> int:
     if isinstance(lane_id, str) and "_" in lane_id:
         try:
@@ -11,7 +15,8 @@ def lane_index_from_lane_id(lane_id: str) -> int:
             return -1
     return -1
 
-def export_from_sumo(sumo_cfg: str, sumo_bin: str, dt: float, sim_time: float, out_dir: str, n_nodes: int = 0):
+def export_from_sumo(sumo_cfg: str, sumo_bin: str, dt: float, sim_time: float, out_dir: str, n_nodes: int = 0,
+                     backend: str = "traci", cfg: dict | None = None):
     '''
     Runs SUMO and exports per-step mobility trace:
       mobility_ns3.csv: t,node_id,x,y,v,psi,lane_idx
@@ -19,17 +24,17 @@ def export_from_sumo(sumo_cfg: str, sumo_bin: str, dt: float, sim_time: float, o
 
     This expects vehicle IDs include an integer suffix (e.g., AV0, car12). If not,
     you should provide your own mapping in this script.
+    backend "synthetic" replaces SUMO by the NumPy traffic kernel configured in
+    cfg["sim"]["synthetic"] (same population as the closed loop with that cfg).
     '''
-    try:
-        import traci
-    except Exception as e:
-        raise RuntimeError("TraCI not available. Install SUMO and ensure python can import traci.") from e
-
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    cmd = [sumo_bin, "-c", sumo_cfg, "--step-length", str(dt), "--no-warnings", "true"]
-    traci.start(cmd)
+    if backend == "synthetic":
+        sumo = make_synthetic({**cfg, "sim": {**cfg["sim"], "dt": dt}})
+    else:
+        sumo = SumoAdapter(sumo_bin, sumo_cfg, dt, backend=backend)
+    sumo.start()
 
     rows = []
     seen = {}
@@ -50,18 +55,14 @@ def export_from_sumo(sumo_cfg: str, sumo_bin: str, dt: float, sim_time: float, o
     steps = int(sim_time / dt)
     for k in range(steps):
         t = k * dt
-        traci.simulationStep()
-        vids = traci.vehicle.getIDList()
-        for vid in vids:
-            x, y = traci.vehicle.getPosition(vid)
-            v = float(traci.vehicle.getSpeed(vid))
-            psi = float(traci.vehicle.getAngle(vid)) * 3.141592653589793 / 180.0
-            lane_id = str(traci.vehicle.getLaneID(vid))
-            lane_idx = lane_index_from_lane_id(lane_id)
+        sumo.step()
+        for vid in sumo.get_vehicle_ids():
+            s = sumo.get_state(vid)
+            lane_idx = lane_index_from_lane_id(s.lane_id)
             node_id = veh_to_node(vid)
-            rows.append([t, node_id, x, y, v, psi, lane_idx, vid, lane_id])
+            rows.append([t, node_id, s.x, s.y, s.v, s.psi, lane_idx, vid, s.lane_id])
 
-    traci.close()
+    sumo.close()
 
     df = pd.DataFrame(rows, columns=["t","node_id","x","y","v","psi","lane_idx","veh_id","lane_id"])
     df.sort_values(["t","node_id"], inplace=True)
@@ -80,13 +81,21 @@ def export_from_sumo(sumo_cfg: str, sumo_bin: str, dt: float, sim_time: float, o
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--sumo_cfg", required=True, help="SUMO .sumocfg path")
+    ap.add_argument("--sumo_cfg", default="", help="SUMO .sumocfg path")
     ap.add_argument("--sumo_bin", default="sumo", help="SUMO binary (sumo or sumo-gui)")
     ap.add_argument("--dt", type=float, default=0.1)
     ap.add_argument("--sim_time", type=float, default=120.0)
     ap.add_argument("--out_dir", default="out/ns3")
+    ap.add_argument("--backend", default="traci", choices=SUMO_BACKENDS + ("synthetic",),
+                    help="traci (socket), libsumo (in-process) or synthetic (NumPy traffic, needs --cfg)")
+    ap.add_argument("--cfg", default=None, help="experiment config with sim.synthetic (synthetic backend)")
     args = ap.parse_args()
-    export_from_sumo(args.sumo_cfg, args.sumo_bin, args.dt, args.sim_time, args.out_dir)
+    if args.backend == "synthetic" and not args.cfg:
+        ap.error("--backend synthetic needs --cfg")
+    if args.backend != "synthetic" and not args.sumo_cfg:
+        ap.error("--sumo_cfg is required")
+    cfg = load_yaml(args.cfg) if args.cfg else None
+    export_from_sumo(args.sumo_cfg, args.sumo_bin, args.dt, args.sim_time, args.out_dir, backend=args.backend, cfg=cfg)
 
 if __name__ == "__main__":
     main()
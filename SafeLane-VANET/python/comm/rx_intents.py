@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from typing import Dict, Set
 
+from python.utils.memory import dict_bytes
+
 @dataclass
 class IntentMsg:
     t_rx: float
@@ -14,10 +16,14 @@ class RxIntentRegistry:
     def update(self, sender: int, t_rx: float, target_lane_idx: int):
         self.last[int(sender)] = IntentMsg(float(t_rx), int(target_lane_idx))
 
-    def prune(self, now: float):
+    def prune(self, now: float) -> int:
         dead = [s for s, it in self.last.items() if (now - it.t_rx) > self.ttl]
         for s in dead:
             del self.last[s]
+        return len(dead)
+
+    def memory_bytes(self) -> int:
+        return dict_bytes(self.last)
 
     def has_conflict(self, now: float, neighbor_nodes: Set[int], target_lane_idx: int, ego_node: int) -> bool:
         self.prune(now)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from python.utils.schemas import read_artifact
+
+# Bump when the on-disk layout or the validation rules change.
+CACHE_VERSION = 1
+
+RX_DTYPES = {
+    "t_tx": "f8", "t_rx": "f8", "sender_id": "i4", "receiver_id": "i4", "msg_type": "i1", "dropped": "i1",
+    "x": "f8", "y": "f8", "v": "f8", "psi": "f8", "lane_idx": "i4", "target_lane_idx": "i4",
+}
+TX_DTYPES = {
+    "t_tx": "f8", "sender_id": "i4", "msg_type": "i1", "lane_idx": "i4", "target_lane_idx": "i4",
+}
+# rows missing any of these are malformed and dropped
+RX_REQUIRED = ["t_rx","sender_id","receiver_id","msg_type","x","y","v","psi","lane_idx","target_lane_idx"]
+TX_REQUIRED = ["t_tx","sender_id","msg_type"]
+
+def _content_key(*paths) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{CACHE_VERSION}".encode())
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _clean(df: pd.DataFrame, dtypes: Dict[str, str], required, ids, sort_col: str) -> Dict[str, np.ndarray]:
+    if "dropped" in dtypes and "dropped" not in df.columns:
+        df["dropped"] = 0
+    for c in dtypes:
+        df[c] = pd.to_numeric(df[c], errors="coerce") if c in df.columns else np.nan
+    if "dropped" in dtypes:
+        df["dropped"] = df["dropped"].fillna(1)     # unparsable flag: never treat as delivered
+    df = df.dropna(subset=required)
+    for c in ids:
+        df = df[df[c] >= 0]
+    df = df.sort_values(sort_col, kind="stable")
+    out = {}
+    for c, dt in dtypes.items():
+        col = df[c]
+        if dt.startswith("i"):
+            col = col.fillna(-1)
+        out[c] = col.to_numpy(dtype=dt)
+    return out
+
+def _csr(keys: np.ndarray, t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Offset index over non-negative ids: rows of id i are perm[ptr[i]:ptr[i+1]], time-sorted in t_sorted.'''
+    perm = np.argsort(keys, kind="stable").astype(np.int64)      # rows already time-sorted -> stays sorted per id
+    n = int(keys.max()) + 1 if keys.size else 0
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=ptr[1:])
+    return ptr, perm, t[perm]
+
+@dataclass
+class CommTrace:
+    '''
+    Validated, t-sorted ns-3 logs as (memory-mapped) column arrays.
+      rx[col] sorted by t_rx, tx[col] sorted by t_tx
+      rcv_ptr/rcv_perm/rcv_t: per-receiver offset index into rx
+      snd_ptr/snd_perm/snd_t: per-sender offset index into tx
+    '''
+    rx: Dict[str, np.ndarray]
+    tx: Dict[str, np.ndarray]
+    rcv_ptr: np.ndarray
+    rcv_perm: np.ndarray
+    rcv_t: np.ndarray
+    snd_ptr: np.ndarray
+    snd_perm: np.ndarray
+    snd_t: np.ndarray
+    path: Optional[Path] = None
+
+    @staticmethod
+    def _window(ptr, perm, ts, key: int, t0: float, t1: float) -> np.ndarray:
+        '''Row ids of `key` with t0 < t <= t1.'''
+        if key < 0 or key + 1 >= len(ptr):
+            return perm[:0]
+        a, b = int(ptr[key]), int(ptr[key + 1])
+        seg = ts[a:b]
+        i0 = a + int(np.searchsorted(seg, t0, side="right"))
+        i1 = a + int(np.searchsorted(seg, t1, side="right"))
+        return perm[i0:i1]
+
+    def memory_bytes(self) -> int:
+        '''Bytes of all columns and indexes (memory-mapped ones are file-backed pages the OS can drop).'''
+        arrays = list(self.rx.values()) + list(self.tx.values()) + [getattr(self, n) for n in _INDEX]
+        return int(sum(a.nbytes for a in arrays))
+
+    def rx_window(self, receiver_id: int, t0: float, t1: float) -> np.ndarray:
+        return self._window(self.rcv_ptr, self.rcv_perm, self.rcv_t, int(receiver_id), t0, t1)
+
+    def tx_window(self, sender_id: int, t0: float, t1: float) -> np.ndarray:
+        return self._window(self.snd_ptr, self.snd_perm, self.snd_t, int(sender_id), t0, t1)
+
+def _from_frames(rx_df: pd.DataFrame, tx_df: pd.DataFrame) -> CommTrace:
+    rx = _clean(rx_df, RX_DTYPES, RX_REQUIRED, ["sender_id","receiver_id"], "t_rx")
+    tx = _clean(tx_df, TX_DTYPES, TX_REQUIRED, ["sender_id"], "t_tx")
+    rcv = _csr(rx["receiver_id"], rx["t_rx"])
+    snd = _csr(tx["sender_id"], tx["t_tx"])
+    return CommTrace(rx, tx, *rcv, *snd)
+
+def _build(packets_csv, tx_csv) -> CommTrace:
+    return _from_frames(read_artifact(packets_csv, "packets", usecols=RX_DTYPES),
+                        read_artifact(tx_csv, "tx", usecols=TX_DTYPES))
+
+def empty_comm_trace() -> CommTrace:
+    '''No ns-3 logs yet (first SUMO -> ns-3 iteration): every link reads as silent.'''
+    return _from_frames(pd.DataFrame(columns=list(RX_DTYPES)), pd.DataFrame(columns=list(TX_DTYPES)))
+
+_INDEX = ["rcv_ptr","rcv_perm","rcv_t","snd_ptr","snd_perm","snd_t"]
+
+def _save(tr: CommTrace, out: Path):
+    '''Writes into a private temp dir, then renames: readers never see a partial cache.'''
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.parent / f"{out.name}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for c, a in tr.rx.items():
+        np.save(tmp / f"rx_{c}.npy", a)
+    for c, a in tr.tx.items():
+        np.save(tmp / f"tx_{c}.npy", a)
+    for name in _INDEX:
+        np.save(tmp / f"{name}.npy", getattr(tr, name))
+    try:
+        os.replace(tmp, out)
+    except OSError:
+        # another run published the same key first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _load(d: Path) -> CommTrace:
+    def ld(name):
+        try:
+            return np.load(d / f"{name}.npy", mmap_mode="r")
+        except ValueError:
+            # zero-length arrays cannot be memory-mapped
+            return np.load(d / f"{name}.npy")
+    rx = {c: ld(f"rx_{c}") for c in RX_DTYPES}
+    tx = {c: ld(f"tx_{c}") for c in TX_DTYPES}
+    return CommTrace(rx, tx, *(ld(n) for n in _INDEX), path=d)
+
+def load_comm_trace(packets_csv: str, tx_csv: str, cache: bool = True, cache_dir: Optional[str] = None) -> CommTrace:
+    '''
+    Loads packets.csv/tx.csv once into columnar .npy files under
+    <packets_csv dir>/.trace_cache/<content hash>/ and memory-maps them, so
+    variants and concurrent runs share one parse and the OS page cache.
+    cache=False parses in memory without touching disk.
+    '''
+    if not cache:
+        return _build(packets_csv, tx_csv)
+    root = Path(cache_dir) if cache_dir else Path(packets_csv).parent / ".trace_cache"
+    d = root / _content_key(packets_csv, tx_csv)
+    if not d.is_dir():
+        _save(_build(packets_csv, tx_csv), d)
+    return _load(d)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--packets_csv", default="out/ns3/packets.csv")
+    ap.add_argument("--tx_csv", default="out/ns3/tx.csv")
+    ap.add_argument("--cache_dir", default=None, help="default: <packets_csv dir>/.trace_cache")
+    args = ap.parse_args()
+    tr = load_comm_trace(args.packets_csv, args.tx_csv, cache_dir=args.cache_dir)
+    print(f"[OK] trace cache: {tr.path} (rx={len(tr.rx['t_rx'])}, tx={len(tr.tx['t_tx'])})")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-import pandas as pd
 import numpy as np
 from dataclasses import dataclass
+from typing import Optional
+
+from python.comm.trace_cache import CommTrace, load_comm_trace
 
 @dataclass
 class RxKpis:
@@ -13,51 +15,42 @@ class TrueKpiComputer:
     True PDR = delivered / attempted, using ns-3 logs:
       - tx.csv: attempted
       - packets.csv: delivered (per receiver)
+    Windows are cut from the per-receiver / per-sender indexes of the shared
+    trace cache; pass `trace` to reuse an already loaded CommTrace (or a
+    live_ring.LiveTrace).
     '''
-    def __init__(self, packets_csv: str, tx_csv: str, window_s: float = 1.0, msg_type_filter=(1,2)):
-        self.rx = pd.read_csv(packets_csv)
-        self.tx = pd.read_csv(tx_csv)
+    def __init__(self, packets_csv: str, tx_csv: str, window_s: float = 1.0, msg_type_filter=(1,2),
+                 trace: Optional[CommTrace] = None):
+        self.trace = trace if trace is not None else load_comm_trace(packets_csv, tx_csv)
         self.window_s = float(window_s)
-        self.msg_types = set(msg_type_filter)
-
-        self.rx = self.rx[self.rx["msg_type"].isin(self.msg_types)].copy()
-        self.tx = self.tx[self.tx["msg_type"].isin(self.msg_types)].copy()
-
-        self.rx["t_rx"] = pd.to_numeric(self.rx["t_rx"], errors="coerce")
-        self.rx["t_tx"] = pd.to_numeric(self.rx["t_tx"], errors="coerce")
-        self.tx["t_tx"] = pd.to_numeric(self.tx["t_tx"], errors="coerce")
-
-        self.rx["lat"] = self.rx["t_rx"] - self.rx["t_tx"]
+        self.msg_types = np.array(sorted(set(msg_type_filter)), dtype=np.int8)
 
-        self.rx.sort_values("t_rx", inplace=True)
-        self.tx.sort_values("t_tx", inplace=True)
-
-        self._rx_by_rcv = {int(r): g for r, g in self.rx.groupby("receiver_id")}
-        self._tx_by_snd = {int(s): g for s, g in self.tx.groupby("sender_id")}
+    def memory_bytes(self) -> int:
+        return self.trace.memory_bytes()
 
     def get(self, receiver_id: int, t_end: float) -> RxKpis:
         r = int(receiver_id)
         t0 = float(t_end) - self.window_s
-
-        if r not in self._rx_by_rcv:
+        # columns read per call: a LiveTrace replaces them as records arrive
+        rx = self.trace.rx
+        tx_type = self.trace.tx["msg_type"]
+
+        rows = self.trace.rx_window(r, t0, float(t_end))
+        rows = rows[np.isin(rx["msg_type"][rows], self.msg_types)]
+        delivered = len(rows)
+        if delivered == 0:
             return RxKpis(pdr=0.0, lat_p95=0.0, cbr=0.0)
 
-        rxw = self._rx_by_rcv[r]
-        rxw = rxw[(rxw["t_rx"] > t0) & (rxw["t_rx"] <= t_end)]
-        delivered = len(rxw)
-
         # conservative approximation: attempted from senders seen delivering in window
-        senders = rxw["sender_id"].dropna().unique().astype(int).tolist()
         attempted = 0
-        for s in senders:
-            if s in self._tx_by_snd:
-                txs = self._tx_by_snd[s]
-                txw = txs[(txs["t_tx"] > t0) & (txs["t_tx"] <= t_end)]
-                attempted += len(txw)
+        for s in np.unique(rx["sender_id"][rows]).tolist():
+            txw = self.trace.tx_window(s, t0, float(t_end))
+            attempted += int(np.isin(tx_type[txw], self.msg_types).sum())
 
         pdr = (delivered / attempted) if attempted > 0 else 0.0
 
-        lat = rxw["lat"].replace([np.inf, -np.inf], np.nan).dropna().to_numpy()
+        lat = rx["t_rx"][rows] - rx["t_tx"][rows]
+        lat = lat[np.isfinite(lat)]
         lat_p95 = float(np.percentile(lat, 95)) if lat.size else 0.0
 
         return RxKpis(pdr=float(max(0.0, min(1.0, pdr))), lat_p95=lat_p95, cbr=0.0)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+import json
+
+from python.core.safemobil_comm import Decision
+
+@dataclass
+class CachedDecision:
+    t: float
+    lane_id: str
+    v: float
+    in_cooldown: bool
+    cand_lane_idx: FrozenSet[int]
+    decision: Decision
+    row: dict            # action-log row of the evaluation (t is re-stamped on reuse)
+
+class DecisionCache:
+    '''
+    Dirty-flag tracking for lazy AV decision re-evaluation.
+    An AV is re-evaluated only when something its decision depends on changed:
+      - no cached decision yet, or the cached one was EXECUTE
+      - the ego changed lane
+      - the cooldown window opened/closed (inside it decide() is DEFER/"cooldown" whatever the inputs)
+      - a beacon from a candidate-lane neighbor arrived after the cached evaluation
+      - speed moved by more than dv_thr, or the cached decision is older than max_age_s
+    Clean AVs reuse their cached decision; evaluated/skipped counts quantify the savings.
+    '''
+    def __init__(self, cooldown_s: float, dv_thr: float = 0.5, max_age_s: float = 1.0):
+        self.cooldown_s = float(cooldown_s)
+        self.dv_thr = float(dv_thr)
+        self.max_age_s = float(max_age_s)
+        self.entries: Dict[str, CachedDecision] = {}
+        self.evaluated = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    def in_cooldown(self, now: float, last_exec_t: float) -> bool:
+        return (now - last_exec_t) < self.cooldown_s
+
+    def dirty_reason(self, ego_id: str, now: float, lane_id: str, v: float,
+                     last_exec_t: float, nb=None) -> Optional[str]:
+        c = self.entries.get(ego_id)
+        if c is None:
+            return "new"
+        if c.decision.action == "EXECUTE":
+            return "executed"
+        if lane_id != c.lane_id:
+            return "lane_change"
+        in_cd = self.in_cooldown(now, last_exec_t)
+        if in_cd != c.in_cooldown:
+            return "cooldown_expiry"
+        if in_cd:
+            return None
+        if (now - c.t) > self.max_age_s:
+            return "max_age"
+        if abs(v - c.v) > self.dv_thr:
+            return "state_delta"
+        if nb is not None and nb.heard_since(c.cand_lane_idx, c.t):
+            return "beacon"
+        return None
+
+    def lookup(self, ego_id: str, reason: Optional[str]) -> Optional[CachedDecision]:
+        '''Book-keeping for one AV visit: returns the reusable entry when clean, else None.'''
+        if reason is None:
+            self.skipped += 1
+            return self.entries[ego_id]
+        self.evaluated += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return None
+
+    def store(self, ego_id: str, now: float, lane_id: str, v: float, last_exec_t: float,
+              cand_lane_idx, decision: Decision, row: dict):
+        self.entries[ego_id] = CachedDecision(
+            t=float(now), lane_id=lane_id, v=float(v),
+            in_cooldown=self.in_cooldown(now, last_exec_t),
+            cand_lane_idx=frozenset(int(i) for i in cand_lane_idx),
+            decision=decision, row=row)
+
+    def stats(self) -> dict:
+        n = self.evaluated + self.skipped
+        return {
+            "evaluated": int(self.evaluated),
+            "skipped": int(self.skipped),
+            "skip_ratio": self.skipped / n if n else 0.0,
+            "dirty_reasons": dict(sorted(self.reasons.items())),
+        }
+
+    def write_json(self, path):
+        write_stats_json(path, [self.stats()])
+
+def write_stats_json(path, parts):
+    '''Writes DecisionCache stats, summed over shards (e.g. DecisionPool workers).'''
+    parts = [p for p in parts if p]
+    evaluated = sum(p["evaluated"] for p in parts)
+    skipped = sum(p["skipped"] for p in parts)
+    reasons = {}
+    for p in parts:
+        for r, c in p["dirty_reasons"].items():
+            reasons[r] = reasons.get(r, 0) + c
+    n = evaluated + skipped
+    stats = {
+        "evaluated": int(evaluated),
+        "skipped": int(skipped),
+        "skip_ratio": skipped / n if n else 0.0,
+        "dirty_reasons": dict(sorted(reasons.items())),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
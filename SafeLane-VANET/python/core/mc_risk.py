@@ -0,0 +1,104 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+import math
+import numpy as np
+
+from python.core.trajguard_ekf import Track
+
+@dataclass
+class McRiskOut:
+    p_coll: float
+    min_ttc: float                 # TTC / TH / gap at the configured (lower) quantile over hypotheses
+    min_th: float
+    gap_min: float
+    ttc_q: Dict[float, float]      # per-hypothesis min TTC quantiles (report_q)
+
+class McRiskEstimator:
+    '''
+    Multi-hypothesis risk of a lead track: n_samples trajectories rolled out
+    together as one (horizon x n_samples) float32 tensor on the dt_pred grid.
+    Each hypothesis perturbs the track's
+      - speed (sigma_v) and acceleration (sigma_a),
+      - heading (sigma_psi),
+      - and, with probability p_lane_change, moves it one lane sideways
+        over lc_duration_s, starting anywhere in the horizon.
+    The sigmas scale with Track.spread (set by step_track from beacon age and
+    PDR), so stale or lossy neighbors get wider predictions.
+    Per hypothesis, TTC / TH / gap follow risk_vs_ego(), counted only while
+    the lead is still in its lane (|lateral deviation| < lane_width / 2); a
+    hypothesis is a collision when, with the ego holding its speed, the gap
+    along the ego heading drops below coll_gap_m while in lane. Outputs:
+    p_coll = share of colliding hypotheses, and min TTC / TH / gap at
+    `quantile` (the lower tail, as the deterministic gate reads minima).
+    The standard-normal draws are fixed at construction (seeded): every call
+    reuses them, so decisions are reproducible across workers and resumes and
+    no random numbers are drawn per decision.
+    '''
+    def __init__(self, horizon_s: float = 2.5, dt_pred: float = 0.1, n_samples: int = 256,
+                 sigma_v: float = 0.5, sigma_a: float = 0.5, sigma_psi: float = 0.02,
+                 p_lane_change: float = 0.1, lane_width: float = 3.2, lc_duration_s: float = 3.0,
+                 coll_gap_m: float = 5.0, quantile: float = 0.05,
+                 report_q: Sequence[float] = (0.05, 0.5, 0.95), seed: int = 0):
+        self.dt_pred = float(dt_pred)
+        steps = max(1, int(float(horizon_s) / self.dt_pred))
+        # horizon-major layout: (H, S) tensors, min/any over the horizon reduce contiguous rows
+        self.th = (np.arange(1, steps + 1) * self.dt_pred)[:, None].astype(np.float32)     # (H, 1)
+        self.n = int(n_samples)
+        self.sigma_v, self.sigma_a, self.sigma_psi = float(sigma_v), float(sigma_a), float(sigma_psi)
+        self.half_w = 0.5 * float(lane_width)
+        self.coll_gap = float(coll_gap_m)
+        self.quantile = float(quantile)
+        self.report_q = tuple(float(q) for q in report_q)
+
+        rng = np.random.default_rng(seed)
+        self.z_v = rng.standard_normal(self.n)
+        self.z_a = rng.standard_normal(self.n)
+        self.z_psi = rng.standard_normal(self.n)
+        lc = rng.random(self.n) < float(p_lane_change)
+        side = np.where(rng.random(self.n) < 0.5, -1.0, 1.0)
+        t0 = rng.uniform(0.0, steps * self.dt_pred, self.n)
+        # lateral offset of each hypothesis over the horizon (0 for lane keepers)
+        self.lat = (np.where(lc, side * float(lane_width), 0.0)
+                    * np.clip((self.th - t0) / max(1e-6, float(lc_duration_s)), 0.0, 1.0)).astype(np.float32)
+
+    def _q(self, x_sorted: np.ndarray, q: float, inf_as: float = 0.0) -> float:
+        '''Lower order statistic (no interpolation: x may hold inf); inf -> 0.0 as in risk_vs_ego().'''
+        v = float(x_sorted[int(q * (len(x_sorted) - 1))])
+        return inf_as if math.isinf(v) else v
+
+    def evaluate(self, tr: Track, ego_xyvpsi: Tuple[float, float, float, float]) -> McRiskOut:
+        ex, ey, ev, epsi = map(float, ego_xyvpsi)
+        sp = float(getattr(tr, "spread", 1.0))
+        f4 = np.float32
+
+        # per-hypothesis speed / acceleration / heading (S,); closed-form kinematics with a stop at v = 0
+        v0 = np.maximum(0.0, tr.v + sp * self.sigma_v * self.z_v).astype(f4)
+        acc = (sp * self.sigma_a * self.z_a).astype(f4)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_stop = np.where(acc < 0, -v0 / acc, np.inf).astype(f4)
+        dpsi = sp * self.sigma_psi * self.z_psi
+        rel = tr.psi + dpsi - epsi
+        c, sn = np.cos(rel).astype(f4), np.sin(rel).astype(f4)     # hypothesis heading in the ego frame
+
+        te = np.minimum(self.th, t_stop)                                # (H, S)
+        v = v0 + acc * te
+        s = te * (v0 + 0.5 * acc * te)                                  # distance along the hypothesis heading
+        # gap along the ego heading, without forming x/y
+        g0 = f4(math.cos(epsi) * (tr.x - ex) + math.sin(epsi) * (tr.y - ey))
+        gap = g0 + c * s - sn * self.lat
+        in_lane = np.abs(s * np.sin(dpsi).astype(f4) + self.lat * np.cos(dpsi).astype(f4)) < self.half_w
+        closing = f4(ev) - v * c
+        ahead = in_lane & (gap > 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ttc = np.sort(np.where(ahead & (closing > 1e-3), gap / closing, np.inf).min(axis=0))
+        th = np.sort(np.where(ahead, gap, np.inf).min(axis=0)) / max(1e-3, ev)
+        gmin = np.sort(np.where(in_lane, gap, np.inf).min(axis=0))
+        coll = (in_lane & (gap - f4(ev) * self.th < self.coll_gap)).any(axis=0)
+
+        return McRiskOut(p_coll=float(np.count_nonzero(coll)) / self.n,
+                         min_ttc=self._q(ttc, self.quantile),
+                         min_th=self._q(th, self.quantile),
+                         gap_min=self._q(gmin, self.quantile, inf_as=float("inf")),     # out of lane: no gap
+                         ttc_q={q: self._q(ttc, q) for q in self.report_q})
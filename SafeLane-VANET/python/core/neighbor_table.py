@@ -0,0 +1,58 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Tuple
+
+from python.utils.memory import dict_bytes
+
+@dataclass
+class NeighborState:
+    x: float
+    y: float
+    v: float
+    psi: float
+    lane_idx: int
+    msg_type: int
+    target_lane_idx: int
+    rx_t: float
+    age: float = 0.0
+
+class NeighborTable:
+    '''
+    Per-receiver table of the latest beacon/intent payload heard from each sender.
+    Ages are refreshed against the current time before the table is consumed.
+    '''
+    def __init__(self):
+        self.entries: Dict[int, NeighborState] = {}
+        self.lane_rx_t: Dict[int, float] = {}   # lane_idx -> latest rx time heard on that lane
+
+    def update(self, sender_node: int, rx_t: float, x: float, y: float, v: float, psi: float,
+               lane_idx: int, msg_type: int, target_lane_idx: int):
+        self.entries[int(sender_node)] = NeighborState(
+            x=float(x), y=float(y), v=float(v), psi=float(psi),
+            lane_idx=int(lane_idx), msg_type=int(msg_type),
+            target_lane_idx=int(target_lane_idx), rx_t=float(rx_t))
+        self.lane_rx_t[int(lane_idx)] = float(rx_t)
+
+    def heard_since(self, lane_idxs: Iterable[int], t: float) -> bool:
+        '''True if any sender on one of lane_idxs was heard after time t.'''
+        return any(self.lane_rx_t.get(i, -1e9) > t for i in lane_idxs)
+
+    def refresh_ages(self, now: float):
+        for st in self.entries.values():
+            st.age = max(0.0, float(now) - st.rx_t)
+
+    def memory_bytes(self) -> int:
+        return dict_bytes(self.entries) + dict_bytes(self.lane_rx_t)
+
+    def evict(self, before_t: float) -> int:
+        '''Forgets senders last heard before before_t; returns how many.'''
+        old = [s for s, st in self.entries.items() if st.rx_t < before_t]
+        for s in old:
+            del self.entries[s]
+        return len(old)
+
+    def items(self) -> Iterator[Tuple[int, NeighborState]]:
+        return iter(self.entries.items())
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -12,6 +12,7 @@ class PredRisk:
     min_ttc: float
     min_th: float
     gap_min: float
+    p_coll: float = 0.0     # collision probability (Monte Carlo risk mode)
 
 @dataclass
 class Decision:
@@ -25,6 +26,9 @@ class SafeMOBILComm:
     - Safety gate uses min TTC / TH from prediction or instantaneous proxy.
     - Coordination gate uses LCI conflicts within a listen window.
     - Adaptation: if PDR low / latency high -> require stricter TTC/TH.
+    - Probabilistic gate (Monte Carlo risk): cancel when p_coll > p_coll_max,
+      divided by strict_factor when the link is degraded; p_coll_max >= 1.0
+      turns the gate off on any link.
     '''
     def __init__(self,
                  ttc_min: float = 2.0,
@@ -33,7 +37,9 @@ class SafeMOBILComm:
                  cooldown_s: float = 2.0,
                  pdr_min: float = 0.85,
                  lat_max: float = 0.15,
-                 strict_factor: float = 1.35):
+                 strict_factor: float = 1.35,
+                 coord_window: float = 0.4,
+                 p_coll_max: float = 1.0):
         self.ttc_min = float(ttc_min)
         self.th_min = float(th_min)
         self.gap_min = float(gap_min)
@@ -41,6 +47,8 @@ class SafeMOBILComm:
         self.pdr_min = float(pdr_min)
         self.lat_max = float(lat_max)
         self.strict_factor = float(strict_factor)
+        self.coord_window = float(coord_window)
+        self.p_coll_max = float(p_coll_max)
 
     def decide(self, now: float, last_exec_t: float, risk: PredRisk, comm: CommKpis, coord_ok: bool) -> Decision:
         # cooldown
@@ -51,15 +59,18 @@ class SafeMOBILComm:
         ttc_thr = self.ttc_min
         th_thr  = self.th_min
         gap_thr = self.gap_min
+        p_thr   = self.p_coll_max
 
         degraded = (comm.pdr < self.pdr_min) or (comm.lat_p95 > self.lat_max)
         if degraded:
             ttc_thr *= self.strict_factor
             th_thr  *= self.strict_factor
             gap_thr *= self.strict_factor
+            p_thr   /= self.strict_factor
 
         # safety gate
-        if risk.gap_min < gap_thr or risk.min_ttc < ttc_thr or risk.min_th < th_thr:
+        p_unsafe = self.p_coll_max < 1.0 and risk.p_coll > p_thr
+        if risk.gap_min < gap_thr or risk.min_ttc < ttc_thr or risk.min_th < th_thr or p_unsafe:
             return Decision("CANCEL", "safety_gate")
 
         # coordination gate
@@ -1,8 +1,10 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import math
 
+from python.utils.memory import dict_bytes
+
 @dataclass
 class Track:
     x: float
@@ -10,6 +12,7 @@ class Track:
     v: float
     psi: float
     t: float
+    spread: float = 1.0     # prediction uncertainty scale (beacon age, PDR); used by McRiskEstimator
 
 @dataclass
 class TrajPoint:
@@ -32,9 +35,13 @@ class TrajGuardEKF:
       x <- alpha*x_meas + (1-alpha)*x_pred
     alpha increases with PDR and decreases with age.
     '''
-    def __init__(self, horizon_s: float = 2.0, dt_pred: float = 0.1):
+    def __init__(self, horizon_s: float = 2.0, dt_pred: float = 0.1, adaptive: bool = False,
+                 coarse_dt: float = 0.5, fine_window_s: float = 1.0):
         self.horizon_s = float(horizon_s)
         self.dt_pred = float(dt_pred)
+        self.adaptive = bool(adaptive)
+        self.coarse_steps = max(1, int(round(float(coarse_dt) / self.dt_pred)))
+        self.fine_steps = max(1, int(round(float(fine_window_s) / self.dt_pred)))
         self.tracks: Dict[str, Track] = {}
 
     def _predict(self, tr: Track, now: float) -> Track:
@@ -45,8 +52,10 @@ class TrajGuardEKF:
 
     def step_track(self, veh_id: str, now: float, z_xyvpsi: Tuple[float,float,float,float], age: float, pdr: float, dt: float):
         zx, zy, zv, zpsi = map(float, z_xyvpsi)
+        # 1 for a fresh beacon at PDR 1; +1 per second of beacon age, +0.2 per 10% of packets lost
+        spread = 1.0 + max(0.0, float(age)) + 2.0 * (1.0 - max(0.0, min(1.0, float(pdr))))
         if veh_id not in self.tracks:
-            self.tracks[veh_id] = Track(x=zx, y=zy, v=zv, psi=zpsi, t=now)
+            self.tracks[veh_id] = Track(x=zx, y=zy, v=zv, psi=zpsi, t=now, spread=spread)
             return
 
         pred = self._predict(self.tracks[veh_id], now)
@@ -60,19 +69,67 @@ class TrajGuardEKF:
         v = alpha * zv + (1 - alpha) * pred.v
         psi = alpha * zpsi + (1 - alpha) * pred.psi
 
-        self.tracks[veh_id] = Track(x=x, y=y, v=v, psi=psi, t=now)
+        self.tracks[veh_id] = Track(x=x, y=y, v=v, psi=psi, t=now, spread=spread)
+
+    def memory_bytes(self) -> int:
+        return dict_bytes(self.tracks)
+
+    def evict(self, before_t: float) -> int:
+        '''Drops tracks last updated before before_t; returns how many.'''
+        old = [vid for vid, tr in self.tracks.items() if tr.t < before_t]
+        for vid in old:
+            del self.tracks[vid]
+        return len(old)
 
-    def rollout(self, veh_id: str) -> List[TrajPoint]:
+    def _point(self, tr: Track, k: int) -> TrajPoint:
+        tt = tr.t + k * self.dt_pred
+        x = tr.x + tr.v * math.cos(tr.psi) * k * self.dt_pred
+        y = tr.y + tr.v * math.sin(tr.psi) * k * self.dt_pred
+        return TrajPoint(x=x, y=y, v=tr.v, psi=tr.psi, t=tt)
+
+    def rollout(self, veh_id: str, ego_xyvpsi: Optional[Tuple[float,float,float,float]] = None) -> List[TrajPoint]:
+        '''Rollout of the track of veh_id (see rollout_track); [] when it is not tracked.'''
         if veh_id not in self.tracks:
             return []
-        tr = self.tracks[veh_id]
-        pts: List[TrajPoint] = []
+        return self.rollout_track(self.tracks[veh_id], ego_xyvpsi)
+
+    def rollout_track(self, tr: Track, ego_xyvpsi: Optional[Tuple[float,float,float,float]] = None) -> List[TrajPoint]:
+        '''
+        Constant-velocity rollout on the dt_pred grid up to horizon_s.
+        Adaptive mode (needs the ego state) samples a subset of that grid:
+          - every step inside fine_window_s (near term, also the prediction-log window)
+          - then every coarse_dt, plus the horizon endpoint
+          - every step between two coarse samples where the gap to the ego changes sign
+          - nothing past the fine window once the gap is positive and not shrinking
+        The gap is linear in time under constant velocity, so min gap / TTC / TH
+        over the subset equal those over the full grid.
+        '''
         steps = int(self.horizon_s / self.dt_pred)
-        for k in range(1, steps + 1):
-            tt = tr.t + k * self.dt_pred
-            x = tr.x + tr.v * math.cos(tr.psi) * k * self.dt_pred
-            y = tr.y + tr.v * math.sin(tr.psi) * k * self.dt_pred
-            pts.append(TrajPoint(x=x, y=y, v=tr.v, psi=tr.psi, t=tt))
+        if not self.adaptive or ego_xyvpsi is None:
+            return [self._point(tr, k) for k in range(1, steps + 1)]
+
+        ex, ey, _, epsi = map(float, ego_xyvpsi)
+        ux, uy = math.cos(epsi), math.sin(epsi)
+        gap = lambda p: ux * (p.x - ex) + uy * (p.y - ey)
+
+        fine = min(self.fine_steps, steps)
+        pts = [self._point(tr, k) for k in range(1, fine + 1)]
+        if fine == steps:
+            return pts
+        g_prev = gap(pts[-1])
+        g_rate = g_prev - gap(pts[-2]) if len(pts) > 1 else gap(self._point(tr, fine + 1)) - g_prev
+        if g_prev > 0 and g_rate >= 0:
+            return pts                      # receding or parallel: later points cannot tighten any metric
+
+        k_prev = fine
+        coarse = list(range(fine + self.coarse_steps, steps, self.coarse_steps)) + [steps]
+        for k in coarse:
+            p = self._point(tr, k)
+            g = gap(p)
+            if (g > 0) != (g_prev > 0):
+                pts.extend(self._point(tr, j) for j in range(k_prev + 1, k))   # refine the conflict region
+            pts.append(p)
+            k_prev, g_prev = k, g
         return pts
 
     def risk_vs_ego(self, ego_xyvpsi: Tuple[float,float,float,float], traj: List[TrajPoint]) -> RiskOut:
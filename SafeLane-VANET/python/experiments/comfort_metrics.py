@@ -1,12 +1,12 @@
 from pathlib import Path
-import pandas as pd
 import numpy as np
 
+from python.utils.schemas import read_artifact
+
 def compute_comfort(run_dir: str, dt=0.1):
     run_dir = Path(run_dir)
-    mob = pd.read_csv(run_dir / "mobility.csv")
-    mob["t"] = pd.to_numeric(mob["t"], errors="coerce")
-    mob["v"] = pd.to_numeric(mob["v"], errors="coerce")
+    # second differences of v: parse it at full precision
+    mob = read_artifact(run_dir / "mobility.csv", "mobility", usecols=["t","veh_id","v","is_av"], dtype={"v": "f8"})
 
     if "is_av" in mob.columns:
         mob = mob[mob["is_av"] == 1]
@@ -15,9 +15,9 @@ def compute_comfort(run_dir: str, dt=0.1):
     if mob.empty:
         return {"a_rms": 0.0, "j_rms": 0.0}
 
-    mob["dv"] = mob.groupby("veh_id")["v"].diff()
+    mob["dv"] = mob.groupby("veh_id", observed=True)["v"].diff()
     mob["a"] = mob["dv"] / float(dt)
-    mob["da"] = mob.groupby("veh_id")["a"].diff()
+    mob["da"] = mob.groupby("veh_id", observed=True)["a"].diff()
     mob["j"] = mob["da"] / float(dt)
 
     a = mob["a"].replace([np.inf,-np.inf], np.nan).dropna().to_numpy()
@@ -4,8 +4,19 @@ import pandas as pd
 import numpy as np
 
 from python.experiments.sumo_safety_events import compute_safety_events
-from python.experiments.prediction_metrics import compute_pred_metrics
+from python.experiments.prediction_metrics import compute_pred_metrics, read_pred_metrics
 from python.experiments.comfort_metrics import compute_comfort
+from python.experiments.kpi_accumulators import read_run_kpis
+from python.utils.action_log import load_actions
+
+# per-run KPIs summarized per variant (compute_run columns)
+KPI_COLUMNS = [
+    "ttc_p5","cancel_rate","defer_rate","exec_rate","lane_changes",
+    "pdr_mean","lat_p95_mean",
+    "collisions","near_miss_ttc","near_miss_gap","min_ttc_global","min_gap_global",
+    "gt_near_miss_ttc","gt_near_miss_gap","gt_near_miss_adj","gt_min_ttc","gt_min_gap",
+    "ade","fde","a_rms","j_rms"
+]
 
 def mean_ci95(x):
     x = np.asarray(x, dtype=float)
@@ -18,23 +29,45 @@ def mean_ci95(x):
     se = float(x.std(ddof=1) / np.sqrt(len(x)))
     return m, 1.96 * se
 
+def compute_pred(run_dir: Path, dt=0.1) -> dict:
+    if (run_dir / "pred_metrics.json").exists():
+        return read_pred_metrics(str(run_dir))
+    if (run_dir / "pred_rollouts.csv").exists():
+        return compute_pred_metrics(str(run_dir), dt=dt)
+    return {"ade": 0.0, "fde": 0.0, "n_samples": 0}
+
 def compute_run(run_dir: Path, dt=0.1):
-    a = pd.read_csv(run_dir / "actions.csv")
-    min_ttc = pd.to_numeric(a["min_ttc"], errors="coerce").replace([np.inf,-np.inf], np.nan).dropna().to_numpy()
+    # Streamed by the orchestrator: no need to re-parse the run logs
+    if (run_dir / "kpis.json").exists():
+        k = read_run_kpis(run_dir)
+        if "ade" not in k:
+            k.update(compute_pred(run_dir, dt=dt))
+        return k
+
+    # one row per span of identical decisions, weighted by its length n (dense log: n = 1)
+    a = load_actions(run_dir / "actions.csv", usecols=["action","pdr","lat_p95","min_ttc"], expand=False)
+    w = a["n"].to_numpy(dtype=float)
+    ttc = a["min_ttc"].replace([np.inf,-np.inf], np.nan).to_numpy(dtype=float)
+    min_ttc = np.repeat(ttc, a["n"].to_numpy())
+    min_ttc = min_ttc[~np.isnan(min_ttc)]
     ttc_p5 = float(np.percentile(min_ttc, 5)) if min_ttc.size else 0.0
 
-    cancel_rate = float((a["action"] == "CANCEL").mean())
-    defer_rate  = float((a["action"] == "DEFER").mean())
-    exec_rate   = float((a["action"] == "EXECUTE").mean())
-    lane_changes = int((a["action"] == "EXECUTE").sum())
+    n_dec = w.sum()
+    rate = lambda act: float(w[(a["action"] == act).to_numpy()].sum() / n_dec) if n_dec else float("nan")
+    cancel_rate = rate("CANCEL")
+    defer_rate  = rate("DEFER")
+    exec_rate   = rate("EXECUTE")
+    lane_changes = int(w[(a["action"] == "EXECUTE").to_numpy()].sum())
 
-    pdr_mean = float(pd.to_numeric(a.get("pdr"), errors="coerce").mean()) if "pdr" in a.columns else 0.0
-    lat_p95_mean = float(pd.to_numeric(a.get("lat_p95"), errors="coerce").mean()) if "lat_p95" in a.columns else 0.0
+    def wmean(c):
+        x = a[c].to_numpy(dtype=float)
+        ok = ~np.isnan(x)
+        return float(np.average(x[ok], weights=w[ok])) if ok.any() else float("nan")
+    pdr_mean = wmean("pdr") if "pdr" in a.columns else 0.0
+    lat_p95_mean = wmean("lat_p95") if "lat_p95" in a.columns else 0.0
 
     saf = compute_safety_events(str(run_dir))
-    pred = {"ade": 0.0, "fde": 0.0, "n_samples": 0}
-    if (run_dir / "pred_rollouts.csv").exists():
-        pred = compute_pred_metrics(str(run_dir), dt=dt)
+    pred = compute_pred(run_dir, dt=dt)
     comf = compute_comfort(str(run_dir), dt=dt)
 
     return dict(
@@ -60,8 +93,9 @@ def infer_variant(path_str: str) -> str:
 def main(out_root="out", dt=0.1):
     out_root = Path(out_root)
     runs = []
-    for p in out_root.rglob("*_step7/*"):
-        if (p / "actions.csv").exists():
+    for c in out_root.rglob("config_resolved.yaml"):
+        p = c.parent
+        if (p / "kpis.json").exists() or (p / "actions.csv").exists():
             runs.append(p)
 
     rows = []
@@ -82,16 +116,9 @@ def main(out_root="out", dt=0.1):
     df.to_csv(out_root / "runs_kpis_full.csv", index=False)
 
     summary = []
-    cols = [
-        "ttc_p5","cancel_rate","defer_rate","exec_rate","lane_changes",
-        "pdr_mean","lat_p95_mean",
-        "collisions","near_miss_ttc","near_miss_gap","min_ttc_global","min_gap_global",
-        "ade","fde","a_rms","j_rms"
-    ]
-
     for v, g in df.groupby("variant"):
         row = {"variant": v, "n_runs": int(len(g))}
-        for c in cols:
+        for c in KPI_COLUMNS:
             if c not in g.columns:
                 row[f"{c}_mean"] = 0.0
                 row[f"{c}_ci95"] = 0.0
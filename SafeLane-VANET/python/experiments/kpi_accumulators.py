@@ -0,0 +1,163 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Optional
+import json
+import math
+
+class Welford:
+    '''Running mean/variance (Welford), NaN/inf samples ignored.'''
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        x = float(x)
+        if not math.isfinite(x):
+            return
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    @property
+    def var(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+class QuantileSketch:
+    '''
+    Streaming quantile sketch with relative accuracy (log-spaced buckets, DDSketch-style).
+    Zeros and negatives are kept exactly/mirrored, so sentinel-heavy TTC streams
+    (min_ttc == 0 when no leader is tracked) still give the exact p5 of 0.
+    '''
+    def __init__(self, rel_acc: float = 0.01):
+        self.gamma = (1 + rel_acc) / (1 - rel_acc)
+        self._lg = math.log(self.gamma)
+        self.pos: Dict[int, int] = {}
+        self.neg: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _key(self, x: float) -> int:
+        return int(math.ceil(math.log(x) / self._lg))
+
+    def _value(self, k: int) -> float:
+        return 2 * self.gamma ** k / (self.gamma + 1)
+
+    def add(self, x: float):
+        x = float(x)
+        if not math.isfinite(x):
+            return
+        self.count += 1
+        if x > 0:
+            k = self._key(x)
+            self.pos[k] = self.pos.get(k, 0) + 1
+        elif x < 0:
+            k = self._key(-x)
+            self.neg[k] = self.neg.get(k, 0) + 1
+        else:
+            self.zeros += 1
+
+    def quantile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = int(math.floor(float(p) * (self.count - 1)))
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos)) if self.pos else 0.0
+
+class RunKpiAccumulator:
+    '''
+    Incremental per-run KPIs fed from the Step-7 loop; mirrors compute_run
+    (action rates, TTC p5, near-misses, PDR/latency means, accel/jerk RMS)
+    so the run can be summarized without re-reading actions.csv/mobility.csv.
+    '''
+    def __init__(self, dt: float, ttc_thr: float = 1.5, gap_thr: float = 2.0):
+        self.dt = float(dt)
+        self.ttc_thr = float(ttc_thr)
+        self.gap_thr = float(gap_thr)
+
+        self.n_actions = 0
+        self.action_counts: Dict[str, int] = {"EXECUTE": 0, "DEFER": 0, "CANCEL": 0}
+        self.ttc_q = QuantileSketch()
+        self.pdr = Welford()
+        self.lat_p95 = Welford()
+        self.near_miss_ttc = 0
+        self.near_miss_gap = 0
+        self.min_ttc = math.inf
+        self.min_gap = math.inf
+
+        self._last_v: Dict[str, float] = {}
+        self._last_a: Dict[str, float] = {}
+        self.a_sq = Welford()
+        self.j_sq = Welford()
+
+    def on_action(self, action: str, pdr: float, lat_p95: float, min_ttc: float, gap_min: float):
+        self.n_actions += 1
+        self.action_counts[action] = self.action_counts.get(action, 0) + 1
+        self.pdr.add(pdr)
+        self.lat_p95.add(lat_p95)
+        if math.isfinite(min_ttc):
+            self.ttc_q.add(min_ttc)
+            self.min_ttc = min(self.min_ttc, min_ttc)
+            self.near_miss_ttc += int(min_ttc < self.ttc_thr)
+        if math.isfinite(gap_min):
+            self.min_gap = min(self.min_gap, gap_min)
+            self.near_miss_gap += int(gap_min < self.gap_thr)
+
+    def on_speed(self, veh_id: str, v: float):
+        '''Per-tick AV speed sample; finite differences give accel and jerk.'''
+        v = float(v)
+        last_v = self._last_v.get(veh_id)
+        self._last_v[veh_id] = v
+        if last_v is None:
+            return
+        a = (v - last_v) / self.dt
+        self.a_sq.add(a * a)
+        last_a = self._last_a.get(veh_id)
+        self._last_a[veh_id] = a
+        if last_a is not None:
+            j = (a - last_a) / self.dt
+            self.j_sq.add(j * j)
+
+    def summary(self, pred: Optional[dict] = None, safety: Optional[dict] = None) -> dict:
+        n = self.n_actions
+        out = dict(
+            ttc_p5=float(self.ttc_q.quantile(0.05)),
+            cancel_rate=self.action_counts.get("CANCEL", 0) / n if n else 0.0,
+            defer_rate=self.action_counts.get("DEFER", 0) / n if n else 0.0,
+            exec_rate=self.action_counts.get("EXECUTE", 0) / n if n else 0.0,
+            lane_changes=int(self.action_counts.get("EXECUTE", 0)),
+            pdr_mean=self.pdr.mean if self.pdr.n else 0.0,
+            lat_p95_mean=self.lat_p95.mean if self.lat_p95.n else 0.0,
+            collisions=0,
+            near_miss_ttc=int(self.near_miss_ttc),
+            near_miss_gap=int(self.near_miss_gap),
+            min_ttc_global=self.min_ttc if math.isfinite(self.min_ttc) else 0.0,
+            min_gap_global=self.min_gap if math.isfinite(self.min_gap) else 0.0,
+            a_rms=math.sqrt(self.a_sq.mean) if self.a_sq.n else 0.0,
+            j_rms=math.sqrt(self.j_sq.mean) if self.j_sq.n else 0.0,
+        )
+        if pred is not None:
+            out.update(ade=float(pred["ade"]), fde=float(pred["fde"]), n_samples=int(pred["n_samples"]))
+        if safety is not None:
+            out.update(safety)
+        return out
+
+    def write_json(self, path: Path, pred: Optional[dict] = None, safety: Optional[dict] = None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(pred, safety), f, indent=2)
+
+def read_run_kpis(run_dir: Path) -> dict:
+    with open(Path(run_dir) / "kpis.json", "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -24,6 +24,10 @@ def main(out_root="out"):
         "Near-miss (gap<g)": ("near_miss_gap_mean", "near_miss_gap_ci95"),
         "Min TTC (s)": ("min_ttc_global_mean", "min_ttc_global_ci95"),
         "Min Gap (m)": ("min_gap_global_mean", "min_gap_global_ci95"),
+        "GT Near-miss (TTC<τ)": ("gt_near_miss_ttc_mean", "gt_near_miss_ttc_ci95"),
+        "GT Near-miss (gap<g)": ("gt_near_miss_gap_mean", "gt_near_miss_gap_ci95"),
+        "GT Min TTC (s)": ("gt_min_ttc_mean", "gt_min_ttc_ci95"),
+        "GT Min Gap (m)": ("gt_min_gap_mean", "gt_min_gap_ci95"),
     })
     safety.to_csv(out_root / "Table_Safety.csv", index=False)
 
@@ -0,0 +1,360 @@
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from python.utils.config import load_yaml
+from python.utils.schemas import read_artifact
+from python.experiments.run_step7_variants import VARIANTS
+
+# Bump when stage commands or the key layout change (invalidates every stamp).
+PIPELINE_VERSION = 1
+
+ORCH = ["python", "-m", "python.orchestrators.orchestrator_step7_laneaware_closedloop"]
+NS3_SCRATCH = "ns3/scratch/safelane_trace_wave.cc"
+
+_print_lock = threading.Lock()
+
+def log(msg: str):
+    with _print_lock:     # stages report from worker threads
+        print(msg, flush=True)
+
+@dataclass
+class Stage:
+    '''
+    One pipeline step. It is fresh when its key -- a hash over the content of
+    `inputs`, the existence/content of `feedback` files, the listed config
+    sections, the command and the environment -- matches its stamp and every
+    output still has the content it had when the stamp was written.
+    `feedback` files are hashed but create no dependency edge (the ns-3 logs
+    read back by the intent pass, which would otherwise close a cycle).
+    '''
+    name: str
+    cmd: Union[List[str], Callable[[], List[str]]]    # callable: resolved after upstream stages ran
+    inputs: List[Path]
+    outputs: List[Path]
+    cfg_keys: List[str] = field(default_factory=list)   # dotted sections, e.g. "algo" or "sim.dt"
+    feedback: List[Path] = field(default_factory=list)
+    env: Dict[str, str] = field(default_factory=dict)
+    cwd: Optional[Path] = None
+    clean: List[Path] = field(default_factory=list)     # stage-owned dirs wiped before a re-run
+    shell: bool = False
+
+class FileHasher:
+    '''blake2b of files and directory trees, memoized by (size, mtime_ns) across invocations.'''
+    def __init__(self, memo_path: Path):
+        self.memo_path = memo_path
+        self._lock = threading.Lock()
+        try:
+            with open(memo_path, "r", encoding="utf-8") as f:
+                self._memo = json.load(f)
+        except (OSError, ValueError):
+            self._memo = {}
+
+    def file(self, p: Path) -> str:
+        st = p.stat()
+        key = str(p.resolve())
+        with self._lock:
+            hit = self._memo.get(key)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.blake2b(digest_size=16)
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._memo[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def path(self, p: Path) -> str:
+        '''File content, directory tree (names + contents, dot-entries skipped) or "missing".'''
+        p = Path(p)
+        if p.is_file():
+            return self.file(p)
+        if not p.is_dir():
+            return "missing"
+        h = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(p):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith("."):
+                    continue
+                f = Path(root) / name
+                h.update(f"{f.relative_to(p).as_posix()}\0{self.file(f)}\0".encode())
+        return h.hexdigest()
+
+    def save(self):
+        self.memo_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self.memo_path, "w", encoding="utf-8") as f:
+                json.dump(self._memo, f)
+
+def cfg_section(cfg: dict, dotted: str):
+    node = cfg
+    for part in dotted.split("."):
+        node = node.get(part) if isinstance(node, dict) else None
+    return node
+
+class Pipeline:
+    '''
+    Stage DAG over file artifacts. Edges come from the artifacts themselves: a
+    stage depends on every stage producing one of its inputs. Stale stages are
+    re-run as soon as their upstream is done (independent ones in parallel);
+    fresh stages are skipped, and a stage whose inputs came out byte-identical
+    after an upstream re-run stays fresh.
+    '''
+    def __init__(self, stages: List[Stage], cfg: dict, state_dir: Path, jobs: int = 1):
+        self.stages = {s.name: s for s in stages}
+        self.cfg = cfg
+        self.state_dir = Path(state_dir)
+        self.jobs = max(1, int(jobs))
+        self.hasher = FileHasher(self.state_dir / "file_hashes.json")
+        producer = {}
+        for s in stages:
+            for o in s.outputs:
+                producer[Path(o)] = s.name
+        self.deps = {s.name: sorted({producer[Path(i)] for i in s.inputs if Path(i) in producer} - {s.name})
+                     for s in stages}
+
+    def closure(self, targets: List[str]) -> List[str]:
+        '''targets plus everything upstream, in topological order.'''
+        order, seen = [], set()
+
+        def visit(n, path=()):
+            if n in path:
+                raise ValueError(f"pipeline cycle: {' -> '.join(path + (n,))}")
+            if n in seen:
+                return
+            for d in self.deps[n]:
+                visit(d, path + (n,))
+            seen.add(n)
+            order.append(n)
+
+        for n in targets:
+            if n not in self.stages:
+                raise SystemExit(f"unknown stage {n!r}; choose from {list(self.stages)}")
+            visit(n)
+        return order
+
+    def key(self, s: Stage) -> str:
+        cmd = s.cmd() if callable(s.cmd) else s.cmd
+        doc = {
+            "v": PIPELINE_VERSION,
+            "cmd": cmd,
+            "env": s.env,
+            "cwd": str(s.cwd) if s.cwd else None,
+            "cfg": {k: cfg_section(self.cfg, k) for k in s.cfg_keys},
+            "inputs": {str(p): self.hasher.path(p) for p in s.inputs},
+            "feedback": {str(p): self.hasher.path(p) for p in s.feedback},
+        }
+        return hashlib.blake2b(json.dumps(doc, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+    def _stamp_path(self, name: str) -> Path:
+        return self.state_dir / f"{name}.json"
+
+    def is_fresh(self, s: Stage, key: str) -> bool:
+        try:
+            with open(self._stamp_path(s.name), "r", encoding="utf-8") as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if stamp.get("key") != key:
+            return False
+        return all(self.hasher.path(p) == stamp["outputs"].get(str(p)) for p in s.outputs)
+
+    def _execute(self, s: Stage, key: str) -> float:
+        for d in s.clean:
+            shutil.rmtree(d, ignore_errors=True)
+        cmd = s.cmd() if callable(s.cmd) else s.cmd
+        env = os.environ.copy()
+        env.update(s.env)
+        logf = self.state_dir / "logs" / f"{s.name}.log"
+        logf.parent.mkdir(parents=True, exist_ok=True)
+        log(f"[RUN] {s.name}: {cmd if s.shell else ' '.join(cmd)}")
+        t0 = time.perf_counter()
+        with open(logf, "w", encoding="utf-8") as fh:
+            rc = subprocess.call(cmd, env=env, cwd=s.cwd, shell=s.shell, stdout=fh, stderr=subprocess.STDOUT)
+        if rc != 0:
+            raise RuntimeError(f"stage {s.name} failed (exit {rc}), see {logf}")
+        missing = [str(p) for p in s.outputs if not Path(p).exists()]
+        if missing:
+            raise RuntimeError(f"stage {s.name} did not produce {missing}, see {logf}")
+        stamp = {"key": key, "outputs": {str(p): self.hasher.path(p) for p in s.outputs}, "cmd": cmd}
+        with open(self._stamp_path(s.name), "w", encoding="utf-8") as f:
+            json.dump(stamp, f, indent=2)
+        return time.perf_counter() - t0
+
+    def run(self, targets: List[str], force=(), dry_run: bool = False) -> Dict[str, str]:
+        '''Brings `targets` up to date. -> {stage: "ran" | "fresh" | "stale" (dry run)}'''
+        order = self.closure(targets)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        status: Dict[str, str] = {}
+        if dry_run:
+            # keys of stages below a stale one are not known before it runs
+            for n in order:
+                s = self.stages[n]
+                up_stale = any(status.get(d) == "stale" for d in self.deps[n])
+                status[n] = "stale" if up_stale or n in force or not self.is_fresh(s, self.key(s)) else "fresh"
+                log(f"[{status[n].upper()}] {n}")
+            return status
+
+        def step(n):
+            s = self.stages[n]
+            key = self.key(s)
+            if n not in force and self.is_fresh(s, key):
+                return "fresh", 0.0
+            return "ran", self._execute(s, key)
+
+        todo = list(order)
+        running = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as ex:
+                while todo or running:
+                    for n in [n for n in todo if all(d in status for d in self.deps[n])]:
+                        if len(running) >= self.jobs:
+                            break
+                        todo.remove(n)
+                        running[ex.submit(step, n)] = n
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        n = running.pop(fut)
+                        status[n], elapsed = fut.result()
+                        log(f"[OK] {n}: {status[n]}" + (f" in {elapsed:.1f}s" if status[n] == "ran" else ""))
+        finally:
+            self.hasher.save()
+        return status
+
+    def iterate(self, loop: List[str], watch: Path, max_iters: int, force=()) -> int:
+        '''
+        Re-runs the `loop` stages until `watch` stops changing (a fixed point of
+        the SUMO <-> ns-3 intent exchange) or `max_iters` rounds. -> rounds run.
+        '''
+        prev = None
+        for it in range(1, max(1, int(max_iters)) + 1):
+            status = self.run(loop, force=force if it == 1 else ())
+            cur = self.hasher.path(watch)
+            log(f"[INFO] intent loop round {it}: {watch.name} {cur[:12]}")
+            if cur == prev or all(v == "fresh" for v in status.values()):
+                log(f"[OK] intent schedule converged after {it} round(s)")
+                return it
+            prev = cur
+        log(f"[WARN] intent schedule still changing after {max_iters} round(s)")
+        return max_iters
+
+def ns3_nodes(veh_to_node_csv: Path) -> int:
+    m = read_artifact(veh_to_node_csv, "veh_to_node", usecols=["node_id"])
+    return int(m["node_id"].max()) + 1 if len(m) else 0
+
+def build_stages(cfg: dict, cfg_path: str, out_root: Path, iterate: bool = False) -> List[Stage]:
+    '''
+    The workflow's stages. The ns-3 logs are hashed into intent_export as
+    feedback only when iterating: a single pass plans once, and the logs its
+    own ns-3 run writes must not make it stale on the next invocation.
+    '''
+    paths = cfg["paths"]
+    pcfg = cfg.get("pipeline") or {}
+    sumo_cfg = Path(paths["sumo_cfg"])
+    ns3_dir = Path(paths.get("veh_to_node_csv", "out/ns3/veh_to_node.csv")).parent
+    mob = ns3_dir / "mobility_ns3.csv"
+    vmap = Path(paths.get("veh_to_node_csv", ns3_dir / "veh_to_node.csv"))
+    intent = Path(paths.get("intent_csv", ns3_dir / "intent.csv"))
+    packets = Path(paths.get("packets_csv", ns3_dir / "packets.csv"))
+    tx = Path(paths.get("tx_csv", ns3_dir / "tx.csv"))
+    sim = cfg["sim"]
+    synthetic = sim.get("sumo_backend") == "synthetic"
+    # the config itself enters through cfg_keys, section by section; the synthetic backend has no scenario files
+    scenario = [] if synthetic else [sumo_cfg.parent]
+    state_dir = out_root / "pipeline"
+    runs_root = state_dir / "runs"
+
+    def ns3_cmd():
+        tmpl = pcfg.get("ns3_cmd")
+        if not tmpl:
+            raise SystemExit("pipeline.ns3_cmd is not set (the ns-3 run command, see base.yaml)")
+        return tmpl.format(
+            mob=shlex.quote(str(mob.resolve())), intent=shlex.quote(str(intent.resolve())),
+            rx=shlex.quote(str(packets.resolve())), tx=shlex.quote(str(tx.resolve())),
+            n_nodes=ns3_nodes(vmap), sim_time=f"{float(sim['duration']):g}", hz=pcfg.get("cam_hz", 10))
+
+    stages = [
+        Stage("mobility_export",
+              ["python", "-m", "python.comm.mobility_export", "--sumo_cfg", str(sumo_cfg),
+               "--sumo_bin", paths.get("sumo_bin", "sumo"), "--dt", str(sim["dt"]), "--sim_time", str(sim["duration"]),
+               "--out_dir", str(ns3_dir), "--backend", sim.get("sumo_backend", "traci")]
+              + (["--cfg", cfg_path] if synthetic else []),
+              inputs=scenario, outputs=[mob, vmap],
+              cfg_keys=["paths.sumo_bin", "sim.dt", "sim.duration", "sim.sumo_backend"]
+              + (["sim.synthetic", "sim.seed"] if synthetic else [])),
+        Stage("intent_export", ORCH + ["--cfg", cfg_path],
+              inputs=scenario + [vmap], outputs=[intent], feedback=[packets, tx] if iterate else [],
+              cfg_keys=["sim", "algo"], env={"SAFE_INTENT_ONLY": "1", "SAFE_TAG": "intent",
+                                            "SAFE_RUN_DIR": str(state_dir / "intent_run")}),
+        Stage("ns3", ns3_cmd, inputs=[mob, intent, vmap, Path(NS3_SCRATCH)], outputs=[packets, tx],
+              cfg_keys=["sim.duration", "pipeline.ns3_cmd", "pipeline.cam_hz"],
+              cwd=Path(pcfg["ns3_cwd"]) if pcfg.get("ns3_cwd") else None, shell=True),
+    ]
+    variant_outputs = []
+    for tag, flags in VARIANTS:
+        run_dir = runs_root / tag
+        outputs = [run_dir / "config_resolved.yaml", run_dir / "actions.csv"]
+        variant_outputs += outputs
+        stages.append(Stage(f"variant_{tag}", ORCH + ["--cfg", cfg_path],
+                            inputs=scenario + [vmap, packets, tx], outputs=outputs,
+                            cfg_keys=["sim", "algo", "eval"], env=dict(flags, SAFE_TAG=tag, SAFE_RUN_DIR=str(run_dir)),
+                            clean=[run_dir]))
+    summary = runs_root / "summary_kpis_full_ci95.csv"
+    stages += [
+        Stage("compute_kpis_full",
+              ["python", "-m", "python.experiments.compute_kpis_full", "--out_root", str(runs_root),
+               "--dt", str(sim["dt"])],
+              inputs=variant_outputs, outputs=[runs_root / "runs_kpis_full.csv", summary], cfg_keys=["sim.dt"]),
+        Stage("make_paper_tables",
+              ["python", "-m", "python.experiments.make_paper_tables", "--out_root", str(runs_root)],
+              inputs=[summary], outputs=[runs_root / f"Table_{n}.csv" for n in
+                                         ("Safety", "Efficiency", "Communication", "Prediction", "Comfort")]),
+    ]
+    return stages
+
+def main():
+    ap = argparse.ArgumentParser(description="Cached SUMO -> ns-3 -> closed-loop pipeline (only stale stages re-run)")
+    ap.add_argument("--cfg", default="scenarios/configs/base.yaml")
+    ap.add_argument("--stages", nargs="*", default=None, help="targets (default: make_paper_tables, i.e. everything)")
+    ap.add_argument("--force", nargs="*", default=[], help="re-run these stages even if fresh")
+    ap.add_argument("--jobs", type=int, default=None, help="stages run concurrently (default: pipeline.jobs)")
+    ap.add_argument("--intent_iters", type=int, default=None,
+                    help="max intent_export -> ns3 rounds until intent.csv is unchanged (default: pipeline.intent_iters)")
+    ap.add_argument("--dry_run", action="store_true", help="only report which stages are stale")
+    args = ap.parse_args()
+
+    cfg = load_yaml(args.cfg)
+    pcfg = cfg.get("pipeline") or {}
+    out_root = Path(cfg["paths"].get("out_root", "out"))
+    jobs = args.jobs if args.jobs is not None else int(pcfg.get("jobs") or os.cpu_count() or 1)
+    iters = args.intent_iters if args.intent_iters is not None else int(pcfg.get("intent_iters", 1) or 1)
+
+    stages = build_stages(cfg, args.cfg, out_root, iterate=iters > 1)
+    pipe = Pipeline(stages, cfg, out_root / "pipeline", jobs=jobs)
+    targets = args.stages or ["make_paper_tables"]
+    force = set(args.force)
+
+    if not args.dry_run and iters > 1 and "ns3" in pipe.closure(targets):
+        pipe.iterate(["ns3"], Path(cfg["paths"].get("intent_csv", "out/ns3/intent.csv")), iters, force=force)
+        force -= {"mobility_export", "intent_export", "ns3"}
+    status = pipe.run(targets, force=force, dry_run=args.dry_run)
+    if not args.dry_run:
+        ran = [n for n, v in status.items() if v == "ran"]
+        log(f"[OK] pipeline: {len(ran)} ran, {len(status) - len(ran)} fresh")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,23 @@
 from pathlib import Path
-import pandas as pd
+import json
+import math
 import numpy as np
 
+from python.utils.schemas import read_artifact
+
 def compute_pred_metrics(run_dir: str, dt=0.1):
     run_dir = Path(run_dir)
-    pred = pd.read_csv(run_dir / "pred_rollouts.csv")
-    mob  = pd.read_csv(run_dir / "mobility.csv")
-
-    for c in ["t","h","px","py"]:
-        pred[c] = pd.to_numeric(pred[c], errors="coerce")
-    mob["t"] = pd.to_numeric(mob["t"], errors="coerce")
-    mob["x"] = pd.to_numeric(mob["x"], errors="coerce")
-    mob["y"] = pd.to_numeric(mob["y"], errors="coerce")
-    if "node_id" in mob.columns:
-        mob["node_id"] = pd.to_numeric(mob["node_id"], errors="coerce")
-    else:
+    pred = read_artifact(run_dir / "pred_rollouts.csv", "pred_rollouts", usecols=["t","track_id","h","t_pred","px","py"])
+    mob  = read_artifact(run_dir / "mobility.csv", "mobility", usecols=["t","veh_id","x","y","node_id"])
+
+    if "node_id" not in mob.columns:
         mob["node_id"] = mob["veh_id"].astype(str).str.extract(r"(\d+)").astype(int)
 
     pred["track_node"] = pred["track_id"].astype(str).str.extract(r"(\d+)").astype(int)
-    pred["t_gt"] = pred["t"] + pred["h"] * float(dt)
+    if "t_pred" in pred.columns:
+        pred["t_gt"] = pred["t_pred"]      # variable-step rollouts log their times
+    else:
+        pred["t_gt"] = pred["t"] + pred["h"] * float(dt)
 
     pred["t_gt_r"] = pred["t_gt"].round(3)
     mob["t_r"] = mob["t"].round(3)
@@ -29,10 +28,105 @@ def compute_pred_metrics(run_dir: str, dt=0.1):
     if m.empty:
         return {"ade": 0.0, "fde": 0.0, "n_samples": 0}
 
-    m["err"] = np.sqrt((m["px"] - m["gx"])**2 + (m["py"] - m["gy"])**2)
+    dx = m["px"].to_numpy("f8") - m["gx"].to_numpy("f8")     # float32 positions, float64 error sums
+    dy = m["py"].to_numpy("f8") - m["gy"].to_numpy("f8")
+    m["err"] = np.sqrt(dx**2 + dy**2)
     ade = float(m["err"].mean())
 
     idx = m.groupby(["t","track_node"])["h"].idxmax()
     fde = float(m.loc[idx, "err"].mean()) if len(idx) else 0.0
 
     return {"ade": ade, "fde": fde, "n_samples": int(len(m))}
+
+class OnlinePredEvaluator:
+    '''
+    Streaming ADE/FDE computed inside the closed loop.
+    Each rollout point is parked in a ring buffer slot keyed by the simulation tick
+    at which its ground truth exists; when the loop reaches that tick the slot is
+    scored against the live vehicle positions and folded into running sums.
+    FDE uses the last scored point of each rollout; per-horizon sums are keyed
+    by prediction lead time in ticks.
+    '''
+    def __init__(self, dt: float, max_lookahead_s: float = 1.0):
+        self.dt = float(dt)
+        self._slots = [[] for _ in range(int(math.ceil(max_lookahead_s / self.dt)) + 2)]
+        self.err_sum = 0.0
+        self.n = 0
+        self.fde_sum = 0.0
+        self.fde_n = 0
+        self.lead_sum = {}   # lead ticks -> summed error
+        self.lead_n = {}     # lead ticks -> samples
+
+    def _tick(self, t: float) -> int:
+        return int(round(float(t) / self.dt))
+
+    def _grow(self, size: int):
+        pending = [e for slot in self._slots for e in slot]
+        self._slots = [[] for _ in range(size)]
+        for e in pending:
+            self._slots[e[0] % size].append(e)
+
+    def add(self, t: float, track_node: int, points):
+        '''points: iterable of (t_gt, px, py) in increasing t_gt.'''
+        pts = list(points)
+        if not pts:
+            return
+        k0 = self._tick(t)
+        origin = [None]   # last matched error of this rollout
+        for i, (tg, px, py) in enumerate(pts):
+            kg = self._tick(tg)
+            lead = kg - k0
+            if lead < 0:
+                continue
+            if lead >= len(self._slots) - 1:
+                self._grow(lead + 2)
+            self._slots[kg % len(self._slots)].append(
+                (kg, lead, int(track_node), float(px), float(py), origin, i == len(pts) - 1))
+
+    def score(self, t: float, gt_xy: dict):
+        '''Score every point due at tick(t) against gt_xy: node_id -> (x, y).'''
+        k = self._tick(t)
+        idx = k % len(self._slots)
+        slot = self._slots[idx]
+        if not slot:
+            return
+        keep = []
+        for e in slot:
+            kg, lead, node, px, py, origin, last = e
+            if kg > k:
+                keep.append(e)
+                continue
+            pos = gt_xy.get(node) if kg == k else None
+            if pos is not None:
+                err = math.hypot(px - pos[0], py - pos[1])
+                self.err_sum += err
+                self.n += 1
+                self.lead_sum[lead] = self.lead_sum.get(lead, 0.0) + err
+                self.lead_n[lead] = self.lead_n.get(lead, 0) + 1
+                origin[0] = err
+            if last and origin[0] is not None:
+                self.fde_sum += origin[0]
+                self.fde_n += 1
+        self._slots[idx] = keep
+
+    def summary(self) -> dict:
+        return {
+            "ade": self.err_sum / self.n if self.n else 0.0,
+            "fde": self.fde_sum / self.fde_n if self.fde_n else 0.0,
+            "n_samples": int(self.n),
+            "per_horizon": [
+                {"lead_s": round(lead * self.dt, 6),
+                 "ade": self.lead_sum[lead] / self.lead_n[lead],
+                 "n_samples": int(self.lead_n[lead])}
+                for lead in sorted(self.lead_n)
+            ],
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+def read_pred_metrics(run_dir: str) -> dict:
+    with open(Path(run_dir) / "pred_metrics.json", "r", encoding="utf-8") as f:
+        d = json.load(f)
+    return {"ade": float(d.get("ade", 0.0)), "fde": float(d.get("fde", 0.0)), "n_samples": int(d.get("n_samples", 0))}
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import subprocess
+import numpy as np
+import pandas as pd
+
+from python.utils.config import load_yaml
+from python.experiments.compute_kpis_full import KPI_COLUMNS, compute_run, mean_ci95
+from python.experiments.run_step7_variants import VARIANTS
+
+DEFAULT_KPIS = ["gt_min_ttc", "exec_rate", "lane_changes", "pdr_mean"]
+
+def precision_met(x: np.ndarray, rel: float, abs_tol: Optional[float], min_n: int = 2):
+    '''
+    -> (mean, ci95 half-width, target half-width, finite samples, met).
+    Never met below min_n finite samples (at least 2): mean_ci95 drops NaN/inf
+    and reports half-width 0 for fewer than two values.
+    '''
+    x = np.asarray(x, dtype=float)
+    n = int(np.isfinite(x).sum())
+    m, hw = mean_ci95(x)
+    target = max(rel * abs(m), abs_tol or 0.0)
+    return m, hw, target, n, bool(n >= max(2, min_n) and hw <= target)
+
+def launch(cfg_path: str, variant: str, flags: Dict[str, str], seed: int, run_dir: Path) -> int:
+    env = os.environ.copy()
+    env.update(flags)
+    env.update(SAFE_TAG=variant, SAFE_SEED=str(seed), SAFE_RUN_DIR=str(run_dir))
+    run_dir.mkdir(parents=True, exist_ok=True)
+    with open(run_dir / "stdout.log", "w") as log:
+        return subprocess.call(["python", "-m", "python.orchestrators.orchestrator_step7_laneaware_closedloop",
+                                "--cfg", cfg_path], env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequential seed runner: more seeds only where the KPI CI95 is still wide")
+    ap.add_argument("--cfg", default="scenarios/configs/base.yaml")
+    ap.add_argument("--variants", nargs="*", default=[v for v, _ in VARIANTS])
+    ap.add_argument("--kpis", nargs="*", default=DEFAULT_KPIS, help="compute_kpis_full columns that must be precise")
+    ap.add_argument("--rel_prec", type=float, default=0.05, help="stop when CI95 half-width <= rel_prec * |mean|")
+    ap.add_argument("--abs_prec", nargs="*", default=[], help="kpi=half-width floors, e.g. collisions=0.5")
+    ap.add_argument("--batch", type=int, default=4, help="seeds added per variant per round")
+    ap.add_argument("--min_seeds", type=int, default=4)
+    ap.add_argument("--max_seeds", type=int, default=32, help="per-variant budget")
+    ap.add_argument("--max_runs", type=int, default=None, help="total budget over all variants")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="concurrent runs")
+    ap.add_argument("--seed0", type=int, default=1)
+    ap.add_argument("--out_dir", default="out/seeds")
+    args = ap.parse_args()
+
+    cfg = load_yaml(args.cfg)
+    dt = float(cfg["sim"]["dt"])
+    out_dir = Path(args.out_dir)
+    flags = dict(VARIANTS)
+    unknown = [v for v in args.variants if v not in flags]
+    if unknown:
+        raise SystemExit(f"unknown variants {unknown}; choose from {list(flags)}")
+    unknown = [k for k in args.kpis if k not in KPI_COLUMNS]
+    if unknown:
+        raise SystemExit(f"unknown kpis {unknown}; choose from {KPI_COLUMNS}")
+    abs_tol = {k: float(v) for k, v in (item.split("=", 1) for item in args.abs_prec)}
+
+    kpis: Dict[str, List[dict]] = {v: [] for v in args.variants}
+    stop: Dict[str, str] = {}
+    failed: Dict[str, List[int]] = {v: [] for v in args.variants}
+    next_seed = {v: args.seed0 for v in args.variants}
+    progress, runs_total, rnd = [], 0, 0
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        while len(stop) < len(args.variants):
+            # this round's seeds: top active variants up to min_seeds, else one batch, within budgets
+            todo = []
+            for v in args.variants:
+                if v in stop:
+                    continue
+                n = len(kpis[v]) + len(failed[v])
+                want = max(args.batch, args.min_seeds - n)
+                want = min(want, args.max_seeds - n)
+                if args.max_runs is not None:
+                    want = min(want, args.max_runs - runs_total - len(todo))
+                todo += [(v, next_seed[v] + i) for i in range(max(0, want))]
+                next_seed[v] += max(0, want)
+            if not todo:
+                for v in args.variants:
+                    stop.setdefault(v, "budget")
+                break
+            rnd += 1
+            print(f"[INFO] round {rnd}: {len(todo)} runs " +
+                  ", ".join(f"{v}x{sum(1 for w, _ in todo if w == v)}" for v in args.variants if v not in stop))
+
+            jobs = [(v, s, out_dir / v / f"seed_{s:04d}") for v, s in todo]
+            codes = list(ex.map(lambda j: launch(args.cfg, j[0], flags[j[0]], j[1], j[2]), jobs))
+            runs_total += len(todo)
+            for (v, s, d), rc in zip(jobs, codes):
+                if rc != 0:
+                    print(f"[WARN] {v} seed {s} failed (exit {rc}), see {d / 'stdout.log'}")
+                    failed[v].append(s)
+                    continue
+                kpis[v].append(dict(compute_run(d, dt=dt), seed=s))
+
+            for v in args.variants:
+                if v in stop:
+                    continue
+                df = pd.DataFrame(kpis[v])
+                all_met = len(df) >= max(2, args.min_seeds)
+                for k in args.kpis:
+                    x = df[k].to_numpy(dtype=float) if k in df.columns else np.zeros(0)
+                    m, hw, target, n, met = precision_met(x, args.rel_prec, abs_tol.get(k), args.min_seeds)
+                    all_met &= met
+                    progress.append({"round": rnd, "variant": v, "n_seeds": len(df), "kpi": k, "n_finite": n,
+                                     "mean": m, "ci95": hw, "target": target, "met": int(met)})
+                if all_met:
+                    stop[v] = "precision"
+                elif len(kpis[v]) + len(failed[v]) >= args.max_seeds:
+                    stop[v] = "max_seeds"
+            if args.max_runs is not None and runs_total >= args.max_runs:
+                for v in args.variants:
+                    stop.setdefault(v, "budget")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prog = pd.DataFrame(progress)
+    prog.to_csv(out_dir / "seed_progress.csv", index=False)
+    report = {"rel_prec": args.rel_prec, "abs_prec": abs_tol, "kpis": args.kpis, "runs": runs_total, "variants": {}}
+    for v in args.variants:
+        last = prog[(prog["variant"] == v) & (prog["round"] == prog[prog["variant"] == v]["round"].max())] \
+            if not prog.empty else prog
+        report["variants"][v] = {
+            "stop": stop.get(v, "budget"), "n_seeds": len(kpis[v]), "failed_seeds": failed[v],
+            "seeds": [r["seed"] for r in kpis[v]],
+            "kpis": {r["kpi"]: {"n_finite": int(r["n_finite"]), "mean": r["mean"], "ci95": r["ci95"],
+                                "target": r["target"], "met": bool(r["met"])}
+                     for r in last.to_dict("records")},
+        }
+        if kpis[v]:
+            pd.DataFrame(kpis[v]).to_csv(out_dir / v / "runs_kpis.csv", index=False)
+    with open(out_dir / "seed_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for v, r in report["variants"].items():
+        wide = [k for k, s in r["kpis"].items() if not s["met"]]
+        print(f"[OK] {v}: {r['n_seeds']} seeds, stop={r['stop']}" + (f", still wide: {wide}" if wide else ""))
+    print("[OK] wrote:", out_dir / "seed_report.json")
+
+if __name__ == "__main__":
+    main()
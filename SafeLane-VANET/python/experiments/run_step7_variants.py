@@ -2,6 +2,14 @@ import os
 import argparse
 import subprocess
 
+VARIANTS = [
+    ("full",        dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
+    ("no_pred",     dict(SAFE_NO_PRED="1", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
+    ("no_intent",   dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="1", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
+    ("non_adapt",   dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="1", SAFE_MOBIL_ONLY="0")),
+    ("mobil_only",  dict(SAFE_NO_PRED="1", SAFE_NO_INTENT="1", SAFE_NON_ADAPT="1", SAFE_MOBIL_ONLY="1")),
+]
+
 def run(cmd, env=None):
     print(" ".join(cmd))
     subprocess.check_call(cmd, env=env)
@@ -9,21 +17,25 @@ def run(cmd, env=None):
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--cfg", default="scenarios/configs/base.yaml")
+    ap.add_argument("--warmup_s", type=float, default=0.0,
+                    help="simulate this sensing-only prefix once and start every variant from its checkpoint")
     args = ap.parse_args()
+    orch = ["python", "-m", "python.orchestrators.orchestrator_step7_laneaware_closedloop", "--cfg", args.cfg]
 
-    variants = [
-        ("full",        dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
-        ("no_pred",     dict(SAFE_NO_PRED="1", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
-        ("no_intent",   dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="1", SAFE_NON_ADAPT="0", SAFE_MOBIL_ONLY="0")),
-        ("non_adapt",   dict(SAFE_NO_PRED="0", SAFE_NO_INTENT="0", SAFE_NON_ADAPT="1", SAFE_MOBIL_ONLY="0")),
-        ("mobil_only",  dict(SAFE_NO_PRED="1", SAFE_NO_INTENT="1", SAFE_NON_ADAPT="1", SAFE_MOBIL_ONLY="1")),
-    ]
+    resume = None
+    if args.warmup_s > 0:
+        resume = os.path.join("out", "checkpoints", f"warmup_{args.warmup_s:g}s")
+        env = os.environ.copy()
+        env.update(SAFE_TAG="warmup", SAFE_WARMUP_S=str(args.warmup_s), SAFE_CHECKPOINT=resume)
+        run(orch, env=env)
 
-    for tag, flags in variants:
+    for tag, flags in VARIANTS:
         env = os.environ.copy()
         env.update(flags)
         env["SAFE_TAG"] = tag
-        run(["python", "-m", "python.orchestrators.orchestrator_step7_laneaware_closedloop"], env=env)
+        if resume is not None:
+            env["SAFE_RESUME"] = resume
+        run(orch, env=env)
 
     run(["python", "-m", "python.experiments.compute_kpis_full", "--out_root", "out", "--dt", "0.1"])
 
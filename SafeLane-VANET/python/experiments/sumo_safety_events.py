@@ -1,8 +1,14 @@
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import math
 import pandas as pd
 import numpy as np
 
+from python.comm.mobility_export import lane_index_from_lane_id
+from python.utils.schemas import read_artifact
+from python.utils.action_log import load_actions
+
 @dataclass
 class SafetyEvents:
     collisions: int
@@ -11,20 +17,26 @@ class SafetyEvents:
     min_ttc_global: float
     min_gap_global: float
 
+SAFETY_EVENT_FIELDS = ["t_start","t_end","kind","veh_a","veh_b","lane_rel","min_ttc","min_gap"]
+
 def extract_sumo_collisions(run_dir: Path) -> int:
     c_csv = run_dir / "collisions.csv"
     if c_csv.exists():
         df = pd.read_csv(c_csv)
         return int(len(df))
+    e_csv = run_dir / "safety_events.csv"
+    if e_csv.exists():
+        df = read_artifact(e_csv, "safety_events", usecols=["kind"])
+        return int((df["kind"] == "collision").sum())
     return 0
 
 def compute_near_misses(actions_csv: Path, ttc_thr=1.5, gap_thr=2.0) -> SafetyEvents:
-    a = pd.read_csv(actions_csv)
-    a["min_ttc"] = pd.to_numeric(a.get("min_ttc"), errors="coerce")
-    a["gap_min"] = pd.to_numeric(a.get("gap_min"), errors="coerce")
+    a = load_actions(actions_csv, usecols=["min_ttc","gap_min"], expand=False)
+    n = a["n"].to_numpy()
 
-    ttc = a["min_ttc"].replace([np.inf, -np.inf], np.nan).dropna().to_numpy()
-    gap = a["gap_min"].replace([np.inf, -np.inf], np.nan).dropna().to_numpy()
+    ttc = np.repeat(a["min_ttc"].replace([np.inf, -np.inf], np.nan).to_numpy(dtype=float), n)
+    gap = np.repeat(a["gap_min"].replace([np.inf, -np.inf], np.nan).to_numpy(dtype=float), n)
+    ttc, gap = ttc[~np.isnan(ttc)], gap[~np.isnan(gap)]
 
     min_ttc_global = float(np.min(ttc)) if ttc.size else 0.0
     min_gap_global = float(np.min(gap)) if gap.size else 0.0
@@ -40,15 +52,159 @@ def compute_near_misses(actions_csv: Path, ttc_thr=1.5, gap_thr=2.0) -> SafetyEv
         min_gap_global=min_gap_global,
     )
 
+def compute_gt_safety(events_csv: Path) -> dict:
+    '''Ground-truth surrogate safety KPIs from a safety_events.csv written by GtSafetyMonitor.'''
+    ev = read_artifact(events_csv, "safety_events", usecols=["kind","lane_rel","min_ttc","min_gap"])
+    eps = ev[ev["kind"].isin(["ttc", "gap", "ttc+gap"])]
+    same = eps[eps["lane_rel"] == 0]
+    summ = ev[ev["kind"] == "summary"]
+    return {
+        "gt_near_miss_ttc": int(same["kind"].str.contains("ttc").sum()),
+        "gt_near_miss_gap": int(same["kind"].str.contains("gap").sum()),
+        "gt_near_miss_adj": int(len(eps) - len(same)),
+        "gt_min_ttc": float(summ["min_ttc"].iloc[-1]) if len(summ) else 0.0,
+        "gt_min_gap": float(summ["min_gap"].iloc[-1]) if len(summ) else 0.0,
+    }
+
 def compute_safety_events(run_dir: str, ttc_thr=1.5, gap_thr=2.0) -> dict:
     run_dir = Path(run_dir)
     ev = compute_near_misses(run_dir / "actions.csv", ttc_thr=ttc_thr, gap_thr=gap_thr)
     col = extract_sumo_collisions(run_dir)
     ev.collisions = col
-    return {
+    out = {
         "collisions": ev.collisions,
         "near_miss_ttc": ev.near_miss_ttc,
         "near_miss_gap": ev.near_miss_gap,
         "min_ttc_global": ev.min_ttc_global,
         "min_gap_global": ev.min_gap_global,
     }
+    if (run_dir / "safety_events.csv").exists():
+        out.update(compute_gt_safety(run_dir / "safety_events.csv"))
+    return out
+
+class GtSafetyMonitor:
+    '''
+    Ground-truth collision and surrogate-safety detection over ALL vehicles.
+    Positions are bucketed into a uniform spatial hash (cell >= interaction range),
+    so only vehicles in the 3x3 neighbouring cells are paired: O(N) per step
+    instead of O(N^2). Each vehicle is paired with its direct leader on the
+    same lane and on each adjacent lane (nearest vehicle ahead, also across an
+    edge boundary when travelling the same way), giving a longitudinal gap
+    (bumper to bumper) and TTC; sub-threshold pairs are merged into episodes,
+    so safety_events.csv holds one row per conflict.
+    '''
+    min_cos = math.cos(math.radians(45.0))     # heading agreement for pairs on different roads
+
+    def __init__(self, logger=None, ttc_thr: float = 1.5, gap_thr: float = 2.0,
+                 cell_m: float = 50.0, veh_length: float = 5.0):
+        self.log = logger
+        self.ttc_thr = float(ttc_thr)
+        self.gap_thr = float(gap_thr)
+        self.cell = float(cell_m)
+        self.veh_length = float(veh_length)
+
+        self.active: Dict[Tuple[str, str], list] = {}   # (follower, leader) -> [t0, t1, lane_rel, ttc, gap, kinds]
+        self.min_ttc = math.inf
+        self.min_gap = math.inf
+        self.collisions = 0
+        self.n_ttc = 0
+        self.n_gap = 0
+        self.n_adj = 0
+
+    def step(self, t: float, states: dict, collisions: Optional[List] = None):
+        for c in collisions or []:
+            self.collisions += 1
+            self._write(t, t, "collision", c.collider, c.victim, "", 0.0, 0.0)
+
+        cells: Dict[Tuple[int, int], List[str]] = {}
+        lane_idx: Dict[str, int] = {}
+        for vid, s in states.items():
+            lane_idx[vid] = lane_index_from_lane_id(s.lane_id)
+            key = (int(math.floor(s.x / self.cell)), int(math.floor(s.y / self.cell)))
+            cells.setdefault(key, []).append(vid)
+
+        flagged = set()
+        for (cx, cy), members in cells.items():
+            near = [v for dx in (-1, 0, 1) for dy in (-1, 0, 1) for v in cells.get((cx + dx, cy + dy), ())]
+            for f in members:
+                sf = states[f]
+                lf = lane_idx[f]
+                # SUMO angle: clockwise from north
+                hx, hy = math.sin(sf.psi), math.cos(sf.psi)
+                # nearest vehicle ahead per lane offset (-1, 0, +1): only the direct leader is a conflict
+                ahead: Dict[int, Tuple[float, str]] = {}
+                for l in near:
+                    if l == f:
+                        continue
+                    sl = states[l]
+                    # across an edge boundary: same travel direction only (not crossing / opposing roads)
+                    if sl.road_id != sf.road_id and math.cos(sl.psi - sf.psi) < self.min_cos:
+                        continue
+                    rel = lane_idx[l] - lf
+                    if abs(rel) > 1:
+                        continue
+                    d = hx * (sl.x - sf.x) + hy * (sl.y - sf.y)
+                    if d <= 0:
+                        continue
+                    if rel not in ahead or d < ahead[rel][0]:
+                        ahead[rel] = (d, l)
+                for rel, (d, l) in ahead.items():
+                    sl = states[l]
+                    lane_rel = abs(rel)
+                    gap = d - self.veh_length
+                    closing = sf.v - sl.v * math.cos(sl.psi - sf.psi)
+                    ttc = gap / closing if (closing > 1e-3 and gap > 0) else math.inf
+                    if lane_rel == 0:
+                        self.min_gap = min(self.min_gap, gap)
+                        self.min_ttc = min(self.min_ttc, ttc)
+                    # side-by-side overlap on an adjacent lane is not a conflict: only TTC counts there
+                    kinds = {k for k, hit in (("ttc", ttc < self.ttc_thr),
+                                              ("gap", lane_rel == 0 and gap < self.gap_thr)) if hit}
+                    if kinds:
+                        self._flag(t, (f, l), lane_rel, ttc, gap, kinds)
+                        flagged.add((f, l))
+
+        for key in [k for k in self.active if k not in flagged]:
+            self._close(key)
+
+    def _flag(self, t, key, lane_rel, ttc, gap, kinds):
+        ep = self.active.get(key)
+        if ep is None:
+            self.active[key] = [t, t, lane_rel, ttc, gap, set(kinds)]
+            return
+        ep[1] = t
+        ep[3] = min(ep[3], ttc)
+        ep[4] = min(ep[4], gap)
+        ep[5].update(kinds)
+
+    def _close(self, key):
+        t0, t1, lane_rel, ttc, gap, kinds = self.active.pop(key)
+        kind = "+".join(k for k in ("ttc", "gap") if k in kinds)
+        if lane_rel == 0:
+            self.n_ttc += int("ttc" in kinds)
+            self.n_gap += int("gap" in kinds)
+        else:
+            self.n_adj += 1
+        self._write(t0, t1, kind, key[0], key[1], lane_rel, ttc, gap)
+
+    def _write(self, t0, t1, kind, a, b, lane_rel, ttc, gap):
+        if self.log is not None:
+            self.log.write({"t_start": round(t0, 3), "t_end": round(t1, 3), "kind": kind,
+                            "veh_a": a, "veh_b": b, "lane_rel": lane_rel,
+                            "min_ttc": ttc, "min_gap": gap})
+
+    def close(self):
+        for key in list(self.active):
+            self._close(key)
+        s = self.summary()
+        self._write(-1.0, -1.0, "summary", "", "", "", s["gt_min_ttc"], s["gt_min_gap"])
+
+    def summary(self) -> dict:
+        return {
+            "collisions": int(self.collisions),
+            "gt_near_miss_ttc": int(self.n_ttc),
+            "gt_near_miss_gap": int(self.n_gap),
+            "gt_near_miss_adj": int(self.n_adj),
+            "gt_min_ttc": self.min_ttc if math.isfinite(self.min_ttc) else 0.0,
+            "gt_min_gap": self.min_gap if math.isfinite(self.min_gap) else 0.0,
+        }
@@ -0,0 +1,200 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from python.utils.config import load_yaml
+from python.core.safemobil_comm import SafeMOBILComm
+from python.utils.action_log import load_actions
+
+# SafeMOBILComm parameters that act on the logged decision inputs (coord_window shapes coord_ok upstream)
+PARAMS = ["ttc_min", "th_min", "gap_min", "pdr_min", "lat_max", "strict_factor", "cooldown_s", "p_coll_max"]
+EXECUTE, DEFER, CANCEL = 0, 1, 2
+ACTION_CODES = {"EXECUTE": EXECUTE, "DEFER": DEFER, "CANCEL": CANCEL}
+
+def parse_axis(spec: str) -> np.ndarray:
+    '''"1.5" | "1,1.5,2" | "start:stop:num" (linspace, inclusive).'''
+    if ":" in spec:
+        a, b, n = spec.split(":")
+        return np.linspace(float(a), float(b), int(n))
+    return np.array([float(v) for v in spec.split(",")])
+
+def make_grid(base: Dict[str, float], axes: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    '''Cartesian product of the swept axes; other parameters stay at their base value. -> {param: (C,)}'''
+    swept = [p for p in PARAMS if p in axes]
+    mesh = np.meshgrid(*[axes[p] for p in swept], indexing="ij") if swept else []
+    n = int(np.prod([len(axes[p]) for p in swept])) if swept else 1
+    grid = {p: np.full(n, float(base[p])) for p in PARAMS}
+    for p, m in zip(swept, mesh):
+        grid[p] = m.ravel().astype(float)
+    return grid
+
+def sim_times(t_logged: np.ndarray, dt: float) -> np.ndarray:
+    '''
+    The orchestrator's clock is `t += dt` (not k*dt) and actions.csv rounds it;
+    rebuild the exact float times so cooldown comparisons at the boundary match.
+    '''
+    if not len(t_logged):
+        return t_logged
+    k = np.rint(t_logged / dt).astype(np.int64)
+    clock = np.cumsum(np.r_[0.0, np.full(int(k.max()), dt)])
+    return clock[k]
+
+def load_decision_log(run_dir: Path, dt: float = 0.1) -> Dict[str, np.ndarray]:
+    '''actions.csv -> decision inputs as arrays, in (t, file order).'''
+    a = load_actions(run_dir / "actions.csv",
+                     usecols=["t","ego_id","curr_lane","target_lane","action","pdr","lat_p95","min_ttc","min_th","gap_min","coord_ok","p_coll"])
+    a = a.sort_values("t", kind="stable")
+    num = lambda c: a[c].to_numpy(dtype=float)     # NaN fails every gate, as in decide()
+    ego_idx, _ = pd.factorize(a["ego_id"])
+    return {
+        "t": sim_times(num("t"), dt),
+        "ego": ego_idx.astype(np.int64),
+        "change": (a["target_lane"].astype(str) != a["curr_lane"].astype(str)).to_numpy(),
+        "pdr": num("pdr"), "lat_p95": num("lat_p95"),
+        "min_ttc": num("min_ttc"), "min_th": num("min_th"), "gap_min": num("gap_min"),
+        "p_coll": num("p_coll") if "p_coll" in a.columns else np.zeros(len(a)),    # Monte Carlo risk runs only
+        "coord_ok": np.nan_to_num(num("coord_ok")) != 0,
+        "action": a["action"].map(ACTION_CODES).astype("f8").fillna(-1).to_numpy(dtype=np.int8),
+    }
+
+def replay(log: Dict[str, np.ndarray], grid: Dict[str, np.ndarray], near_miss_ttc: float = 1.5,
+           near_miss_gap: float = 2.0, actions_out: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    '''
+    Open-loop replay of SafeMOBILComm.decide over C parameter sets at once.
+    Each tick is one broadcast (rows x C) evaluation; per-AV cooldown state is a
+    (n_egos x C) matrix of last lane-change times, so cooldown interacts with
+    each combination's own executions. Traffic does not react to the
+    counterfactual decisions: the logged risk/link inputs are replayed as-is.
+    Returns per-combination counters (C,).
+    '''
+    C = len(grid["ttc_min"])
+    ttc_min, th_min, gap_min = grid["ttc_min"], grid["th_min"], grid["gap_min"]
+    pdr_min, lat_max, strict, cooldown = grid["pdr_min"], grid["lat_max"], grid["strict_factor"], grid["cooldown_s"]
+    p_coll_max = grid["p_coll_max"]
+
+    t_all = log["t"]
+    n_egos = int(log["ego"].max()) + 1 if len(t_all) else 0
+    last = np.full((n_egos, C), -1e9)
+    zeros = lambda: np.zeros(C, dtype=np.int64)
+    out = {"n": zeros(), "execute": zeros(), "defer": zeros(), "cancel": zeros(), "cooldown": zeros(),
+           "conflict": zeros(), "lane_changes": zeros(), "risky_lc": zeros(),
+           "lc_min_ttc": np.full(C, np.inf), "lc_min_gap": np.full(C, np.inf)}
+
+    bounds = np.flatnonzero(np.diff(t_all)) + 1
+    for a, b in zip(np.r_[0, bounds], np.r_[bounds, len(t_all)]):
+        t = t_all[a]
+        e = log["ego"][a:b]
+        ttc, th, gap = log["min_ttc"][a:b, None], log["min_th"][a:b, None], log["gap_min"][a:b, None]
+
+        degraded = (log["pdr"][a:b, None] < pdr_min) | (log["lat_p95"][a:b, None] > lat_max)
+        f = np.where(degraded, strict, 1.0)
+        p_unsafe = (p_coll_max < 1.0) & (log["p_coll"][a:b, None] > p_coll_max / f)     # >= 1.0: gate off
+        unsafe = (gap < gap_min * f) | (ttc < ttc_min * f) | (th < th_min * f) | p_unsafe
+        in_cd = (t - last[e]) < cooldown
+        act = np.where(in_cd, DEFER, np.where(unsafe, CANCEL, np.where(log["coord_ok"][a:b, None], EXECUTE, DEFER)))
+
+        lc = (act == EXECUTE) & log["change"][a:b, None]
+        last[e] = np.where(lc, t, last[e])
+
+        out["n"] += b - a
+        out["execute"] += (act == EXECUTE).sum(0)
+        out["defer"] += (act == DEFER).sum(0)
+        out["cancel"] += (act == CANCEL).sum(0)
+        out["cooldown"] += in_cd.sum(0)
+        out["conflict"] += ((act == DEFER) & ~in_cd).sum(0)
+        out["lane_changes"] += lc.sum(0)
+        out["risky_lc"] += (lc & ((ttc < near_miss_ttc) | (gap < near_miss_gap))).sum(0)
+        out["lc_min_ttc"] = np.minimum(out["lc_min_ttc"], np.where(lc, ttc, np.inf).min(0))
+        out["lc_min_gap"] = np.minimum(out["lc_min_gap"], np.where(lc, gap, np.inf).min(0))
+        if actions_out is not None:
+            actions_out[a:b] = act
+    return out
+
+def merge(acc: Optional[Dict[str, np.ndarray]], part: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    if acc is None:
+        return part
+    for k, v in part.items():
+        acc[k] = np.minimum(acc[k], v) if k.startswith("lc_min_") else acc[k] + v
+    return acc
+
+def summarize(grid: Dict[str, np.ndarray], counts: Dict[str, np.ndarray]) -> pd.DataFrame:
+    n = np.maximum(counts["n"], 1)
+    lcs = counts["lane_changes"]
+    df = pd.DataFrame({p: grid[p] for p in PARAMS})
+    df["exec_rate"] = counts["execute"] / n
+    df["defer_rate"] = counts["defer"] / n
+    df["cancel_rate"] = counts["cancel"] / n
+    df["cooldown_rate"] = counts["cooldown"] / n
+    df["conflict_rate"] = counts["conflict"] / n
+    df["lane_changes"] = lcs
+    df["risky_lc"] = counts["risky_lc"]
+    df["risky_lc_rate"] = np.where(lcs > 0, counts["risky_lc"] / np.maximum(lcs, 1), 0.0)
+    df["lc_min_ttc"] = np.where(lcs > 0, counts["lc_min_ttc"], np.nan)
+    df["lc_min_gap"] = np.where(lcs > 0, counts["lc_min_gap"], np.nan)
+    return df
+
+def sweep(run_dirs: List[Path], base: Dict[str, float], axes: Dict[str, np.ndarray], near_miss_ttc: float = 1.5,
+          near_miss_gap: float = 2.0, chunk: int = 20000, dt: float = 0.1) -> pd.DataFrame:
+    '''Replays every run's decision log under each combination (in chunks of `chunk` combinations).'''
+    grid = make_grid(base, axes)
+    C = len(grid["ttc_min"])
+    logs = [load_decision_log(d, dt) for d in run_dirs]
+    parts = []
+    for c0 in range(0, C, chunk):
+        g = {p: v[c0:c0 + chunk] for p, v in grid.items()}
+        acc = None
+        for log in logs:
+            acc = merge(acc, replay(log, g, near_miss_ttc, near_miss_gap))
+        parts.append(summarize(g, acc))
+    return pd.concat(parts, ignore_index=True)
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline SafeMOBILComm threshold sweep over logged actions.csv inputs")
+    ap.add_argument("--run_dir", nargs="+", required=True, help="run directories (actions.csv); counts are pooled")
+    ap.add_argument("--cfg", default=None, help="base parameters (default: first run's config_resolved.yaml)")
+    ap.add_argument("--grid", nargs="*", default=[],
+                    help="param=values, values as a,b,c or start:stop:num; params: " + ", ".join(PARAMS))
+    ap.add_argument("--near_miss_ttc", type=float, default=None)
+    ap.add_argument("--near_miss_gap", type=float, default=None)
+    ap.add_argument("--chunk", type=int, default=20000, help="combinations replayed per batch (bounds memory)")
+    ap.add_argument("--out", default=None, help="default: <first run_dir>/threshold_sweep.csv")
+    args = ap.parse_args()
+
+    run_dirs = [Path(d) for d in args.run_dir]
+    cfg = load_yaml(args.cfg or str(run_dirs[0] / "config_resolved.yaml"))
+    ctrl = SafeMOBILComm(**cfg["algo"]["controller"])
+    base = {p: getattr(ctrl, p) for p in PARAMS}
+    dt = float(cfg["sim"]["dt"])
+    ev = cfg.get("eval", {})
+    ttc_thr = args.near_miss_ttc if args.near_miss_ttc is not None else float(ev.get("near_miss_ttc", 1.5))
+    gap_thr = args.near_miss_gap if args.near_miss_gap is not None else float(ev.get("near_miss_gap", 2.0))
+
+    axes = {}
+    for item in args.grid:
+        p, spec = item.split("=", 1)
+        if p not in PARAMS:
+            raise SystemExit(f"unknown parameter {p!r}; choose from {PARAMS}")
+        axes[p] = parse_axis(spec)
+
+    # Sanity check: the run's own thresholds must reproduce its logged actions
+    for d in run_dirs:
+        log = load_decision_log(d, dt)
+        acts = np.empty((len(log["t"]), 1), dtype=np.int8)
+        replay(log, make_grid(base, {}), ttc_thr, gap_thr, actions_out=acts)
+        agree = float((acts[:, 0] == log["action"]).mean()) if len(acts) else 1.0
+        print(f"[INFO] {d}: replay of base thresholds matches {agree:.1%} of {len(acts)} logged actions")
+
+    t0 = time.perf_counter()
+    df = sweep(run_dirs, base, axes, ttc_thr, gap_thr, chunk=args.chunk, dt=dt)
+    elapsed = time.perf_counter() - t0
+
+    out = Path(args.out) if args.out else run_dirs[0] / "threshold_sweep.csv"
+    df.to_csv(out, index=False)
+    print(f"[OK] {len(df)} combinations x {len(run_dirs)} run(s) in {elapsed:.2f}s -> {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import Optional
+
+CKPT_VERSION = 1
+SUMO_STATE = "sumo_state.xml.gz"
+PY_STATE = "state.pkl"
+
+def save_checkpoint(ckpt_dir, sumo, state: dict, keep_siblings: Optional[int] = None):
+    '''
+    Writes a checkpoint directory: SUMO's saveState plus the pickled Python-side
+    state (trackers, neighbor tables, intents, cooldowns, packet cursor, ...).
+    Built in a temp dir and renamed, so a crash mid-write never leaves a torn checkpoint.
+    keep_siblings: keep only the newest N checkpoints in the parent directory.
+    '''
+    ckpt_dir = Path(ckpt_dir).resolve()
+    ckpt_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ckpt_dir.parent / f".{ckpt_dir.name}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    sumo.save_state(tmp / SUMO_STATE)
+    with open(tmp / PY_STATE, "wb") as f:
+        pickle.dump(dict(state, version=CKPT_VERSION), f, protocol=pickle.HIGHEST_PROTOCOL)
+    shutil.rmtree(ckpt_dir, ignore_errors=True)
+    os.replace(tmp, ckpt_dir)
+
+    if keep_siblings:
+        done = sorted((p for p in ckpt_dir.parent.iterdir() if p.is_dir() and (p / PY_STATE).exists()),
+                      key=lambda p: p.stat().st_mtime)
+        for old in done[:-int(keep_siblings)]:
+            shutil.rmtree(old, ignore_errors=True)
+
+def load_checkpoint(ckpt_dir) -> dict:
+    p = Path(ckpt_dir) / PY_STATE
+    if not p.exists():
+        raise FileNotFoundError(f"not a checkpoint directory: {ckpt_dir}")
+    with open(p, "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != CKPT_VERSION:
+        raise ValueError(f"checkpoint version {state.get('version')} != {CKPT_VERSION}: {ckpt_dir}")
+    return state
+
+def restore_sumo(sumo, ckpt_dir):
+    sumo.load_state(Path(ckpt_dir).resolve() / SUMO_STATE)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+import gc
+import multiprocessing as mp
+import zlib
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from python.sumo.lane_topology import lane_to_edge
+
+def edge_partition(lane_id: str, n_workers: int) -> int:
+    '''Worker owning the AVs on this lane's edge (stable across processes, unlike hash()).'''
+    return zlib.crc32(lane_to_edge(lane_id).encode()) % n_workers
+
+def _worker(conn, wid: int, cfg: dict, dt: float, pred_log_h: int, packets_csv: str, tx_csv: str,
+            shm_name: str, n_nodes: int, init_state: Optional[dict] = None):
+    from python.orchestrators.orchestrator_step7_laneaware_closedloop import Step7Decider, MEMORY_PARTS
+    from python.utils.memory import rss_bytes
+    from python.comm.trace_cache import load_comm_trace
+    from python.comm.true_kpis import TrueKpiComputer
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    owner = np.ndarray((n_nodes,), dtype=np.int32, buffer=shm.buf)
+    trace = load_comm_trace(packets_csv, tx_csv, cache=bool(cfg["sim"].get("trace_cache", True)))
+    kpi = TrueKpiComputer(packets_csv=packets_csv, tx_csv=tx_csv, window_s=cfg["algo"]["comm"]["window_s"], trace=trace)
+    decider = Step7Decider(cfg, dt, kpi, pred_log_h=pred_log_h)
+    if init_state is not None:
+        # every shard starts from the full snapshot; migration hands over the owned copy
+        decider.load_state(init_state, counters=(wid == 0))
+
+    def owns(rx):
+        return rx < n_nodes and owner[rx] == wid
+
+    try:
+        while True:
+            msg = conn.recv()
+            op = msg[0]
+            if op == "tick":
+                _, t, a, b, imports, jobs = msg
+                for st in imports:
+                    decider.import_ego(st)
+                decider.ingest(trace.rx, a, b, owns=owns)
+                out = []
+                for job in jobs:
+                    ego_id, ego_node, s = job[:3]
+                    out.append(decider.cached(t, ego_id, ego_node, s) or decider.decide(t, *job))
+                conn.send(out)
+            elif op == "state":
+                conn.send(decider.state())
+            elif op == "export":
+                conn.send([decider.export_ego(ego_id, ego_node) for ego_id, ego_node in msg[1]])
+            elif op == "memory":
+                out = {part: decider.memory_bytes(part) for part in MEMORY_PARTS}
+                out["rss"] = rss_bytes()
+                conn.send(out)
+            elif op == "evict":
+                n = decider.evict(msg[1], msg[2])
+                gc.collect()
+                conn.send(n)
+            elif op == "stop":
+                conn.send({"lazy": decider.dcache.stats() if decider.dcache is not None else None,
+                           "roi": decider.roi.stats() if decider.roi is not None else None})
+                return
+    finally:
+        del owner
+        shm.close()
+
+class DecisionPool:
+    '''
+    Step-7 decisions on `n_workers` processes, AVs partitioned by edge.
+    Each worker holds a Step7Decider shard: the trackers, neighbor tables,
+    cooldowns and cached decisions of the AVs it owns, plus a replica of the
+    intent registry. Workers read the RX stream straight from the memory-mapped
+    trace cache; a shared-memory owner array (node -> worker) tells each one
+    which receivers' tables to maintain. When an AV's edge maps to another
+    worker its state migrates there first, so results match the serial path.
+    '''
+    def __init__(self, n_workers: int, cfg: dict, dt: float, pred_log_h: int, packets_csv: str, tx_csv: str,
+                 n_nodes: int, init_state: Optional[dict] = None):
+        self.n = int(n_workers)
+        self.n_nodes = int(n_nodes)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(4, 4 * self.n_nodes))
+        self.owner = np.ndarray((self.n_nodes,), dtype=np.int32, buffer=self._shm.buf)
+        self.owner[:] = np.arange(self.n_nodes, dtype=np.int32) % self.n   # until an AV is first placed
+        self.migrations = 0
+
+        ctx = mp.get_context("spawn")
+        self._conns, self._procs = [], []
+        for wid in range(self.n):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_worker, name=f"step7-dec{wid}", daemon=True,
+                            args=(child, wid, cfg, dt, pred_log_h, packets_csv, tx_csv, self._shm.name, self.n_nodes,
+                                  init_state))
+            p.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(p)
+        self._pending: Optional[List[Tuple[int, int]]] = None
+
+    def submit(self, t: float, pk_range: Tuple[int, int], jobs: List[tuple]):
+        '''Dispatch one tick: RX rows [a, b) and decision jobs (ego_id, ego_node, s, legal_adj, lane_ctxs, refresh_link).'''
+        per_w: List[List[tuple]] = [[] for _ in range(self.n)]
+        where: List[Tuple[int, int]] = []
+        moves: Dict[int, List[Tuple[str, int, int]]] = {}
+        for job in jobs:
+            ego_id, ego_node, s = job[:3]
+            w = edge_partition(s.lane_id, self.n)
+            cur = int(self.owner[ego_node])
+            if cur != w:
+                moves.setdefault(cur, []).append((ego_id, ego_node, w))
+            where.append((w, len(per_w[w])))
+            per_w[w].append(job)
+
+        # migrate moved AVs (their old owner has ingested everything up to the previous tick)
+        imports: List[list] = [[] for _ in range(self.n)]
+        for src, mv in moves.items():
+            self._conns[src].send(("export", [(ego_id, ego_node) for ego_id, ego_node, _ in mv]))
+        for src, mv in moves.items():
+            for st, (_, ego_node, dst) in zip(self._conns[src].recv(), mv):
+                imports[dst].append(st)
+                self.owner[ego_node] = dst
+                self.migrations += 1
+
+        a, b = pk_range
+        for w, conn in enumerate(self._conns):
+            conn.send(("tick", t, a, b, imports[w], per_w[w]))
+        self._pending = where
+
+    def collect(self) -> list:
+        '''Results of the last submit(), in job order.'''
+        outs = [conn.recv() for conn in self._conns]
+        where, self._pending = self._pending, None
+        return [outs[w][i] for w, i in where]
+
+    def state(self, node_of) -> dict:
+        '''Step7Decider.state() merged over workers, each AV's entries taken from its owner.'''
+        for conn in self._conns:
+            conn.send(("state",))
+        parts = [conn.recv() for conn in self._conns]
+
+        def owner_of_node(node):
+            return int(self.owner[node]) if 0 <= node < self.n_nodes else 0
+
+        def merge(key, owner_of):
+            out = {}
+            for w, st in enumerate(parts):
+                for k, v in st[key].items():
+                    if owner_of(k) == w:
+                        out[k] = v
+            return out
+
+        by_ego = lambda ego_id: owner_of_node(node_of(ego_id))
+        merged = {"trackers": merge("trackers", by_ego), "last_exec": merge("last_exec", by_ego),
+                  "nb_tables": merge("nb_tables", owner_of_node), "link_cache": merge("link_cache", owner_of_node),
+                  "intents": parts[0]["intents"], "dcache": None, "roi": None}
+        if parts[0]["dcache"] is not None:
+            entries, evaluated, skipped, reasons = {}, 0, 0, {}
+            for w, st in enumerate(parts):
+                e, ev, sk, rs = st["dcache"]
+                entries.update({k: v for k, v in e.items() if by_ego(k) == w})
+                evaluated += ev
+                skipped += sk
+                for r, c in rs.items():
+                    reasons[r] = reasons.get(r, 0) + c
+            merged["dcache"] = (entries, evaluated, skipped, reasons)
+        if parts[0].get("roi") is not None:
+            merged["roi"] = {k: sum(st["roi"][k] for st in parts) for k in parts[0]["roi"]}
+        return merged
+
+    def memory(self) -> Dict[str, int]:
+        '''Step7Decider.memory_bytes() per part and the RSS ("rss"), summed over workers.'''
+        for conn in self._conns:
+            conn.send(("memory",))
+        out: Dict[str, int] = {}
+        for conn in self._conns:
+            for k, v in conn.recv().items():
+                out[k] = out.get(k, 0) + int(v)
+        return out
+
+    def evict(self, t: float, max_age_s: float) -> int:
+        '''Step7Decider.evict() on every worker; returns the total number of entries dropped.'''
+        for conn in self._conns:
+            conn.send(("evict", t, max_age_s))
+        return sum(int(conn.recv()) for conn in self._conns)
+
+    def close(self) -> List[Optional[dict]]:
+        '''Stops the workers; returns their {"lazy": DecisionCache stats, "roi": RoiGate stats} (None when off).'''
+        stats = []
+        for conn, p in zip(self._conns, self._procs):
+            try:
+                if self._pending is not None:
+                    conn.recv()
+                conn.send(("stop",))
+                stats.append(conn.recv())
+            except (EOFError, OSError, BrokenPipeError):
+                stats.append(None)
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        del self.owner
+        self._shm.close()
+        self._shm.unlink()
+        return stats
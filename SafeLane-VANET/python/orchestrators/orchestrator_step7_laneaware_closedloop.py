@@ -1,23 +1,44 @@
 from __future__ import annotations
+import argparse
 import os
 import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-import pandas as pd
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 
 from python.utils.config import load_yaml, make_run_dir, save_resolved_config
-from python.utils.logger import CsvLogger
+from python.utils.logger import open_csv_logger
+from python.utils.action_log import RleActionLogger, SPAN_FIELDS
 from python.utils.idmap import VehNodeMap
+from python.utils.scheduler import MultiRateScheduler
+from python.utils.memory import MemoryMonitor, dict_bytes
 
-from python.sumo.traci_adapter import SumoAdapter
+from python.sumo.traci_adapter import make_adapter, VehicleState
 from python.sumo.lane_topology import lane_to_edge, build_legal_adj_same_edge
-from python.sumo.neighborhood import build_lane_contexts
+from python.sumo.neighborhood import build_lane_contexts, LaneContext
+from python.sumo.lane_index import load_lane_index
 
 from python.core.lanemark_detect import LaneMarkDetect, EgoState
 from python.core.neighbor_table import NeighborTable
-from python.core.trajguard_ekf import TrajGuardEKF
+from python.core.trajguard_ekf import TrajGuardEKF, Track
 from python.core.safemobil_comm import SafeMOBILComm, CommKpis, PredRisk
+from python.core.decision_cache import DecisionCache, write_stats_json
+from python.core.roi_gate import RoiGate, write_roi_stats
+from python.core.mc_risk import McRiskEstimator
 from python.comm.rx_intents import RxIntentRegistry
 from python.comm.true_kpis import TrueKpiComputer
+from python.comm.trace_cache import load_comm_trace
+from python.comm.live_ring import RingSource, FileSource, LiveTrace
+from python.comm.intent_export import IntentScheduleWriter
+from python.experiments.prediction_metrics import OnlinePredEvaluator
+from python.experiments.kpi_accumulators import RunKpiAccumulator
+from python.experiments.sumo_safety_events import GtSafetyMonitor, SAFETY_EVENT_FIELDS
+from python.orchestrators.decision_pool import DecisionPool
+from python.orchestrators.checkpoint import save_checkpoint, load_checkpoint, restore_sumo
+from python.orchestrators.realtime import RealtimePacer, DEADLINE_MISS_FIELDS
 
 # Ablations (env)
 ABL_NO_PRED   = os.getenv("SAFE_NO_PRED", "0") == "1"
@@ -25,6 +46,21 @@ ABL_NO_INTENT = os.getenv("SAFE_NO_INTENT", "0") == "1"
 ABL_NON_ADAPT = os.getenv("SAFE_NON_ADAPT", "0") == "1"
 ABL_MOBIL_ONLY= os.getenv("SAFE_MOBIL_ONLY", "0") == "1"
 RUN_TAG       = os.getenv("SAFE_TAG", "step7")
+RUN_DIR       = os.getenv("SAFE_RUN_DIR", "")     # explicit output dir (drivers launching runs in parallel)
+SEED          = os.getenv("SAFE_SEED", "")        # overrides sim.seed (SUMO --seed)
+# Intent-only planning pass: writes paths.intent_csv for ns-3, no run logs / evaluation
+INTENT_ONLY   = os.getenv("SAFE_INTENT_ONLY", "0") == "1"
+
+# Warm start (env): SAFE_WARMUP_S=<s> simulates a sensing-only prefix and checkpoints it
+# to SAFE_CHECKPOINT; SAFE_RESUME=<checkpoint dir> starts from a checkpoint
+WARMUP_S      = float(os.getenv("SAFE_WARMUP_S", "0") or 0)
+CKPT_OUT      = os.getenv("SAFE_CHECKPOINT", "")
+RESUME_FROM   = os.getenv("SAFE_RESUME", "")
+
+ACTION_FIELDS = ["t","ego_id","ego_node","curr_lane","target_lane","target_lane_idx",
+                 "action","reason","pdr","lat_p95","min_ttc","min_th","gap_min","coord_ok"]
+# decision state reported per part in memory.csv (Step7Decider.memory_bytes)
+MEMORY_PARTS = ("tracks","neighbors","intents","decision_cache")
 
 def lane_idx_from_lane_id(lane_id: str) -> int:
     if isinstance(lane_id, str) and "_" in lane_id:
@@ -36,10 +72,450 @@ def projected_gap(ex, ey, epsi, nx, ny):
     ux, uy = math.cos(epsi), math.sin(epsi)
     return ux * (nx - ex) + uy * (ny - ey)
 
+@dataclass
+class AvDecision:
+    row: dict                                   # actions.csv row
+    change_to: Optional[str] = None             # lane-change command for SUMO
+    pred: Optional[Tuple[int, list]] = None     # (track_node, [(t, x, y), ...]) for prediction metrics
+
+class Step7Decider:
+    '''
+    Per-AV Step-7 decision logic: lane scoring -> link KPIs -> tracking ->
+    coordination -> risk -> SafeMOBIL-Comm. It makes no TraCI calls: SUMO-side
+    inputs (state, legal lanes, lane contexts) are prefetched by the loop and
+    lane-change commands are returned, so SUMO can advance while it runs.
+    All per-AV state is keyed by the ego (own tracker, neighbor table, cooldown,
+    link KPIs, cached decision), so AVs can be split across DecisionPool workers.
+    '''
+    def __init__(self, cfg: dict, dt: float, kpi: TrueKpiComputer, pred_log_h: int = 10):
+        self.dt = float(dt)
+        self.kpi = kpi
+        self.pred_log_h = int(pred_log_h)
+
+        self.laner = LaneMarkDetect(**cfg["algo"]["lanemark"])
+        self.ekf_kw = dict(cfg["algo"]["ekf"])
+        self.dt_pred = TrajGuardEKF(**self.ekf_kw).dt_pred
+        self.ctrl  = SafeMOBILComm(**cfg["algo"]["controller"])
+        self.intents = RxIntentRegistry(ttl_s=cfg["algo"]["controller"].get("coord_window", 0.4))
+
+        # Lazy re-evaluation: clean AVs reuse their cached decision
+        lazy_cfg = cfg["algo"].get("lazy") or {}
+        self.dcache = None
+        if lazy_cfg.get("enabled", False):
+            self.dcache = DecisionCache(cooldown_s=self.ctrl.cooldown_s,
+                                        dv_thr=lazy_cfg.get("dv_thr", 0.5),
+                                        max_age_s=lazy_cfg.get("max_age_s", 1.0))
+
+        # ROI gating: only neighbors near the ego's candidate lanes are tracked
+        roi_cfg = cfg["algo"].get("roi") or {}
+        self.roi = None
+        if roi_cfg.get("enabled", False):
+            self.roi = RoiGate(ahead_m=roi_cfg.get("ahead_m", 150.0),
+                               behind_m=roi_cfg.get("behind_m", 50.0),
+                               lateral_m=roi_cfg.get("lateral_m", 8.0),
+                               max_heading_deg=roi_cfg.get("max_heading_deg", 90.0),
+                               reseed_s=roi_cfg.get("reseed_s", 2.0))
+
+        # Monte Carlo risk: sampled lead-track hypotheses -> p_coll and TTC/TH/gap quantiles
+        mc_cfg = dict(cfg["algo"].get("mc_risk") or {})
+        self.mc = None
+        if mc_cfg.pop("enabled", False):
+            self.mc = McRiskEstimator(horizon_s=self.ekf_kw.get("horizon_s", 2.5), dt_pred=self.dt_pred, **mc_cfg)
+
+        # Lane index: along-lane (Frenet) gaps instead of projections on the ego heading
+        self.lanes = None
+        if (cfg["algo"].get("lane_index") or {}).get("enabled", False):
+            self.lanes = load_lane_index(cfg)
+
+        # State
+        self.trackers: Dict[str, TrajGuardEKF] = {}     # ego_id -> the AV's own tracks of its neighbors
+        self.nb_tables: Dict[int, NeighborTable] = {}   # receiver_node -> NeighborTable
+        self.last_exec: Dict[str, float] = {}           # ego_id -> time
+        self.link_cache = {}                            # ego_node -> last RxKpis (refreshed at link_kpi rate)
+        self.lane_changes_count = 0
+
+    def memory_bytes(self, part: str) -> int:
+        '''Size estimate of one part of the decision state (MEMORY_PARTS), for MemoryMonitor.'''
+        if part == "tracks":
+            return sum(ekf.memory_bytes() for ekf in self.trackers.values())
+        if part == "neighbors":
+            return sum(nb.memory_bytes() for nb in self.nb_tables.values())
+        if part == "intents":
+            return self.intents.memory_bytes()
+        if part == "decision_cache":
+            return dict_bytes(self.dcache.entries) if self.dcache is not None else 0
+        raise KeyError(part)
+
+    def evict(self, t: float, max_age_s: float) -> int:
+        '''
+        Frees state not refreshed for max_age_s (memory ceiling): tracks and
+        neighbor entries of senders not heard since, expired intents, and
+        trackers / tables left empty. Returns the number of entries dropped.
+        '''
+        before = t - float(max_age_s)
+        n = 0
+        for ego_id, ekf in list(self.trackers.items()):
+            n += ekf.evict(before)
+            if not ekf.tracks:
+                del self.trackers[ego_id]
+        for node, nb in list(self.nb_tables.items()):
+            n += nb.evict(before)
+            if not len(nb):
+                del self.nb_tables[node]
+        return n + self.intents.prune(t)
+
+    def ingest(self, pk: Dict[str, np.ndarray], a: int, b: int, owns=None):
+        '''
+        Apply RX rows [a, b) of the trace cache. With `owns` (receiver -> bool),
+        only owned receivers' neighbor tables are updated; received intents feed
+        the (global) intent registry either way.
+        '''
+        sl = slice(a, b)
+        for tx, rx, t_rx, x, y, v, psi, lane_idx, msg_type, tgt_lane, dropped in zip(
+                *(pk[c][sl].tolist() for c in ("sender_id","receiver_id","t_rx","x","y","v","psi",
+                                               "lane_idx","msg_type","target_lane_idx","dropped"))):
+            if dropped != 0:
+                continue
+
+            if owns is None or owns(rx):
+                nb = self.nb_tables.get(rx)
+                if nb is None:
+                    nb = NeighborTable()
+                    self.nb_tables[rx] = nb
+
+                nb.update(
+                    sender_node=tx,
+                    rx_t=t_rx,
+                    x=x, y=y,
+                    v=v, psi=psi,
+                    lane_idx=lane_idx,
+                    msg_type=msg_type,
+                    target_lane_idx=tgt_lane
+                )
+
+            if msg_type == 2 and tgt_lane >= 0:
+                self.intents.update(sender=tx, t_rx=t_rx, target_lane_idx=tgt_lane)
+
+    def tracker(self, ego_id: str) -> TrajGuardEKF:
+        ekf = self.trackers.get(ego_id)
+        if ekf is None:
+            ekf = self.trackers[ego_id] = TrajGuardEKF(**self.ekf_kw)
+        return ekf
+
+    def export_ego(self, ego_id: str, ego_node: int) -> dict:
+        '''Detach one AV's state (for migration to another worker).'''
+        st = {"ego_id": ego_id, "ego_node": ego_node,
+              "tracker": self.trackers.pop(ego_id, None),
+              "nb": self.nb_tables.pop(ego_node, None),
+              "last_exec": self.last_exec.pop(ego_id, None),
+              "link": self.link_cache.pop(ego_node, None),
+              "cached": None}
+        if self.dcache is not None:
+            st["cached"] = self.dcache.entries.pop(ego_id, None)
+        return st
+
+    def import_ego(self, st: dict):
+        ego_id, ego_node = st["ego_id"], st["ego_node"]
+        for d, key, val in ((self.trackers, ego_id, st["tracker"]), (self.nb_tables, ego_node, st["nb"]),
+                            (self.last_exec, ego_id, st["last_exec"]), (self.link_cache, ego_node, st["link"])):
+            if val is not None:
+                d[key] = val
+        if self.dcache is not None and st["cached"] is not None:
+            self.dcache.entries[ego_id] = st["cached"]
+
+    def cached(self, t: float, ego_id: str, ego_node: int, s: VehicleState) -> Optional[AvDecision]:
+        '''Cached decision re-stamped at t when the AV is clean; None when it must be evaluated.'''
+        if self.dcache is None:
+            return None
+        reason = self.dcache.dirty_reason(ego_id, t, s.lane_id, s.v,
+                                          self.last_exec.get(ego_id, -1e9), self.nb_tables.get(ego_node))
+        hit = self.dcache.lookup(ego_id, reason)
+        if hit is None:
+            return None
+        return AvDecision(row=dict(hit.row, t=round(t,3)))
+
+    def _link(self, t: float, ego_node: int, refresh_link: bool) -> CommKpis:
+        link = self.link_cache.get(ego_node)
+        if link is None or refresh_link:
+            link = self.kpi.get(receiver_id=ego_node, t_end=t)
+            self.link_cache[ego_node] = link
+        return CommKpis(pdr=link.pdr, lat_p95=link.lat_p95)
+
+    def _step_track(self, ekf: TrajGuardEKF, tx_node: int, st, t: float, pdr: float):
+        veh_id = str(tx_node)
+        if self.roi is not None:
+            tr = ekf.tracks.get(veh_id)
+            if tr is not None and t - tr.t > self.roi.reseed_s:
+                del ekf.tracks[veh_id]         # long outside the ROI: restart from the beacon
+                self.roi.reseeded += 1
+        ekf.step_track(
+            veh_id=veh_id,
+            now=t,
+            z_xyvpsi=(st.x, st.y, st.v, st.psi),
+            age=st.age,
+            pdr=pdr,
+            dt=self.dt
+        )
+
+    def _track(self, t: float, ego_id: str, ego_node: int, pdr: float, track: bool = True,
+               s: Optional[VehicleState] = None, legal_adj: Optional[Dict[str, List[str]]] = None):
+        nb = self.nb_tables.get(ego_node)
+        neighbor_nodes = set()
+        if nb is not None:
+            ekf = self.tracker(ego_id)
+            nb.refresh_ages(t)
+            roi = self.roi if s is not None else None
+            along = {}
+            if roi is not None:
+                cand = legal_adj.get(s.lane_id, [s.lane_id]) if legal_adj is not None else [s.lane_id]
+                frame = roi.frame(s.x, s.y, s.psi, (lane_idx_from_lane_id(ln) for ln in cand))
+                if track and self.lanes is not None and s.lane_id in self.lanes.lane_pos and len(nb.entries):
+                    # window in lane coordinates of the ego's lane (follows curves), senders in one call
+                    nodes = list(nb.entries)
+                    fr = self.lanes.project([s.x] + [nb.entries[n].x for n in nodes],
+                                            [s.y] + [nb.entries[n].y for n in nodes], lane=s.lane_id, extend=True)
+                    lon = self.lanes.along(s.lane_id, fr.s[0], fr.s[1:])
+                    along = dict(zip(nodes, zip(lon.tolist(), (fr.d[1:] - fr.d[0]).tolist())))
+            for tx_node, st in nb.items():
+                neighbor_nodes.add(tx_node)
+                if track:
+                    if roi is not None:
+                        if not roi.contains(frame, st, along.get(tx_node)):
+                            roi.gated += 1
+                            continue
+                        roi.tracked += 1
+                    self._step_track(ekf, tx_node, st, t, pdr)
+        return nb, neighbor_nodes
+
+    def sense(self, t: float, ego_id: str, ego_node: int, refresh_link: bool = True,
+              s: Optional[VehicleState] = None, legal_adj: Optional[Dict[str, List[str]]] = None):
+        '''Warm-up step: link KPIs + neighbor tracking only, no decision (variant-independent).'''
+        comm = self._link(t, ego_node, refresh_link)
+        self._track(t, ego_id, ego_node, comm.pdr, s=s, legal_adj=legal_adj)
+
+    def state(self) -> dict:
+        '''Picklable snapshot of all decision state (for checkpoints).'''
+        dc = self.dcache
+        return {"trackers": self.trackers, "nb_tables": self.nb_tables, "intents": self.intents,
+                "last_exec": self.last_exec, "link_cache": self.link_cache,
+                "dcache": None if dc is None else (dc.entries, dc.evaluated, dc.skipped, dc.reasons),
+                "roi": None if self.roi is None else self.roi.stats()}
+
+    def load_state(self, st: dict, counters: bool = True):
+        self.trackers = st["trackers"]
+        self.nb_tables = st["nb_tables"]
+        self.intents = st["intents"]
+        self.last_exec = st["last_exec"]
+        self.link_cache = st["link_cache"]
+        if self.dcache is not None and st["dcache"] is not None:
+            entries, evaluated, skipped, reasons = st["dcache"]
+            self.dcache.entries = entries
+            if counters:
+                self.dcache.evaluated, self.dcache.skipped, self.dcache.reasons = evaluated, skipped, dict(reasons)
+        if self.roi is not None and st.get("roi") and counters:
+            for k, v in st["roi"].items():
+                setattr(self.roi, k, v)
+
+    def _lane_frame(self, lane: str, tr: Track, s: VehicleState) -> Tuple[Track, Tuple[float, float, float, float]]:
+        '''
+        Lead track and ego on `lane` straightened: the ego at the origin heading
+        along +x, the leader at its along-lane gap moving along the lane, so
+        rollouts and risk measure the same gaps as the leader choice.
+        '''
+        fr = self.lanes.project([s.x, tr.x], [s.y, tr.y], lane=lane, extend=True)
+        gap = float(self.lanes.along(lane, fr.s[0], fr.s[1]))
+        return Track(x=gap, y=0.0, v=tr.v, psi=0.0, t=tr.t, spread=tr.spread), (0.0, 0.0, s.v, 0.0)
+
+    def decide(self, t: float, ego_id: str, ego_node: int, s: VehicleState,
+               legal_adj: Dict[str, List[str]], lane_ctxs: Dict[str, LaneContext],
+               refresh_link: bool = True) -> AvDecision:
+        ekf = self.tracker(ego_id)
+        cand_lanes = legal_adj.get(s.lane_id, [s.lane_id])
+
+        # Lane scoring
+        penalty_by_lane = {ln: 0.0 for ln in cand_lanes}
+        ego = EgoState(veh_id=ego_id, x=s.x, y=s.y, v=s.v, psi=s.psi, lane_id=s.lane_id)
+        ranked, target_lane = self.laner.run(ego, legal_adj, lane_ctxs, penalty_by_lane)
+        target_lane_idx = lane_idx_from_lane_id(target_lane)
+
+        # True comm KPIs (receiver-centric)
+        comm = self._link(t, ego_node, refresh_link)
+
+        if ABL_NON_ADAPT or ABL_MOBIL_ONLY:
+            comm = CommKpis(pdr=1.0, lat_p95=0.0)
+
+        # Neighbor table update + tracking
+        nb, neighbor_nodes = self._track(t, ego_id, ego_node, comm.pdr,
+                                         track=not (ABL_NO_PRED or ABL_MOBIL_ONLY), s=s, legal_adj=legal_adj)
+
+        # Coordination from received LCI only
+        if ABL_NO_INTENT or ABL_MOBIL_ONLY or target_lane == s.lane_id:
+            coord_ok = True
+        else:
+            conflict = self.intents.has_conflict(t, neighbor_nodes, target_lane_idx, ego_node)
+            coord_ok = not conflict
+
+        # Leader/follower on target lane using lane_idx match
+        lead_track = None
+        best_ahead = float("inf")
+
+        lane_frame = self.lanes is not None and target_lane in self.lanes.lane_pos
+
+        if nb is not None and target_lane_idx >= 0:
+            cands = [(tx_node, st) for tx_node, st in nb.items() if st.lane_idx == target_lane_idx]
+            if lane_frame and cands:
+                # along-lane gaps: ego and beacons projected onto the target lane's centerline in one call
+                # (past the lane's end along its tangent, e.g. a leader already on the next edge)
+                fr = self.lanes.project([s.x] + [st.x for _, st in cands], [s.y] + [st.y for _, st in cands],
+                                        lane=target_lane, extend=True)
+                gaps = np.where(fr.dist[1:] <= self.lanes.radius,
+                                self.lanes.along(target_lane, fr.s[0], fr.s[1:]), -np.inf).tolist()
+            else:
+                gaps = [projected_gap(s.x, s.y, s.psi, st.x, st.y) for _, st in cands]
+            for (tx_node, _), g in zip(cands, gaps):
+                if g > 0 and g < best_ahead:
+                    best_ahead = g
+                    lead_track = str(tx_node)
+
+        # Risk
+        pred = None
+        p_coll = 0.0
+        if ABL_NO_PRED or ABL_MOBIL_ONLY:
+            if best_ahead == float("inf"):
+                min_ttc, min_th, gap_min = 0.0, 0.0, 0.0
+            else:
+                gap_min = float(best_ahead)
+                closing = max(0.1, s.v)
+                min_ttc = gap_min / closing
+                min_th  = gap_min / max(0.1, s.v)
+        else:
+            if self.roi is not None and lead_track:
+                tr = ekf.tracks.get(lead_track)
+                if tr is None or tr.t < t:
+                    # leader outside the window this tick: catch its track up on demand
+                    self._step_track(ekf, int(lead_track), nb.entries[int(lead_track)], t, comm.pdr)
+                    self.roi.caught_up += 1
+            if lead_track and lead_track in ekf.tracks:
+                tr = ekf.tracks[lead_track]
+                ego_xyvpsi = (s.x, s.y, s.v, s.psi)
+                traj = ekf.rollout_track(tr, ego_xyvpsi)
+
+                # Short rollout for prediction metrics (by time: adaptive rollouts are variable-step)
+                t_log = tr.t + self.pred_log_h * self.dt_pred + 1e-9
+                pred = (int(lead_track), [(p.t, p.x, p.y) for p in traj if p.t <= t_log])
+
+                if lane_frame:
+                    # risk in the frame the leader was chosen in: along the target lane
+                    tr, ego_xyvpsi = self._lane_frame(target_lane, tr, s)
+                    if self.mc is None:
+                        traj = ekf.rollout_track(tr, ego_xyvpsi)
+
+                if self.mc is not None:
+                    mc = self.mc.evaluate(tr, ego_xyvpsi)
+                    min_ttc, min_th, gap_min, p_coll = mc.min_ttc, mc.min_th, mc.gap_min, mc.p_coll
+                else:
+                    riskL = ekf.risk_vs_ego(ego_xyvpsi, traj)
+                    min_ttc = float(riskL.min_ttc)
+                    min_th  = float(riskL.min_th)
+                    gap_min = float(min(riskL.gap_profile)) if riskL.gap_profile else float("inf")
+            else:
+                min_ttc, min_th, gap_min = 0.0, 0.0, 0.0
+
+        if ABL_MOBIL_ONLY:
+            coord_ok = True
+
+        last_t = self.last_exec.get(ego_id, -1e9)
+        decision = self.ctrl.decide(
+            now=t,
+            last_exec_t=last_t,
+            risk=PredRisk(min_ttc=min_ttc, min_th=min_th, gap_min=gap_min, p_coll=p_coll),
+            comm=comm,
+            coord_ok=coord_ok
+        )
+
+        change_to = None
+        if decision.action == "EXECUTE" and target_lane != s.lane_id:
+            change_to = target_lane
+            self.last_exec[ego_id] = t
+            self.lane_changes_count += 1
+
+        row = {
+            "t": round(t,3),
+            "ego_id": ego_id,
+            "ego_node": ego_node,
+            "curr_lane": s.lane_id,
+            "target_lane": target_lane,
+            "target_lane_idx": target_lane_idx,
+            "action": decision.action,
+            "reason": decision.reason,
+            "pdr": comm.pdr,
+            "lat_p95": comm.lat_p95,
+            "min_ttc": min_ttc,
+            "min_th": min_th,
+            "gap_min": gap_min,
+            "coord_ok": int(coord_ok)
+        }
+        if self.mc is not None:
+            row["p_coll"] = p_coll
+        if self.dcache is not None:
+            self.dcache.store(ego_id, t, s.lane_id, s.v, self.last_exec.get(ego_id, -1e9),
+                              (lane_idx_from_lane_id(ln) for ln in cand_lanes), decision, row)
+        return AvDecision(row=row, change_to=change_to, pred=pred)
+
+def warm_up(cfg: dict, until_s: float, ckpt_dir, dt: float, trace, sched: MultiRateScheduler,
+            decider: Step7Decider, vehmap: Optional[VehNodeMap]):
+    '''
+    Sensing-only prefix: SUMO runs without decisions or actuation while the
+    decider ingests packets and keeps link KPIs, neighbor tables and trackers
+    current. Nothing here depends on the variant, so the prefix is simulated
+    once, checkpointed, and every variant resumes from it (SAFE_RESUME).
+    '''
+    pk = trace.rx
+    pk_idx = 0
+    t = 0.0
+    k = 0
+    sumo = make_adapter(cfg)
+    sumo.start()
+    try:
+        while t < until_s:
+            sumo.step()
+            pk_end = int(np.searchsorted(pk["t_rx"], t, side="right"))
+            decider.ingest(pk, pk_idx, pk_end)
+            pk_idx = pk_end
+            for ego_id in sumo.get_vehicle_ids():
+                if not ego_id.lower().startswith("av") or not sched.due("decision", k, ego_id):
+                    continue
+                ego_node = vehmap.node(ego_id) if vehmap else 0
+                s = legal_adj = None
+                if decider.roi is not None:
+                    s = sumo.get_state(ego_id)
+                    legal_adj = build_legal_adj_same_edge(lane_to_edge(s.lane_id), sumo=sumo)
+                decider.sense(t, ego_id, ego_node, sched.due("link_kpi", k, ego_node), s=s, legal_adj=legal_adj)
+            t += dt
+            k += 1
+        save_checkpoint(ckpt_dir, sumo, {"kind": "warmup", "t": t, "k": k, "pk_idx": pk_idx, "pending": [],
+                                         "sumo_ahead": 0, "sched": sched, "decider": decider.state()})
+    finally:
+        sumo.close()
+    print(f"[OK] warm-up checkpoint ({t:.1f}s) written to: {ckpt_dir}")
+
 def run(cfg_path: str):
     cfg = load_yaml(cfg_path)
-    run_dir = make_run_dir(cfg["paths"]["out_root"], cfg["sim"]["exp_name"] + f"_{RUN_TAG}")
-    save_resolved_config(cfg, run_dir)
+    if SEED:
+        cfg["sim"]["seed"] = int(SEED)
+
+    # Warm start: a "warmup" checkpoint forks a fresh run, a "periodic" one continues its own run
+    resume = load_checkpoint(RESUME_FROM) if RESUME_FROM else None
+    continuing = resume is not None and resume["kind"] == "periodic"
+    if continuing:
+        run_dir = Path(resume["run_dir"])
+    else:
+        if RUN_DIR:
+            run_dir = Path(RUN_DIR)
+            run_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            run_dir = make_run_dir(cfg["paths"]["out_root"], cfg["sim"]["exp_name"] + f"_{RUN_TAG}")
+        save_resolved_config(cfg, run_dir)
 
     dt = float(cfg["sim"]["dt"])
     T  = float(cfg["sim"]["duration"])
@@ -47,221 +523,411 @@ def run(cfg_path: str):
     packets_csv = cfg["paths"].get("packets_csv", "out/ns3/packets.csv")
     tx_csv      = cfg["paths"].get("tx_csv", "out/ns3/tx.csv")
 
+    ev_cfg       = cfg.get("eval", {})
+    online_pred  = bool(ev_cfg.get("online_pred", True))
+    log_rollouts = bool(ev_cfg.get("log_rollouts", False))
+    pred_log_h   = int(ev_cfg.get("pred_log_h", 10))
+    online_kpis  = bool(ev_cfg.get("online_kpis", True))
+    gt_safety    = bool(ev_cfg.get("gt_safety", True))
+    if INTENT_ONLY:
+        online_pred = log_rollouts = online_kpis = gt_safety = False
+
+    # Pipelined mode: SUMO advances in a worker thread while the previous step's
+    # decisions are computed; lane changes land `actuation_lag_steps` ticks later.
+    pipe_cfg  = cfg["sim"].get("pipeline") or {}
+    pipelined = bool(pipe_cfg.get("enabled", False))
+    lag       = max(1, int(pipe_cfg.get("actuation_lag_steps", 1))) if pipelined else 0
+    bg_logs   = pipelined and bool(pipe_cfg.get("async_logs", True))
+    log_queue = int(pipe_cfg.get("log_queue", 10000))
+    alog_cfg  = cfg["sim"].get("action_log") or {}
+    rle_actions = bool(alog_cfg.get("rle", False))
+
+    # Periodic checkpoints (restartable long runs)
+    ck_cfg   = cfg["sim"].get("checkpoint") or {}
+    ck_every = max(1, int(round(float(ck_cfg["every_s"]) / dt))) if ck_cfg.get("every_s") and not INTENT_ONLY else 0
+    ck_keep  = int(ck_cfg.get("keep", 2) or 0) or None
+
     # vehicle-node mapping (recommended)
     map_path = cfg["paths"].get("veh_to_node_csv", "out/ns3/veh_to_node.csv")
     vehmap = VehNodeMap(map_path) if Path(map_path).exists() else None
 
-    # Load ns-3 RX stream
-    pk = pd.read_csv(packets_csv)
-    for c in ["t_tx","t_rx","sender_id","receiver_id","msg_type","dropped","x","y","v","psi","lane_idx","target_lane_idx"]:
-        if c in pk.columns:
-            pk[c] = pd.to_numeric(pk[c], errors="coerce")
-    pk = pk.dropna(subset=["t_rx","sender_id","receiver_id","msg_type","x","y","v","psi","lane_idx","target_lane_idx"])
-    if "dropped" in pk.columns:
-        pk = pk[pk["dropped"] == 0]
-    pk = pk.sort_values("t_rx").reset_index(drop=True)
+    # Comm source: finished ns-3 logs, or a live shared-memory ring fed by a running network simulator
+    src_cfg = cfg["sim"].get("comm_source") or {}
+    live = src_cfg.get("kind", "file") == "ring"
+    if live and (RESUME_FROM or WARMUP_S > 0):
+        raise ValueError("sim.comm_source.kind ring: a live stream cannot be replayed (no warm-up / resume)")
+    if live and ck_every:
+        print("[WARN] sim.checkpoint needs a replayable comm trace; no checkpoints with sim.comm_source.kind ring")
+        ck_every = 0
+
+    # ns-3 logs: validated + indexed once, memory-mapped from the shared trace cache
+    if live:
+        # KPI windows over the records received so far
+        trace = LiveTrace(keep_s=cfg["algo"]["comm"]["window_s"])
+    elif INTENT_ONLY and not (Path(packets_csv).exists() and Path(tx_csv).exists()):
+        # no beacons -> no lead tracks -> min_ttc 0 -> every AV CANCELs: the schedule is empty by construction
+        schedule = IntentScheduleWriter(cfg["paths"].get("intent_csv", "out/ns3/intent.csv"))
+        schedule.close()
+        print(f"[WARN] no ns-3 logs at {packets_csv}: wrote an empty intent schedule to {schedule.path} "
+              f"(intents need received beacons; run ns-3 and repeat this pass)")
+        return
+    else:
+        trace = load_comm_trace(packets_csv, tx_csv, cache=bool(cfg["sim"].get("trace_cache", True)))
     pk_idx = 0
 
-    # Modules
-    laner = LaneMarkDetect(**cfg["algo"]["lanemark"])
-    ekf   = TrajGuardEKF(**cfg["algo"]["ekf"])
-    ctrl  = SafeMOBILComm(**cfg["algo"]["controller"])
-    intents = RxIntentRegistry(ttl_s=cfg["algo"]["controller"].get("coord_window", 0.4))
-    kpi = TrueKpiComputer(packets_csv=packets_csv, tx_csv=tx_csv, window_s=cfg["algo"]["comm"]["window_s"])
-
-    # State
-    nb_tables = {}      # receiver_node -> NeighborTable
-    last_exec = {}      # ego_id -> time
-    lane_changes_count = 0
+    # Task rates (SUMO runs every tick; slower tasks are decimated / AV-staggered)
+    rates = cfg["sim"].get("rates") or {}
+    sched = MultiRateScheduler(dt)
+    sched.register("decision", rates.get("decision_hz"))
+    sched.register("link_kpi", rates.get("link_kpi_hz"))
+    sched.register("mobility_log", rates.get("mobility_log_hz"))
 
-    # Logs
-    actionlog = CsvLogger(run_dir / "actions.csv",
-        ["t","ego_id","ego_node","curr_lane","target_lane","target_lane_idx",
-         "action","reason","pdr","lat_p95","min_ttc","min_th","gap_min","coord_ok"])
+    # Modules
+    kpi = TrueKpiComputer(packets_csv=packets_csv, tx_csv=tx_csv, window_s=cfg["algo"]["comm"]["window_s"], trace=trace)
+    decider = Step7Decider(cfg, dt, kpi, pred_log_h=pred_log_h)
 
-    moblog = CsvLogger(run_dir / "mobility.csv",
-        ["t","veh_id","x","y","v","psi","lane_id","road_id","is_av","node_id"])
+    if WARMUP_S > 0:
+        warm_up(cfg, min(WARMUP_S, T), CKPT_OUT or run_dir / "checkpoints" / "warmup", dt, trace, sched, decider, vehmap)
+        return
 
-    # Optional prediction rollout log
-    predlog = CsvLogger(run_dir / "pred_rollouts.csv", ["t","ego_node","track_id","h","px","py"])
+    t = 0.0
+    k = 0               # SUMO tick
+    sumo_ahead = 0      # ticks SUMO is already stepped past t (1 when a pipelined run checkpointed)
+    pending = deque()   # (apply_tick, ego_id, lane_id) lane-change commands awaiting actuation
+    if resume is not None:
+        t, k, pk_idx, sumo_ahead = resume["t"], resume["k"], resume["pk_idx"], resume["sumo_ahead"]
+        pending.extend(resume["pending"])
+        sched = resume["sched"]
+        decider.load_state(resume["decider"])
+        if sumo_ahead and not pipelined:
+            raise ValueError(f"{RESUME_FROM} was written by a pipelined run; resume with sim.pipeline.enabled")
 
-    sumo = SumoAdapter(cfg["paths"]["sumo_bin"], cfg["paths"]["sumo_cfg"], dt)
+    # Logs
+    offsets = resume["log_offsets"] if continuing else {}
+
+    def open_log(name, fields):
+        return open_csv_logger(run_dir / name, fields, background=bg_logs, maxsize=log_queue,
+                               resume_at=offsets.get(name))
+
+    if INTENT_ONLY:
+        # decisions go straight into the ns-3 intent schedule, already in its sorted form
+        actionlog = IntentScheduleWriter(cfg["paths"].get("intent_csv", "out/ns3/intent.csv"))
+        moblog = None
+    else:
+        mc_on = bool((cfg["algo"].get("mc_risk") or {}).get("enabled", False))
+        actionlog = open_log("actions.csv", ACTION_FIELDS + (["p_coll"] if mc_on else [])
+                             + (SPAN_FIELDS if rle_actions else []))
+        if rle_actions:
+            # change-only log: one row per span of unchanged decisions (load_actions() expands it)
+            actionlog = RleActionLogger(actionlog, tol=alog_cfg.get("tol"))
+        moblog = open_log("mobility.csv",
+            ["t","veh_id","x","y","v","psi","lane_id","road_id","is_av","node_id"])
+
+    # Optional prediction rollout log (offline ADE/FDE); online scoring makes it redundant
+    predlog = open_log("pred_rollouts.csv", ["t","ego_node","track_id","h","t_pred","px","py"]) if log_rollouts else None
+    pred_eval = OnlinePredEvaluator(dt=dt, max_lookahead_s=pred_log_h * decider.dt_pred) if online_pred else None
+
+    # Streaming run KPIs -> kpis.json (compute_kpis_full skips re-parsing when present)
+    kpi_acc = RunKpiAccumulator(dt=dt,
+                                ttc_thr=ev_cfg.get("near_miss_ttc", 1.5),
+                                gap_thr=ev_cfg.get("near_miss_gap", 2.0)) if online_kpis else None
+    if continuing:
+        pred_eval, kpi_acc = resume["pred_eval"], resume["kpi_acc"]
+
+    # Ground-truth collisions + all-pairs TTC/gap (spatial hash) -> safety_events.csv
+    safety = None
+    if gt_safety:
+        safety = GtSafetyMonitor(open_log("safety_events.csv", SAFETY_EVENT_FIELDS),
+                                 ttc_thr=ev_cfg.get("near_miss_ttc", 1.5),
+                                 gap_thr=ev_cfg.get("near_miss_gap", 2.0),
+                                 cell_m=ev_cfg.get("safety_cell_m", 50.0),
+                                 veh_length=ev_cfg.get("veh_length", 5.0))
+        if continuing and resume["safety"] is not None:
+            log, safety = safety.log, resume["safety"]
+            safety.log = log
+
+    sumo = make_adapter(cfg)
     sumo.start()
+    if resume is not None:
+        restore_sumo(sumo, RESUME_FROM)
+
+    # Multi-core decisions: AVs partitioned by edge over worker processes (needs the veh->node map)
+    n_workers = int(cfg["sim"].get("workers", 0) or 0)
+    pool = None
+    if n_workers > 1:
+        if vehmap is None:
+            print("[WARN] sim.workers needs paths.veh_to_node_csv; running decisions in-process")
+        elif live:
+            print("[WARN] sim.workers reads the finished ns-3 logs; running decisions in-process")
+        else:
+            n_nodes = max([len(trace.rcv_ptr) - 1] + [n + 1 for n in vehmap.veh_to_node.values()])
+            pool = DecisionPool(n_workers, cfg, dt, pred_log_h, packets_csv, tx_csv, n_nodes=n_nodes,
+                                init_state=resume["decider"] if resume is not None else None)
+
+    if live:
+        source = RingSource(src_cfg.get("name", "safelane_comm"), timeout_s=src_cfg.get("timeout_s", 10.0))
+    else:
+        source = FileSource(trace, rx_pos=pk_idx)
+
+    stepper = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sumo-step") if pipelined else None
+
+    # Soft real time: ticks paced to the wall clock, each checked against a compute deadline
+    rt_cfg = cfg["sim"].get("realtime") or {}
+    pacer = None
+    if rt_cfg.get("enabled", False):
+        pacer = RealtimePacer(dt, speed=rt_cfg.get("speed", 1.0), deadline_s=rt_cfg.get("deadline_s"),
+                              max_lag_s=rt_cfg.get("max_lag_s", 0.5),
+                              log=open_log("deadline_misses.csv", DEADLINE_MISS_FIELDS))
+        if continuing and resume.get("pacer") is not None:
+            pacer.load_state(resume["pacer"])
+    degrade = pacer is not None and bool(rt_cfg.get("degrade", True))
+    mark = pacer.mark if pacer is not None else (lambda phase: None)
+    last_rows = {}      # ego_id -> latest non-EXECUTE decision row (reused while behind schedule)
+
+    # Memory accounting: RSS (+ tracemalloc) and per-subsystem estimates -> memory.csv, optional ceiling
+    mem_cfg = cfg["sim"].get("memory") or {}
+    memmon = None
+    mem_every = 0
+    if mem_cfg.get("enabled", False):
+        def open_logs():
+            return [lg for lg in (actionlog, moblog, predlog, safety and safety.log, pacer and pacer.log)
+                    if lg is not None]
+
+        # with a pool the decision state lives in the workers: one "memory" round trip per sample
+        owner = pool if pool is not None else decider
+        worker_mem = {}
+
+        def refresh():
+            worker_mem.clear()
+            worker_mem.update(pool.memory())
+
+        def relieve(t_now: float) -> int:
+            for lg in open_logs():
+                lg.flush()
+            return owner.evict(t_now, mem_cfg.get("evict_age_s", 5.0))
+
+        sources = {"comm_trace": trace.memory_bytes}
+        if pool is not None:
+            sources.update({part: (lambda part=part: worker_mem[part]) for part in MEMORY_PARTS})
+        else:
+            sources.update({part: (lambda part=part: decider.memory_bytes(part)) for part in MEMORY_PARTS})
+        sources["logs"] = lambda: sum(lg.memory_bytes() for lg in open_logs())
+        memmon = MemoryMonitor(sources, log=open_log("memory.csv", MemoryMonitor.fields(sources, workers=pool is not None)),
+                               ceiling_mb=mem_cfg.get("ceiling_mb"), on_ceiling=relieve,
+                               trace=bool(mem_cfg.get("tracemalloc", False)),
+                               refresh=refresh if pool is not None else None,
+                               worker_rss=(lambda: worker_mem["rss"]) if pool is not None else None)
+        mem_every = max(1, int(round(float(mem_cfg.get("every_s", 1.0)) / dt)))
+
+    def checkpoint():
+        logs = {"actions.csv": actionlog, "mobility.csv": moblog}
+        if predlog is not None:
+            logs["pred_rollouts.csv"] = predlog
+        if safety is not None:
+            logs["safety_events.csv"] = safety.log
+        if pacer is not None:
+            logs["deadline_misses.csv"] = pacer.log
+        if memmon is not None:
+            logs["memory.csv"] = memmon.log
+        state = {"kind": "periodic", "t": t, "k": k, "pk_idx": pk_idx, "pending": list(pending),
+                 "sumo_ahead": int(pipelined), "sched": sched, "run_dir": str(run_dir),
+                 "decider": pool.state(vehmap.node) if pool is not None else decider.state(),
+                 "log_offsets": {name: lg.flush() for name, lg in logs.items()},
+                 "pred_eval": pred_eval, "kpi_acc": kpi_acc, "safety": safety,
+                 "pacer": pacer.state() if pacer is not None else None}
+        log = safety.log if safety is not None else None
+        try:
+            if safety is not None:
+                safety.log = None       # open file handle; the resumed run reattaches its own
+            save_checkpoint(run_dir / "checkpoints" / f"t{t:09.3f}", sumo, state, keep_siblings=ck_keep)
+        finally:
+            if safety is not None:
+                safety.log = log
 
-    t = 0.0
     try:
-        while t < T:
+        if pipelined and not sumo_ahead:
             sumo.step()
+        while t < T:
+            if pacer is not None:
+                pacer.begin(k)
+            behind = degrade and pacer.behind
+            if not pipelined:
+                # last tick's commands go in right before the step (so checkpoints never hold half-applied ones)
+                while pending and pending[0][0] < k:
+                    _, ego_id, lane_id = pending.popleft()
+                    sumo.change_lane(ego_id, lane_id, duration=1.0)
+                sumo.step()
+                mark("sumo_step")
             veh_ids = sumo.get_vehicle_ids()
             av_ids  = [vid for vid in veh_ids if vid.lower().startswith("av")]
 
             # Stream RX packets up to now
-            while pk_idx < len(pk) and float(pk.loc[pk_idx, "t_rx"]) <= t:
-                row = pk.loc[pk_idx]
-                tx  = int(row["sender_id"])
-                rx  = int(row["receiver_id"])
-                msg_type = int(row["msg_type"])
-                lane_idx = int(row["lane_idx"])
-                tgt_lane = int(row["target_lane_idx"])
-
-                nb = nb_tables.get(rx)
-                if nb is None:
-                    nb = NeighborTable()
-                    nb_tables[rx] = nb
-
-                nb.update(
-                    sender_node=tx,
-                    rx_t=float(row["t_rx"]),
-                    x=float(row["x"]), y=float(row["y"]),
-                    v=float(row["v"]), psi=float(row["psi"]),
-                    lane_idx=lane_idx,
-                    msg_type=msg_type,
-                    target_lane_idx=tgt_lane
-                )
-
-                if msg_type == 2 and tgt_lane >= 0:
-                    intents.update(sender=tx, t_rx=float(row["t_rx"]), target_lane_idx=tgt_lane)
-
-                pk_idx += 1
-
-            # Log mobility
-            for vid in veh_ids:
-                s = sumo.get_state(vid)
-                node_id = (vehmap.node(vid) if vehmap else -1)
-                moblog.write({"t": round(t,3), "veh_id": vid, "x": s.x, "y": s.y, "v": s.v, "psi": s.psi,
-                              "lane_id": s.lane_id, "road_id": s.road_id,
-                              "is_av": int(vid in av_ids), "node_id": node_id})
-
-            # Decisions for each AV
+            batch = source.drain(t)
+            if live:
+                trace.append(batch, t)
+            else:
+                pk_range, pk_idx = source.range, source.rx_pos
+            if pool is None:
+                for rows in batch.rx:
+                    decider.ingest(rows, 0, len(rows["t_rx"]))
+            mark("ingest")
+
+            # --- SUMO-side reads (TraCI) ---
+            states  = sumo.get_states(veh_ids)
+            collisions = sumo.get_collisions() if safety is not None else None
+            mark("sumo_read")
+
+            # Decision plan for due AVs: cached decision, or a job with prefetched SUMO inputs
+            # (workers hold the decision caches, so with a pool every due AV gets a job)
+            plan = []
             for ego_id in av_ids:
-                s = sumo.get_state(ego_id)
+                if not sched.due("decision", k, ego_id):
+                    continue
+                s = states[ego_id]
                 ego_node = vehmap.node(ego_id) if vehmap else 0
-
-                # Lane scoring
+                refresh_link = sched.due("link_kpi", k, ego_node)
+                last = last_rows.get(ego_id) if behind else None
+                if last is not None and last["curr_lane"] == s.lane_id:
+                    # behind schedule: keep the previous decision instead of evaluating
+                    plan.append(AvDecision(row=dict(last, t=round(t,3))))
+                    pacer.reused += 1
+                    continue
+                if pool is None:
+                    hit = decider.cached(t, ego_id, ego_node, s)
+                    if hit is not None:
+                        plan.append(hit)
+                        continue
                 edge = lane_to_edge(s.lane_id)
-                legal_adj = build_legal_adj_same_edge(edge)
+                legal_adj = build_legal_adj_same_edge(edge, sumo=sumo)
                 cand_lanes = legal_adj.get(s.lane_id, [s.lane_id])
+                lane_ctxs = build_lane_contexts(ego_id, s.x, s.y, s.v, s.psi, cand_lanes, sumo=sumo,
+                                                lanes=decider.lanes)
+                plan.append((ego_id, ego_node, s, legal_adj, lane_ctxs, refresh_link))
+            if pool is not None:
+                pool.submit(t, pk_range, [item for item in plan if isinstance(item, tuple)])
+            mark("plan")
+
+            # Actuate commands that are due, then let SUMO advance while Python works
+            step_fut = None
+            if pipelined:
+                while pending and pending[0][0] <= k:
+                    _, ego_id, lane_id = pending.popleft()
+                    sumo.change_lane(ego_id, lane_id, duration=1.0)
+                step_fut = stepper.submit(sumo.step)
+
+            # --- Python-side work (no TraCI below until the step is joined) ---
+            if safety is not None:
+                safety.step(t, states, collisions)
+                mark("safety")
 
-                lane_ctxs = build_lane_contexts(ego_id, s.x, s.y, s.v, s.psi, cand_lanes)
-                penalty_by_lane = {ln: 0.0 for ln in cand_lanes}
-
-                ego = EgoState(veh_id=ego_id, x=s.x, y=s.y, v=s.v, psi=s.psi, lane_id=s.lane_id)
-                ranked, target_lane = laner.run(ego, legal_adj, lane_ctxs, penalty_by_lane)
-                target_lane_idx = lane_idx_from_lane_id(target_lane)
-
-                # True comm KPIs (receiver-centric)
-                link = kpi.get(receiver_id=ego_node, t_end=t)
-                comm = CommKpis(pdr=link.pdr, lat_p95=link.lat_p95)
-
-                if ABL_NON_ADAPT or ABL_MOBIL_ONLY:
-                    comm = CommKpis(pdr=1.0, lat_p95=0.0)
-
-                # Neighbor table update + tracking
-                nb = nb_tables.get(ego_node)
-                neighbor_nodes = set()
-                if nb is not None:
-                    nb.refresh_ages(t)
-                    for tx_node, st in nb.items():
-                        neighbor_nodes.add(tx_node)
-                        if not (ABL_NO_PRED or ABL_MOBIL_ONLY):
-                            ekf.step_track(
-                                veh_id=str(tx_node),
-                                now=t,
-                                z_xyvpsi=(st.x, st.y, st.v, st.psi),
-                                age=st.age,
-                                pdr=comm.pdr,
-                                dt=dt
-                            )
-
-                # Coordination from received LCI only
-                if ABL_NO_INTENT or ABL_MOBIL_ONLY or target_lane == s.lane_id:
-                    coord_ok = True
-                else:
-                    conflict = intents.has_conflict(t, neighbor_nodes, target_lane_idx, ego_node)
-                    coord_ok = not conflict
+            # Log mobility
+            gt_xy = {}          # node_id -> (x, y) ground truth for online ADE/FDE
+            log_mob = moblog is not None and sched.due("mobility_log", k)
+            if log_mob and behind:
+                log_mob = False
+                pacer.logs_skipped += 1
+            for vid in (veh_ids if log_mob or pred_eval is not None or kpi_acc is not None else ()):
+                s = states[vid]
+                node_id = (vehmap.node(vid) if vehmap else -1)
+                if node_id >= 0:
+                    gt_xy[node_id] = (s.x, s.y)
+                if kpi_acc is not None and vid in av_ids:
+                    kpi_acc.on_speed(vid, s.v)
+                if log_mob:
+                    moblog.write({"t": round(t,3), "veh_id": vid, "x": s.x, "y": s.y, "v": s.v, "psi": s.psi,
+                                  "lane_id": s.lane_id, "road_id": s.road_id,
+                                  "is_av": int(vid in av_ids), "node_id": node_id})
 
-                # Leader/follower on target lane using lane_idx match
-                lead_track = None
-                best_ahead = float("inf")
+            mark("mobility")
 
-                if nb is not None and target_lane_idx >= 0:
-                    for tx_node, st in nb.items():
-                        if st.lane_idx != target_lane_idx:
-                            continue
-                        g = projected_gap(s.x, s.y, s.psi, st.x, st.y)
-                        if g > 0 and g < best_ahead:
-                            best_ahead = g
-                            lead_track = str(tx_node)
-
-                # Risk
-                if ABL_NO_PRED or ABL_MOBIL_ONLY:
-                    if best_ahead == float("inf"):
-                        min_ttc, min_th, gap_min = 0.0, 0.0, 0.0
-                    else:
-                        gap_min = float(best_ahead)
-                        closing = max(0.1, s.v)
-                        min_ttc = gap_min / closing
-                        min_th  = gap_min / max(0.1, s.v)
-                else:
-                    if lead_track and lead_track in ekf.tracks:
-                        traj = ekf.rollout(lead_track)
-
-                        # Log a short rollout for prediction metrics
-                        H = min(len(traj), 10)
-                        for h in range(H):
-                            predlog.write({"t": round(t,3), "ego_node": ego_node, "track_id": lead_track,
-                                           "h": h, "px": traj[h].x, "py": traj[h].y})
-
-                        riskL = ekf.risk_vs_ego((s.x, s.y, s.v, s.psi), traj)
-                        min_ttc = float(riskL.min_ttc)
-                        min_th  = float(riskL.min_th)
-                        gap_min = float(min(riskL.gap_profile)) if riskL.gap_profile else float("inf")
+            # Decisions for each AV
+            if pool is not None:
+                outs = iter(pool.collect())
+                plan = [next(outs) if isinstance(item, tuple) else item for item in plan]
+            for item in plan:
+                res = decider.decide(t, *item) if isinstance(item, tuple) else item
+                if degrade:
+                    if res.row["action"] == "EXECUTE":
+                        last_rows.pop(res.row["ego_id"], None)
                     else:
-                        min_ttc, min_th, gap_min = 0.0, 0.0, 0.0
-
-                if ABL_MOBIL_ONLY:
-                    coord_ok = True
-
-                last_t = last_exec.get(ego_id, -1e9)
-                decision = ctrl.decide(
-                    now=t,
-                    last_exec_t=last_t,
-                    risk=PredRisk(min_ttc=min_ttc, min_th=min_th, gap_min=gap_min),
-                    comm=comm,
-                    coord_ok=coord_ok
-                )
-
-                if decision.action == "EXECUTE" and target_lane != s.lane_id:
-                    sumo.change_lane(ego_id, target_lane, duration=1.0)
-                    last_exec[ego_id] = t
-                    lane_changes_count += 1
-
-                actionlog.write({
-                    "t": round(t,3),
-                    "ego_id": ego_id,
-                    "ego_node": ego_node,
-                    "curr_lane": s.lane_id,
-                    "target_lane": target_lane,
-                    "target_lane_idx": target_lane_idx,
-                    "action": decision.action,
-                    "reason": decision.reason,
-                    "pdr": comm.pdr,
-                    "lat_p95": comm.lat_p95,
-                    "min_ttc": min_ttc,
-                    "min_th": min_th,
-                    "gap_min": gap_min,
-                    "coord_ok": int(coord_ok)
-                })
-
+                        last_rows[res.row["ego_id"]] = res.row
+                if res.change_to is not None:
+                    pending.append((k + lag, res.row["ego_id"], res.change_to))
+                if res.pred is not None:
+                    track_node, pts = res.pred
+                    if predlog is not None:
+                        for h, (tp, px, py) in enumerate(pts):
+                            predlog.write({"t": round(t,3), "ego_node": res.row["ego_node"], "track_id": track_node,
+                                           "h": h, "t_pred": round(tp,3), "px": px, "py": py})
+                    if pred_eval is not None:
+                        pred_eval.add(t, track_node, pts)
+                actionlog.write(res.row)
+                if kpi_acc is not None:
+                    r = res.row
+                    kpi_acc.on_action(r["action"], r["pdr"], r["lat_p95"], r["min_ttc"], r["gap_min"])
+
+            mark("decide")
+
+            if pred_eval is not None:
+                pred_eval.score(t, gt_xy)
+                mark("pred_eval")
+
+            if step_fut is not None:
+                step_fut.result()
+                mark("sumo_step")
+
+            if pacer is not None:
+                pacer.end(t, k, behind)
+            if memmon is not None and k % mem_every == 0:
+                memmon.sample(t)
             t += dt
+            k += 1
+            if ck_every and k % ck_every == 0 and t < T:
+                checkpoint()
 
     finally:
+        if stepper is not None:
+            stepper.shutdown(wait=True)
+        pool_stats = pool.close() if pool is not None else None
+        source.close()
         sumo.close()
         actionlog.close()
-        moblog.close()
-        predlog.close()
-
-    print(f"[OK] Step 7 lane-aware run written to: {run_dir}")
+        if moblog is not None:
+            moblog.close()
+        if predlog is not None:
+            predlog.close()
+        if pred_eval is not None:
+            pred_eval.write_json(run_dir / "pred_metrics.json")
+        if decider.dcache is not None:
+            write_stats_json(run_dir / "eval_stats.json",
+                             [p and p["lazy"] for p in pool_stats] if pool is not None else [decider.dcache.stats()])
+        if decider.roi is not None:
+            write_roi_stats(run_dir / "roi_stats.json",
+                            [p and p["roi"] for p in pool_stats] if pool is not None else [decider.roi.stats()])
+        if safety is not None:
+            safety.close()
+            safety.log.close()
+        if pacer is not None:
+            pacer.log.close()
+            pacer.write_json(run_dir / "realtime_report.json")
+            rt_rep = pacer.report()
+            print(f"[OK] real-time: {rt_rep['misses']}/{rt_rep['ticks']} deadline misses "
+                  f"(p99 response {rt_rep['response_s'].get('p99', 0.0) * 1e3:.1f} ms, deadline {pacer.deadline * 1e3:.1f} ms)")
+        if memmon is not None:
+            memmon.log.close()
+            memmon.write_json(run_dir / "memory_report.json")
+        if kpi_acc is not None:
+            kpi_acc.write_json(run_dir / "kpis.json",
+                               pred=pred_eval.summary() if pred_eval is not None else None,
+                               safety=safety.summary() if safety is not None else None)
+
+    if INTENT_ONLY:
+        print(f"[OK] wrote intent schedule: {actionlog.path} rows={actionlog.rows}")
+    else:
+        print(f"[OK] Step 7 lane-aware run written to: {run_dir}")
 
 if __name__ == "__main__":
-    run("scenarios/configs/base.yaml")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cfg", default="scenarios/configs/base.yaml")
+    args = ap.parse_args()
+    run(args.cfg)
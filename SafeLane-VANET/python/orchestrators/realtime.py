@@ -0,0 +1,138 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+import json
+import time
+import numpy as np
+
+DEADLINE_MISS_FIELDS = ["t","k","start_lag_s","compute_s","response_s","overrun_phase","degraded"]
+# latency histogram bin edges, as fractions of the deadline
+HIST_EDGES = [0.1, 0.25, 0.5, 0.75, 0.9, 1.0, 1.5, 2.0, 5.0]
+
+def _dist(x) -> dict:
+    x = np.asarray(x, dtype=float)
+    if not x.size:
+        return {"n": 0}
+    p50, p90, p99 = np.percentile(x, [50, 90, 99])
+    return {"n": int(x.size), "mean": float(x.mean()), "p50": float(p50), "p90": float(p90),
+            "p99": float(p99), "max": float(x.max())}
+
+class RealtimePacer:
+    '''
+    Soft-real-time pacing of the closed loop to the wall clock (roadside-unit mode).
+    Tick k is released at t0 + k * dt / speed; begin() sleeps until then. The
+    tick's work is split into phases by mark(); end() compares the response
+    time (release -> end of tick) with deadline_s and logs a miss with the
+    phase during which the deadline passed ("backlog" when the tick started
+    past it). `behind` tells the loop to degrade
+    (skip mobility logging, reuse previous decisions) for the next tick. A
+    loop more than max_lag_s behind resynchronizes its clock instead of
+    bursting through the backlog.
+    '''
+    def __init__(self, dt: float, speed: float = 1.0, deadline_s: Optional[float] = None,
+                 max_lag_s: float = 0.5, log=None, clock=time.perf_counter, sleep=time.sleep):
+        self.period = float(dt) / max(1e-9, float(speed))
+        self.deadline = float(deadline_s) if deadline_s else self.period
+        self.max_lag = float(max_lag_s)
+        self.log = log
+        self._clock, self._sleep = clock, sleep
+        self._t0: Optional[float] = None
+        self._k0 = 0
+        self._release = 0.0
+        self._start = 0.0
+        self._last = 0.0
+        self._phase_t: Dict[str, float] = {}
+        self._crossed: Optional[str] = None
+        self.behind = False
+
+        self.compute: List[float] = []
+        self.response: List[float] = []
+        self.start_lag: List[float] = []
+        self.phases: Dict[str, List[float]] = {}
+        self.misses = 0
+        self.miss_phases: Dict[str, int] = {}
+        self.degraded = 0
+        self.resyncs = 0
+        self.reused = 0          # decisions reused instead of evaluated while behind
+        self.logs_skipped = 0    # mobility-log ticks skipped while behind
+
+    def begin(self, k: int):
+        now = self._clock()
+        if self._t0 is None:
+            self._t0, self._k0 = now, k
+        release = self._t0 + (k - self._k0) * self.period
+        if now < release:
+            self._sleep(release - now)
+            now = self._clock()
+        elif now - release > self.max_lag:
+            self._t0, self._k0 = now, k          # too far behind: drop the backlog
+            release = now
+            self.resyncs += 1
+        self._release, self._start, self._last = release, now, now
+        self._phase_t = {}
+        self._crossed = "backlog" if now - release > self.deadline else None    # started too late already
+
+    def mark(self, phase: str):
+        '''Ends `phase` (the work since the previous mark).'''
+        now = self._clock()
+        self._phase_t[phase] = self._phase_t.get(phase, 0.0) + now - self._last
+        if self._crossed is None and now - self._release > self.deadline:
+            self._crossed = phase
+        self._last = now
+
+    def end(self, t: float, k: int, degraded: bool):
+        now = self._clock()
+        compute, response = now - self._start, now - self._release
+        self.compute.append(compute)
+        self.response.append(response)
+        self.start_lag.append(self._start - self._release)
+        for name, d in self._phase_t.items():
+            self.phases.setdefault(name, []).append(d)
+        self.degraded += int(degraded)
+        if response > self.deadline:
+            phase = self._crossed or "loop"
+            self.misses += 1
+            self.miss_phases[phase] = self.miss_phases.get(phase, 0) + 1
+            if self.log is not None:
+                self.log.write({"t": round(t, 3), "k": k, "start_lag_s": self._start - self._release,
+                                "compute_s": compute, "response_s": response,
+                                "overrun_phase": phase, "degraded": int(degraded)})
+        # behind if the next tick is already due
+        self.behind = now > self._release + self.period
+
+    # statistics carried across a checkpoint resume (the wall-clock schedule restarts with the process)
+    STAT_FIELDS = ("compute", "response", "start_lag", "phases", "misses", "miss_phases",
+                   "degraded", "resyncs", "reused", "logs_skipped")
+
+    def state(self) -> dict:
+        return {name: getattr(self, name) for name in self.STAT_FIELDS}
+
+    def load_state(self, st: dict):
+        for name, v in st.items():
+            setattr(self, name, v)
+
+    def report(self) -> dict:
+        n = len(self.response)
+        edges = [0.0] + [f * self.deadline for f in HIST_EDGES] + [np.inf]
+        hist = np.histogram(np.asarray(self.response, dtype=float), bins=edges)[0] if n else np.zeros(len(edges) - 1)
+        total = sum(sum(v) for v in self.phases.values()) or 1.0
+        return {
+            "period_s": self.period,
+            "deadline_s": self.deadline,
+            "ticks": n,
+            "misses": int(self.misses),
+            "miss_rate": self.misses / n if n else 0.0,
+            "miss_phases": dict(sorted(self.miss_phases.items())),
+            "degraded_ticks": int(self.degraded),
+            "decisions_reused": int(self.reused),
+            "mobility_logs_skipped": int(self.logs_skipped),
+            "resyncs": int(self.resyncs),
+            "compute_s": _dist(self.compute),
+            "response_s": _dist(self.response),
+            "start_lag_s": _dist(self.start_lag),
+            "response_hist": [{"le_deadline": f, "count": int(c)} for f, c in zip(HIST_EDGES + ["inf"], hist)],
+            "phases": {name: dict(_dist(v), share=float(sum(v)) / total) for name, v in sorted(self.phases.items())},
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
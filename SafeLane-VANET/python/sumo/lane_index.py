@@ -0,0 +1,223 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import xml.etree.ElementTree as ET
+import numpy as np
+
+@dataclass
+class LaneCoords:
+    lane: np.ndarray      # index into LaneIndex.lane_ids (-1: no lane within radius_m)
+    s: np.ndarray         # along-lane position, in SUMO lanePosition units (nan where lane == -1)
+    d: np.ndarray         # signed lateral offset, left of the driving direction positive
+    dist: np.ndarray      # distance to the centerline
+
+def _expand(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''Ranges [starts[i], ends[i]) flattened -> (owner i, element) pairs.'''
+    cnt = np.maximum(ends - starts, 0)
+    owner = np.repeat(np.arange(len(starts)), cnt)
+    elem = np.arange(int(cnt.sum())) - np.repeat(np.cumsum(cnt) - cnt, cnt) + np.repeat(starts, cnt)
+    return owner, elem
+
+class LaneIndex:
+    '''
+    Lane centerline polylines in a uniform segment grid, for Frenet (s, d)
+    coordinates of many positions per call.
+      - polylines are split into pieces no longer than cell_m; each piece is
+        registered in every cell its bounding box touches, grown by radius_m,
+        so one cell lookup finds every piece within radius_m of a point
+      - project(x, y): nearest lane within radius_m
+      - project(x, y, lane=...): position on a given lane, e.g. the ego
+        projected onto a candidate lane (no radius limit: a point with none
+        of the lane's pieces in its cell is matched against the whole lane)
+      - project(x, y, lane=..., extend=True): points past either end of an
+        open lane continue along the end piece's tangent (s < 0 or s > length),
+        e.g. a leader already on the next edge
+    s is scaled from shape length to the lane's length (as SUMO maps
+    lanePosition onto the shape), so it compares with lane_position().
+    Lanes whose shape closes on itself (or listed in `periodic`) wrap around:
+    along() measures gaps on them modulo the lane length.
+    '''
+    def __init__(self, shapes: Dict[str, Sequence[Tuple[float, float]]],
+                 lengths: Optional[Dict[str, float]] = None, cell_m: float = 20.0, radius_m: float = 10.0,
+                 periodic: Optional[Iterable[str]] = None):
+        self.cell = float(cell_m)
+        self.radius = float(radius_m)
+        self.lane_ids: List[str] = [ln for ln, pts in shapes.items() if len(pts) >= 2]
+        self.lane_pos: Dict[str, int] = {ln: i for i, ln in enumerate(self.lane_ids)}
+        periodic = set(periodic or ())
+
+        ax, ay, bx, by, lane, s0 = [], [], [], [], [], []
+        self.lane_start = np.zeros(len(self.lane_ids), dtype=np.int64)
+        self.lane_end = np.zeros(len(self.lane_ids), dtype=np.int64)
+        self.scale = np.ones(len(self.lane_ids))
+        self.length = np.zeros(len(self.lane_ids))
+        self.closed = np.zeros(len(self.lane_ids), dtype=bool)
+        n = 0
+        for i, ln in enumerate(self.lane_ids):
+            p = np.asarray(shapes[ln], dtype=float)
+            seg = np.hypot(*(p[1:] - p[:-1]).T)
+            k = np.maximum(1, np.ceil(seg / self.cell)).astype(np.int64)     # pieces per segment
+            j, piece = _expand(np.zeros(len(k), dtype=np.int64), k)
+            f0, f1 = piece / k[j], (piece + 1) / k[j]
+            d = p[1:] - p[:-1]
+            ax.append(p[j, 0] + f0 * d[j, 0]); ay.append(p[j, 1] + f0 * d[j, 1])
+            bx.append(p[j, 0] + f1 * d[j, 0]); by.append(p[j, 1] + f1 * d[j, 1])
+            cum = np.r_[0.0, np.cumsum(seg)]
+            s0.append(cum[j] + f0 * seg[j])
+            lane.append(np.full(len(j), i, dtype=np.int64))
+            self.lane_start[i], self.lane_end[i] = n, n + len(j)
+            n += len(j)
+            if lengths is not None and ln in lengths and cum[-1] > 0:
+                self.scale[i] = float(lengths[ln]) / cum[-1]
+            self.length[i] = cum[-1] * self.scale[i]
+            self.closed[i] = ln in periodic or bool(np.hypot(*(p[-1] - p[0])) < 1e-3 * max(cum[-1], 1.0))
+        cat = lambda a, dt=float: np.concatenate(a) if a else np.zeros(0, dtype=dt)
+        self.ax, self.ay, self.bx, self.by = cat(ax), cat(ay), cat(bx), cat(by)
+        self.seg_lane, self.seg_s0 = cat(lane, np.int64), cat(s0)
+        self.dx, self.dy = self.bx - self.ax, self.by - self.ay
+        self.len2 = np.maximum(self.dx ** 2 + self.dy ** 2, 1e-12)
+        self._build_grid()
+
+    def _build_grid(self):
+        if not len(self.ax):
+            self.x0 = self.y0 = 0.0
+            self.ny = 1
+            self.nx = 1
+            self.cell_keys = np.zeros(0, dtype=np.int64)
+            self.cell_ptr = np.zeros(1, dtype=np.int64)
+            self.cell_seg = np.zeros(0, dtype=np.int64)
+            return
+        r, c = self.radius, self.cell
+        lo_x, hi_x = np.minimum(self.ax, self.bx) - r, np.maximum(self.ax, self.bx) + r
+        lo_y, hi_y = np.minimum(self.ay, self.by) - r, np.maximum(self.ay, self.by) + r
+        self.x0, self.y0 = float(lo_x.min()), float(lo_y.min())
+        ix0, ix1 = ((lo_x - self.x0) // c).astype(np.int64), ((hi_x - self.x0) // c).astype(np.int64)
+        iy0, iy1 = ((lo_y - self.y0) // c).astype(np.int64), ((hi_y - self.y0) // c).astype(np.int64)
+        self.nx, self.ny = int(ix1.max()) + 1, int(iy1.max()) + 1
+        w = iy1 - iy0 + 1
+        seg, local = _expand(np.zeros(len(ix0), dtype=np.int64), (ix1 - ix0 + 1) * w)
+        keys = (ix0[seg] + local // w[seg]) * self.ny + (iy0[seg] + local % w[seg])
+        order = np.argsort(keys, kind="stable")
+        keys, self.cell_seg = keys[order], seg[order]
+        self.cell_keys, first = np.unique(keys, return_index=True)
+        self.cell_ptr = np.r_[first, len(keys)].astype(np.int64)
+
+    def _cell_ranges(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ix = np.floor((x - self.x0) / self.cell).astype(np.int64)
+        iy = np.floor((y - self.y0) / self.cell).astype(np.int64)
+        inside = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        key = ix * self.ny + iy
+        pos = np.minimum(np.searchsorted(self.cell_keys, key), max(0, len(self.cell_keys) - 1))
+        hit = inside & (len(self.cell_keys) > 0)
+        if len(self.cell_keys):
+            hit &= self.cell_keys[pos] == key
+        starts = np.where(hit, self.cell_ptr[pos], 0)
+        ends = np.where(hit, self.cell_ptr[np.minimum(pos + 1, len(self.cell_ptr) - 1)], 0)
+        return starts, ends
+
+    def _foot(self, x, y, pt, seg):
+        '''Foot-point fraction along each piece and squared distance, per (point, piece) pair.'''
+        px, py = x[pt] - self.ax[seg], y[pt] - self.ay[seg]
+        f = np.clip((px * self.dx[seg] + py * self.dy[seg]) / self.len2[seg], 0.0, 1.0)
+        ex, ey = px - f * self.dx[seg], py - f * self.dy[seg]
+        return f, ex * ex + ey * ey
+
+    def project(self, x, y, lane: Union[None, str, Sequence[str]] = None, extend: bool = False) -> LaneCoords:
+        '''
+        (x, y) -> LaneCoords, one vectorized pass over all (point, candidate piece) pairs.
+        lane: None (nearest lane within radius_m), one lane id for all points, or one per point.
+        extend (with lane): past the ends of an open lane, project onto the end pieces' tangents.
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        n = len(x)
+        starts, ends = self._cell_ranges(x, y)
+        pt, k = _expand(starts, ends)
+        seg = self.cell_seg[k]
+        if lane is not None:
+            names = [lane] * n if isinstance(lane, str) else list(lane)
+            li = np.array([self.lane_pos.get(ln, -1) for ln in names], dtype=np.int64)
+            keep = self.seg_lane[seg] == li[pt]
+            pt, seg = pt[keep], seg[keep]
+        f, d2 = self._foot(x, y, pt, seg)
+        keep = d2 <= self.radius ** 2          # exact: every piece within radius_m is in the cell
+        pt, seg, f, d2 = pt[keep], seg[keep], f[keep], d2[keep]
+        if lane is not None:
+            # points farther than radius_m from the lane: scan all of its pieces
+            far = np.flatnonzero((li >= 0) & (np.bincount(pt, minlength=n) == 0))
+            if len(far):
+                owner, seg_far = _expand(self.lane_start[li[far]], self.lane_end[li[far]])
+                f_far, d2_far = self._foot(x, y, far[owner], seg_far)
+                pt, seg = np.r_[pt, far[owner]], np.r_[seg, seg_far]
+                f, d2 = np.r_[f, f_far], np.r_[d2, d2_far]
+
+        # nearest piece per point
+        order = np.lexsort((d2, pt))
+        first = np.r_[True, pt[order][1:] != pt[order][:-1]] if len(order) else np.zeros(0, dtype=bool)
+        best = order[first]
+        p, sg = pt[best], seg[best]
+
+        out_lane = np.full(n, -1, dtype=np.int64)
+        out_s, out_d, out_dist = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.inf)
+        ln = self.seg_lane[sg]
+        seg_len = np.sqrt(self.len2[sg])
+        out_lane[p] = ln
+        cross = self.dx[sg] * (y[p] - self.ay[sg]) - self.dy[sg] * (x[p] - self.ax[sg])
+        fb, dist = f[best], np.sqrt(d2[best])
+        if lane is not None and extend:
+            # beyond the first / last piece of an open lane: unclamped foot point on its tangent
+            raw = ((x[p] - self.ax[sg]) * self.dx[sg] + (y[p] - self.ay[sg]) * self.dy[sg]) / self.len2[sg]
+            past = ~self.closed[ln] & (((sg == self.lane_start[ln]) & (raw < 0.0))
+                                       | ((sg == self.lane_end[ln] - 1) & (raw > 1.0)))
+            fb = np.where(past, raw, fb)
+            dist = np.where(past, np.abs(cross) / seg_len, dist)
+        out_s[p] = (self.seg_s0[sg] + fb * seg_len) * self.scale[ln]
+        out_d[p] = cross / seg_len
+        out_dist[p] = dist
+        return LaneCoords(lane=out_lane, s=out_s, d=out_d, dist=out_dist)
+
+    def along(self, lane: str, s_from, s_to):
+        '''Signed along-lane distance s_to - s_from on `lane`; the shorter way round on a closed lane.'''
+        i = self.lane_pos[lane]
+        d = np.asarray(s_to, dtype=float) - s_from
+        if self.closed[i]:
+            L = self.length[i]
+            d = (d + 0.5 * L) % L - 0.5 * L
+        return d
+
+def net_file_from_sumocfg(sumo_cfg: str) -> Path:
+    '''The <net-file value=...> of a .sumocfg, resolved against its directory.'''
+    root = ET.parse(sumo_cfg).getroot()
+    node = root.find(".//net-file")
+    if node is None or not node.get("value"):
+        raise ValueError(f"{sumo_cfg}: no <net-file> entry")
+    return (Path(sumo_cfg).parent / node.get("value").split(",")[0]).resolve()
+
+def read_net_lanes(net_file) -> Tuple[Dict[str, List[Tuple[float, float]]], Dict[str, float]]:
+    '''Lane shapes and lengths of a SUMO .net.xml (internal junction lanes included).'''
+    shapes: Dict[str, List[Tuple[float, float]]] = {}
+    lengths: Dict[str, float] = {}
+    for _, el in ET.iterparse(str(net_file)):
+        if el.tag == "lane" and el.get("shape"):
+            pts = [tuple(map(float, xy.split(",")[:2])) for xy in el.get("shape").split()]
+            shapes[el.get("id")] = pts
+            if el.get("length"):
+                lengths[el.get("id")] = float(el.get("length"))
+        if el.tag == "edge":
+            el.clear()
+    return shapes, lengths
+
+def load_lane_index(cfg: dict) -> LaneIndex:
+    '''LaneIndex of the run's network: algo.lane_index.net_file, the .sumocfg's net, or the synthetic lanes.'''
+    li_cfg = cfg["algo"].get("lane_index") or {}
+    periodic = ()
+    if cfg["sim"].get("sumo_backend") == "synthetic":
+        from python.sumo.synthetic import make_synthetic
+        shapes, lengths = make_synthetic(cfg).lane_shapes()
+        periodic = shapes.keys()       # ring and highway both wrap around
+    else:
+        net = li_cfg.get("net_file") or net_file_from_sumocfg(cfg["paths"]["sumo_cfg"])
+        shapes, lengths = read_net_lanes(net)
+    return LaneIndex(shapes, lengths, cell_m=li_cfg.get("cell_m", 20.0), radius_m=li_cfg.get("radius_m", 10.0),
+                     periodic=periodic)
@@ -7,18 +7,16 @@ def lane_to_edge(lane_id: str) -> str:
         return lane_id.rsplit("_", 1)[0]
     return lane_id
 
-def build_legal_adj_same_edge(edge_id: str, n_lanes: int | None = None) -> Dict[str, List[str]]:
+def build_legal_adj_same_edge(edge_id: str, n_lanes: int | None = None, sumo=None) -> Dict[str, List[str]]:
     '''
     Builds a simple adjacency graph for lanes on the SAME edge:
     lane i can stay, and can move to i-1 or i+1 if exists.
 
-    If n_lanes is None, we try to query SUMO via traci (if connected).
+    If n_lanes is None, we try to query SUMO via the SumoAdapter `sumo` (if connected).
     '''
     if n_lanes is None:
         try:
-            import traci
-            lanes = traci.edge.getLaneNumber(edge_id)
-            n_lanes = int(lanes)
+            n_lanes = sumo.edge_lane_number(edge_id)
         except Exception:
             n_lanes = 1
 
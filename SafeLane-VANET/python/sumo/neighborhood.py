@@ -12,29 +12,32 @@ class LaneContext:
     follower_speed: float
 
 def build_lane_contexts(ego_id: str, ex: float, ey: float, ev: float, epsi: float, candidate_lanes: List[str],
-                        max_scan: float = 150.0) -> Dict[str, LaneContext]:
+                        max_scan: float = 150.0, sumo=None, lanes=None) -> Dict[str, LaneContext]:
     '''
     For each candidate lane, estimate nearest leader and follower using lane vehicle lists + lane positions.
-    This is SUMO-only (TraCI). If TraCI missing, returns conservative gaps.
+    This is SUMO-only (queries go through the started SumoAdapter `sumo`). Without one, returns conservative gaps.
+    With a LaneIndex `lanes`, the ego's position on a lane it is not on is its
+    projection onto that lane's centerline (otherwise 0.0).
     '''
     ctx: Dict[str, LaneContext] = {}
-    try:
-        import traci
-    except Exception:
+    if sumo is None or not sumo.connected:
         # Conservative fallback
         for ln in candidate_lanes:
             ctx[ln] = LaneContext(lane_id=ln, leader_gap=0.0, follower_gap=0.0, leader_speed=0.0, follower_speed=0.0)
         return ctx
 
+    ego_lane = sumo.lane_id(ego_id)
     for ln in candidate_lanes:
-        vids = traci.lane.getLastStepVehicleIDs(ln)
-        # compute ego longitudinal coordinate if ego is on this lane; else approximate by projecting in heading
-        # Use lanePosition if ego is in same lane; otherwise use projection in ego heading as proxy.
-        ego_lane = traci.vehicle.getLaneID(ego_id)
+        vids = sumo.lane_vehicle_ids(ln)
+        # ego longitudinal coordinate: lanePosition on its own lane, else its projection onto ln
         if ego_lane == ln:
-            epos = traci.vehicle.getLanePosition(ego_id)
+            epos = sumo.lane_position(ego_id)
         else:
             epos = 0.0
+            if lanes is not None:
+                s = float(lanes.project([ex], [ey], lane=ln).s[0])
+                if not math.isnan(s):
+                    epos = s
 
         best_ahead = (float("inf"), None)
         best_behind = (float("inf"), None)
@@ -43,7 +46,7 @@ def build_lane_contexts(ego_id: str, ex: float, ey: float, ev: float, epsi: floa
             if v == ego_id:
                 continue
             try:
-                pos = traci.vehicle.getLanePosition(v)
+                pos = sumo.lane_position(v)
                 gap = float(pos - epos)
                 if gap >= 0 and gap < best_ahead[0]:
                     best_ahead = (gap, v)
@@ -55,8 +58,8 @@ def build_lane_contexts(ego_id: str, ex: float, ey: float, ev: float, epsi: floa
         leader_gap = best_ahead[0] if best_ahead[1] is not None else 0.0
         follower_gap = best_behind[0] if best_behind[1] is not None else 0.0
 
-        leader_speed = float(traci.vehicle.getSpeed(best_ahead[1])) if best_ahead[1] is not None else 0.0
-        follower_speed = float(traci.vehicle.getSpeed(best_behind[1])) if best_behind[1] is not None else 0.0
+        leader_speed = sumo.speed(best_ahead[1]) if best_ahead[1] is not None else 0.0
+        follower_speed = sumo.speed(best_behind[1]) if best_behind[1] is not None else 0.0
 
         ctx[ln] = LaneContext(lane_id=ln, leader_gap=leader_gap, follower_gap=follower_gap,
                               leader_speed=leader_speed, follower_speed=follower_speed)
@@ -0,0 +1,328 @@
+from __future__ import annotations
+import argparse
+import math
+import time
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+from python.sumo.traci_adapter import VehicleState, CollisionEvent
+
+GEOMETRIES = ("ring", "highway")
+
+class SyntheticTraffic:
+    '''
+    SUMO stand-in for scaling studies and SUMO-less machines: a vectorized
+    IDM car-following kernel on one multi-lane edge, exposing the SumoAdapter
+    API (vehicle/lane queries, change_lane, collisions, save/load state).
+
+      - geometry "ring": lanes are concentric circles of circumference length_m
+        (lane 0 outermost, i.e. rightmost for counter-clockwise travel);
+        "highway": straight lanes along +x with periodic boundary (a vehicle
+        leaving at length_m re-enters at 0). Lane position is the arc length of
+        the edge, shared by all lanes, so build_lane_contexts works unchanged.
+      - fixed population of n_vehicles, ids av{i} / car{i} (av_share of them AVs,
+        unique trailing digits for veh_to_node), desired speeds v0 * (1 +/- v0_spread).
+      - each step: sort by (lane, position), leader = next vehicle on the lane,
+        IDM acceleration, Euler update with the new speed (SUMO's default).
+      - change_lane() requests are held for `duration` and applied on the first
+        step where the target lane has s0 + T * closing-speed of room ahead and
+        behind (also from vehicles entering the lane in the same step); only
+        requested changes happen (no autonomous lane changing).
+      - a follower that ends a step overlapping its leader is reported by
+        get_collisions() and placed s0 behind it at the leader's speed.
+
+    Heading psi follows SUMO's angle convention (degrees clockwise from north,
+    returned in radians by get_state), like TraCI.
+    '''
+    def __init__(self, step_length: float, geometry: str = "ring", length_m: float = 2000.0,
+                 n_lanes: int = 3, lane_width: float = 3.2, n_vehicles: int = 200, av_share: float = 0.2,
+                 edge_id: str = "syn", v0: float = 30.0, v0_spread: float = 0.1, T: float = 1.2,
+                 a_max: float = 1.5, b: float = 2.0, s0: float = 2.0, delta: float = 4.0,
+                 veh_length: float = 5.0, seed: Optional[int] = None):
+        if geometry not in GEOMETRIES:
+            raise ValueError(f"unknown synthetic geometry: {geometry!r} (expected one of {GEOMETRIES})")
+        self.step_length = float(step_length)
+        self.geometry = geometry
+        self.length_m = float(length_m)
+        self.n_lanes = int(n_lanes)
+        self.lane_width = float(lane_width)
+        self.n_vehicles = int(n_vehicles)
+        self.av_share = float(av_share)
+        self.edge_id = str(edge_id)
+        self.v0, self.v0_spread = float(v0), float(v0_spread)
+        self.T, self.a_max, self.b, self.s0, self.delta = float(T), float(a_max), float(b), float(s0), float(delta)
+        self.veh_length = float(veh_length)
+        self.seed = seed
+        self.backend = "synthetic"
+        self._started = False
+        self.time = 0.0
+
+    # ---- population / kernel ----
+
+    def start(self):
+        rng = np.random.default_rng(self.seed)
+        n, L = self.n_vehicles, self.length_m
+        is_av = rng.random(n) < self.av_share
+        self.ids: List[str] = [("av" if a else "car") + str(i) for i, a in enumerate(is_av)]
+        self.idx: Dict[str, int] = {vid: i for i, vid in enumerate(self.ids)}
+        self.lane_ids = [f"{self.edge_id}_{i}" for i in range(self.n_lanes)]
+        self.lane = (rng.permutation(n) % self.n_lanes).astype(np.int64)
+        self.pos = np.empty(n)
+        for ln in range(self.n_lanes):
+            on = np.flatnonzero(self.lane == ln)
+            m = len(on)
+            if m:
+                self.pos[on] = ((np.arange(m) + rng.uniform(-0.2, 0.2, m)) * (L / m)) % L
+        self.v0_i = self.v0 * (1.0 + rng.uniform(-self.v0_spread, self.v0_spread, n))
+        per_lane = max(1, math.ceil(n / self.n_lanes))
+        self.v = np.minimum(self.v0_i, max(0.0, (L / per_lane - self.veh_length - self.s0) / self.T))
+        self.lc_target = np.full(n, -1, dtype=np.int64)
+        self.lc_until = np.zeros(n)
+        self.time = 0.0
+        self._order = np.arange(n)
+        self._collisions: List[CollisionEvent] = []
+        self._sort()
+        self._started = True
+
+    @property
+    def connected(self) -> bool:
+        return self._started
+
+    def _sort(self):
+        '''(lane, position) order; re-sorting the previous order is nearly linear (timsort).'''
+        key = self.lane * (2.0 * self.length_m) + self.pos
+        self._order = self._order[np.argsort(key[self._order], kind="stable")]
+        self._key_s = key[self._order]
+        self._lane_s = self.lane[self._order]
+        self._start_s = np.searchsorted(self._lane_s, np.arange(self.n_lanes), side="left")
+        self._end_s = np.searchsorted(self._lane_s, np.arange(self.n_lanes), side="right")
+        self._geo = None
+        self._by_lane = None
+
+    def _leaders(self):
+        '''Leader index and bumper gap per sorted slot (the lane's first vehicle leads its last: wrap-around).'''
+        o, n = self._order, len(self._order)
+        ln = self._lane_s
+        nxt = np.arange(1, n + 1)
+        last = nxt == self._end_s[ln]
+        nxt[last] = self._start_s[ln[last]]
+        lead = o[nxt]
+        gap = self.pos[lead] - self.pos[o] + np.where(last, self.length_m, 0.0) - self.veh_length
+        return lead, gap
+
+    def _idm(self, v, v0, gap, dv):
+        s_star = self.s0 + np.maximum(0.0, v * self.T + v * dv / (2.0 * math.sqrt(self.a_max * self.b)))
+        return self.a_max * (1.0 - (v / v0) ** self.delta - (s_star / np.maximum(gap, 0.1)) ** 2)
+
+    def _apply_lane_changes(self):
+        pend = np.flatnonzero(self.lc_target >= 0)
+        if not len(pend):
+            return
+        expired = pend[self.time >= self.lc_until[pend]]
+        self.lc_target[expired] = -1
+        pend = pend[self.time < self.lc_until[pend]]
+        same = self.lc_target[pend] == self.lane[pend]
+        self.lc_target[pend[same]] = -1
+        pend = pend[~same]
+        if not len(pend):
+            return
+        tgt, p, v = self.lc_target[pend], self.pos[pend], self.v[pend]
+        st, en = self._start_s[tgt], self._end_s[tgt]
+        j = np.searchsorted(self._key_s, tgt * (2.0 * self.length_m) + p)
+        empty = en == st
+        jl = np.where(j < en, j, st)
+        jf = np.where(j > st, j - 1, en - 1)
+        jl, jf = np.where(empty, 0, jl), np.where(empty, 0, jf)
+        lead, foll = self._order[jl], self._order[jf]
+        gap_l = (self.pos[lead] - p) % self.length_m - self.veh_length
+        gap_f = (p - self.pos[foll]) % self.length_m - self.veh_length
+        ok = empty | ((gap_l >= self.s0 + self.T * np.maximum(0.0, v - self.v[lead]))
+                      & (gap_f >= self.s0 + self.T * np.maximum(0.0, self.v[foll] - v)))
+        moved = self._resolve_merges(pend[ok])
+        self.lane[moved] = self.lc_target[moved]
+        self.lc_target[moved] = -1
+        if len(moved):
+            self._sort()
+
+    def _resolve_merges(self, movers: np.ndarray) -> np.ndarray:
+        '''
+        Movers accepted against the current order, checked against each other in
+        index order: one entering the same target lane too close to an earlier
+        accepted mover (the same room rule as above) waits, so two vehicles
+        never merge into the same gap in one step.
+        '''
+        if len(movers) < 2:
+            return movers
+        keep: List[int] = []
+        for i in movers.tolist():
+            others = [j for j in keep if self.lc_target[j] == self.lc_target[i]]
+            if others:
+                q, vq = self.pos[others], self.v[others]
+                ahead = (q - self.pos[i]) % self.length_m
+                behind = self.length_m - ahead
+                room = np.where(ahead <= behind,
+                                ahead - self.veh_length - self.T * np.maximum(0.0, self.v[i] - vq),
+                                behind - self.veh_length - self.T * np.maximum(0.0, vq - self.v[i]))
+                if np.any(room < self.s0):
+                    continue
+            keep.append(i)
+        return np.asarray(keep, dtype=np.int64)
+
+    def step(self):
+        self._collisions = []
+        self._apply_lane_changes()
+        o = self._order
+        lead, gap = self._leaders()
+        v = self.v[o]
+        acc = self._idm(v, self.v0_i[o], gap, v - self.v[lead])
+        v_new = np.maximum(0.0, v + acc * self.step_length)
+        self.v[o] = v_new
+        self.pos[o] = self.pos[o] + v_new * self.step_length
+        self.time += self.step_length
+
+        # overlaps after the move (same leaders: no overtaking within a lane)
+        new_gap = gap + (self.v[lead] - v_new) * self.step_length
+        hit = np.flatnonzero((new_gap < 0) & (lead != o))
+        if len(hit):
+            f, l = o[hit], lead[hit]
+            for a, c in zip(f.tolist(), l.tolist()):
+                self._collisions.append(CollisionEvent(collider=self.ids[a], victim=self.ids[c], kind="collision",
+                                                       lane_id=self.lane_ids[self.lane[a]],
+                                                       pos=float(self.pos[a] % self.length_m)))
+            self.pos[f] = self.pos[l] - self.veh_length - self.s0
+            self.v[f] = np.minimum(self.v[f], self.v[l])
+        self.pos %= self.length_m
+        self._sort()
+
+    # ---- SumoAdapter API ----
+
+    def get_vehicle_ids(self) -> List[str]:
+        return list(self.ids)
+
+    def _geometry(self):
+        '''x, y, psi (SUMO angle, radians) of all vehicles, cached per step.'''
+        if self._geo is None:
+            if self.geometry == "ring":
+                R = self.length_m / (2.0 * math.pi)
+                th = self.pos / R
+                r = R + (self.n_lanes - 1 - self.lane) * self.lane_width
+                x, y = r * np.cos(th), r * np.sin(th)
+                psi = (-th) % (2.0 * math.pi)            # math heading th + 90deg -> SUMO angle -th
+            else:
+                x, y = self.pos.copy(), self.lane * self.lane_width     # lane 0 rightmost
+                psi = np.full(len(self.pos), math.pi / 2.0)   # +x is SUMO angle 90
+            self._geo = (x.tolist(), y.tolist(), psi.tolist(), self.v.tolist(), self.lane.tolist())
+        return self._geo
+
+    def get_state(self, veh_id: str) -> VehicleState:
+        i = self.idx[veh_id]
+        x, y, psi, v, lane = self._geometry()
+        return VehicleState(veh_id=veh_id, x=x[i], y=y[i], v=v[i], psi=psi[i],
+                            lane_id=self.lane_ids[lane[i]], road_id=self.edge_id)
+
+    def get_states(self, veh_ids: Iterable[str]) -> Dict[str, VehicleState]:
+        return {vid: self.get_state(vid) for vid in veh_ids}
+
+    def lane_vehicle_ids(self, lane_id: str) -> List[str]:
+        if self._by_lane is None:
+            ids = [self.ids[i] for i in self._order.tolist()]
+            self._by_lane = {self.lane_ids[ln]: ids[self._start_s[ln]:self._end_s[ln]] for ln in range(self.n_lanes)}
+        return list(self._by_lane.get(lane_id, []))
+
+    def lane_position(self, veh_id: str) -> float:
+        return float(self.pos[self.idx[veh_id]])
+
+    def speed(self, veh_id: str) -> float:
+        return float(self.v[self.idx[veh_id]])
+
+    def lane_id(self, veh_id: str) -> str:
+        return self.lane_ids[self.lane[self.idx[veh_id]]]
+
+    def edge_lane_number(self, edge_id: str) -> int:
+        if edge_id != self.edge_id:
+            raise KeyError(edge_id)
+        return self.n_lanes
+
+    def lane_shapes(self, seg_m: float = 5.0):
+        '''Lane centerlines and lengths as in a .net.xml (see lane_index.read_net_lanes); no start() needed.'''
+        shapes, lengths = {}, {}
+        for ln in range(self.n_lanes):
+            lane_id = f"{self.edge_id}_{ln}"
+            if self.geometry == "ring":
+                r = self.length_m / (2.0 * math.pi) + (self.n_lanes - 1 - ln) * self.lane_width
+                th = np.linspace(0.0, 2.0 * math.pi, max(8, math.ceil(2.0 * math.pi * r / seg_m)) + 1)
+                shapes[lane_id] = list(zip((r * np.cos(th)).tolist(), (r * np.sin(th)).tolist()))
+            else:
+                y = ln * self.lane_width
+                shapes[lane_id] = [(0.0, y), (self.length_m, y)]
+            lengths[lane_id] = self.length_m          # lane position is the edge arc length on every lane
+        return shapes, lengths
+
+    def get_collisions(self) -> List[CollisionEvent]:
+        return list(self._collisions)
+
+    def change_lane(self, veh_id: str, lane_id: str, duration: float = 1.0):
+        try:
+            lane_index = int(lane_id.rsplit("_", 1)[1])
+        except Exception:
+            lane_index = 0
+        if 0 <= lane_index < self.n_lanes:
+            i = self.idx[veh_id]
+            self.lc_target[i] = lane_index
+            self.lc_until[i] = self.time + float(duration)
+
+    def save_state(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, time=self.time, lane=self.lane, pos=self.pos, v=self.v, v0_i=self.v0_i,
+                     lc_target=self.lc_target, lc_until=self.lc_until, order=self._order,
+                     ids=np.array(self.ids))
+
+    def load_state(self, path: str):
+        with open(path, "rb") as f:
+            z = np.load(f)
+            if [str(s) for s in z["ids"]] != self.ids:
+                raise ValueError(f"synthetic state {path} has a different vehicle population")
+            self.time = float(z["time"])
+            self.lane, self.pos, self.v, self.v0_i = z["lane"], z["pos"], z["v"], z["v0_i"]
+            self.lc_target, self.lc_until, self._order = z["lc_target"], z["lc_until"], z["order"]
+        self._collisions = []
+        self._sort()
+
+    def close(self):
+        self._started = False
+
+def make_synthetic(cfg: dict) -> SyntheticTraffic:
+    syn = dict(cfg["sim"].get("synthetic") or {})
+    idm = syn.pop("idm", None) or {}
+    seed = cfg["sim"].get("seed")
+    # the population must be reproducible: mobility_export and the closed loop rebuild it independently
+    return SyntheticTraffic(float(cfg["sim"]["dt"]), seed=0 if seed is None else int(seed), **syn, **idm)
+
+def main():
+    ap = argparse.ArgumentParser(description="Step-time benchmark of the synthetic traffic kernel")
+    ap.add_argument("--n_vehicles", type=int, default=20000)
+    ap.add_argument("--n_lanes", type=int, default=4)
+    ap.add_argument("--length_m", type=float, default=200000.0)
+    ap.add_argument("--geometry", choices=GEOMETRIES, default="ring")
+    ap.add_argument("--dt", type=float, default=0.1)
+    ap.add_argument("--steps", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    sim = SyntheticTraffic(args.dt, geometry=args.geometry, length_m=args.length_m, n_lanes=args.n_lanes,
+                           n_vehicles=args.n_vehicles, seed=args.seed)
+    sim.start()
+    rng = np.random.default_rng(args.seed)
+    avs = [vid for vid in sim.ids if vid.startswith("av")]
+    t0 = time.perf_counter()
+    n_col = 0
+    for _ in range(args.steps):
+        for vid in rng.choice(avs, size=min(len(avs), 50), replace=False) if avs else []:
+            sim.change_lane(vid, f"{sim.edge_id}_{int(rng.integers(sim.n_lanes))}")
+        sim.step()
+        n_col += len(sim.get_collisions())
+    ms = (time.perf_counter() - t0) / args.steps * 1e3
+    print(f"[OK] {args.n_vehicles} vehicles x {args.steps} steps: {ms:.2f} ms/step, "
+          f"mean speed {sim.v.mean():.1f} m/s, collisions {n_col}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, Iterable, List, Optional
 import os
 
 @dataclass
@@ -13,24 +13,60 @@ class VehicleState:
     lane_id: str
     road_id: str
 
+@dataclass
+class CollisionEvent:
+    collider: str
+    victim: str
+    kind: str
+    lane_id: str
+    pos: float
+
+SUMO_BACKENDS = ("traci", "libsumo", "auto")
+
+def _import_backend(backend: str, sumo_bin: str):
+    '''
+    Returns (module, name). libsumo runs SUMO in-process with the TraCI API but
+    no socket round-trip per call; it has no GUI, so sumo-gui always uses TraCI.
+    "auto" / "libsumo" fall back to TraCI when libsumo cannot be imported.
+    '''
+    if backend not in SUMO_BACKENDS:
+        raise ValueError(f"unknown SUMO backend: {backend!r} (expected one of {SUMO_BACKENDS})")
+    if backend != "traci" and "gui" not in os.path.basename(str(sumo_bin)):
+        try:
+            import libsumo
+            return libsumo, "libsumo"
+        except Exception:
+            if backend == "libsumo":
+                print("[WARN] libsumo not available, falling back to TraCI")
+    try:
+        import traci
+    except Exception as e:
+        raise RuntimeError("TraCI not available. Install SUMO and ensure python can import traci.") from e
+    return traci, "traci"
+
 class SumoAdapter:
-    def __init__(self, sumo_bin: str, sumo_cfg: str, step_length: float):
+    def __init__(self, sumo_bin: str, sumo_cfg: str, step_length: float, backend: str = "traci",
+                 seed: Optional[int] = None):
         self.sumo_bin = sumo_bin
         self.sumo_cfg = sumo_cfg
         self.step_length = float(step_length)
+        self.backend = backend      # resolved to "traci" / "libsumo" by start()
+        self.seed = seed            # SUMO --seed (None: the .sumocfg / SUMO default)
         self._traci = None
 
     def start(self):
-        try:
-            import traci
-        except Exception as e:
-            raise RuntimeError("TraCI not available. Install SUMO and ensure python can import traci.") from e
-        self._traci = traci
+        self._traci, self.backend = _import_backend(self.backend, self.sumo_bin)
         cmd = [self.sumo_bin, "-c", self.sumo_cfg, "--step-length", str(self.step_length)]
         # quiet by default
         cmd += ["--no-warnings", "true"]
+        if self.seed is not None:
+            cmd += ["--seed", str(int(self.seed))]
         self._traci.start(cmd)
 
+    @property
+    def connected(self) -> bool:
+        return self._traci is not None
+
     def step(self):
         self._traci.simulationStep()
 
@@ -45,6 +81,46 @@ class SumoAdapter:
         road_id = str(self._traci.vehicle.getRoadID(veh_id))
         return VehicleState(veh_id=veh_id, x=float(x), y=float(y), v=v, psi=psi, lane_id=lane_id, road_id=road_id)
 
+    def get_states(self, veh_ids: Iterable[str]) -> Dict[str, VehicleState]:
+        return {vid: self.get_state(vid) for vid in veh_ids}
+
+    # Lane queries (neighborhood / lane_topology)
+    def lane_vehicle_ids(self, lane_id: str) -> List[str]:
+        return list(self._traci.lane.getLastStepVehicleIDs(lane_id))
+
+    def lane_position(self, veh_id: str) -> float:
+        return float(self._traci.vehicle.getLanePosition(veh_id))
+
+    def speed(self, veh_id: str) -> float:
+        return float(self._traci.vehicle.getSpeed(veh_id))
+
+    def lane_id(self, veh_id: str) -> str:
+        return str(self._traci.vehicle.getLaneID(veh_id))
+
+    def edge_lane_number(self, edge_id: str) -> int:
+        return int(self._traci.edge.getLaneNumber(edge_id))
+
+    def get_collisions(self) -> List[CollisionEvent]:
+        '''Collisions detected by SUMO in the last step (requires SUMO collision checking).'''
+        try:
+            cols = self._traci.simulation.getCollisions()
+        except Exception:
+            # older SUMO: only the colliding vehicle ids are exposed
+            try:
+                ids = self._traci.simulation.getCollidingVehiclesIDList()
+            except Exception:
+                return []
+            return [CollisionEvent(collider=str(v), victim="", kind="collision", lane_id="", pos=0.0) for v in ids]
+        return [CollisionEvent(collider=str(c.collider), victim=str(c.victim), kind=str(c.type),
+                               lane_id=str(c.lane), pos=float(c.pos)) for c in cols]
+
+    def save_state(self, path: str):
+        '''Full SUMO simulation state (vehicles, routes, time) for checkpoints.'''
+        self._traci.simulation.saveState(str(path))
+
+    def load_state(self, path: str):
+        self._traci.simulation.loadState(str(path))
+
     def change_lane(self, veh_id: str, lane_id: str, duration: float = 1.0):
         # SUMO uses lane index for changeLane; we use changeLaneRelative if possible.
         # We use a safe fallback: setLaneChangeMode and changeLane.
@@ -63,3 +139,10 @@ class SumoAdapter:
             self._traci.close()
         except Exception:
             pass
+
+def make_adapter(cfg: dict) -> SumoAdapter:
+    if cfg["sim"].get("sumo_backend") == "synthetic":
+        from python.sumo.synthetic import make_synthetic
+        return make_synthetic(cfg)
+    return SumoAdapter(cfg["paths"]["sumo_bin"], cfg["paths"]["sumo_cfg"], float(cfg["sim"]["dt"]),
+                       backend=cfg["sim"].get("sumo_backend", "traci"), seed=cfg["sim"].get("seed"))
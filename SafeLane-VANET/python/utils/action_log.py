@@ -0,0 +1,144 @@
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+from python.utils.memory import dict_bytes
+from python.utils.schemas import read_artifact
+
+# Extra actions.csv columns in run-length mode: a row stands for `n` decisions of
+# the same AV at t, ..., t_last (evenly spaced, one per decision tick)
+SPAN_FIELDS = ["t_last","n"]
+# a span ends when any of these changes ...
+SPAN_KEYS = ("ego_node","curr_lane","target_lane","target_lane_idx","action","reason","coord_ok")
+# ... or a metric moves more than its tolerance away from the span's first row
+# (default 0: lossless, KPIs identical to the dense log)
+SPAN_TOL = {"pdr": 0.0, "lat_p95": 0.0, "min_ttc": 0.0, "min_th": 0.0, "gap_min": 0.0, "p_coll": 0.0}
+# metrics with a tolerance are written as span aggregates: the mean of link KPIs (so
+# n-weighted means stay exact), the worst case of risk metrics (so minima stay exact)
+SPAN_MEAN = ("pdr","lat_p95")
+SPAN_MIN = ("min_ttc","min_th","gap_min")
+SPAN_MAX = ("p_coll",)
+
+def _close(a, b, tol: float) -> bool:
+    try:
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        return a == b
+    if a == b or (math.isnan(a) and math.isnan(b)):
+        return True
+    return abs(a - b) <= tol
+
+class RleActionLogger:
+    '''
+    Change-only actions.csv: consecutive decisions of one AV that share
+    SPAN_KEYS and stay within `tol` of the span's first row are written once,
+    with t_last and n. Spans are emitted when they end, on flush() (so
+    checkpoints see complete rows) and on close(). load_actions() restores the
+    dense log; with tol 0 the expansion is exact. A metric with a nonzero
+    tolerance is logged as the span's mean (pdr, lat_p95) or worst value
+    (min_ttc, min_th, gap_min: min; p_coll: max): rates, means and run-wide
+    minima stay exact, per-decision counts and percentiles become approximate.
+    '''
+    def __init__(self, inner, tol: Optional[Dict[str, float]] = None):
+        self.inner = inner                       # CsvLogger over ACTION_FIELDS + SPAN_FIELDS
+        self.path = inner.path
+        self.tol = dict(SPAN_TOL if tol is None else tol)
+        self._agg = [c for c in SPAN_MEAN + SPAN_MIN + SPAN_MAX if self.tol.get(c, 0.0) > 0.0]
+        self._open: Dict[str, list] = {}         # ego_id -> [first row, t_last, n, step, aggregates]
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def _extends(self, span, row) -> bool:
+        first, t_last, n, step, _ = span
+        if any(first.get(c) != row.get(c) for c in SPAN_KEYS):
+            return False
+        # one row per decision tick: a missed tick (AV left, rate change) ends the span
+        if step is not None and abs((row["t"] - t_last) - step) > 5e-4:
+            return False
+        return all(_close(first.get(c), row.get(c), tol) for c, tol in self.tol.items())
+
+    def _emit(self, span):
+        first, t_last, n, _, agg = span
+        row = dict(first, t_last=t_last, n=n)
+        for c, v in agg.items():
+            row[c] = v / n if c in SPAN_MEAN else v
+        self.inner.write(row)
+        self.rows_out += 1
+
+    def _accumulate(self, agg: dict, row: dict):
+        for c in self._agg:
+            v = row.get(c)
+            if v is None:
+                continue
+            if c not in agg:
+                agg[c] = float(v)
+            elif c in SPAN_MEAN:
+                agg[c] += float(v)
+            else:
+                agg[c] = (min if c in SPAN_MIN else max)(agg[c], float(v))
+
+    def write(self, row: dict):
+        self.rows_in += 1
+        ego = row["ego_id"]
+        span = self._open.get(ego)
+        if span is not None and self._extends(span, row):
+            if span[3] is None:
+                span[3] = row["t"] - span[1]
+            span[1] = row["t"]
+            span[2] += 1
+            self._accumulate(span[4], row)
+            return
+        if span is not None:
+            self._emit(span)
+        span = self._open[ego] = [dict(row), row["t"], 1, None, {}]
+        self._accumulate(span[4], row)
+
+    def _drain(self):
+        for span in sorted(self._open.values(), key=lambda s: s[0]["t"]):
+            self._emit(span)
+        self._open = {}
+
+    def flush(self) -> int:
+        self._drain()
+        return self.inner.flush()
+
+    def memory_bytes(self) -> int:
+        return dict_bytes({ego: span[0] for ego, span in self._open.items()}) + self.inner.memory_bytes()
+
+    def close(self):
+        self._drain()
+        self.inner.close()
+
+def load_actions(path, usecols: Optional[Iterable[str]] = None, dtype: Optional[Dict[str, str]] = None,
+                 expand: bool = True) -> pd.DataFrame:
+    '''
+    actions.csv in either format (dense or run-length), via read_artifact().
+    expand=True: one row per decision as in the dense log, in t order (spans
+    are unrolled, t rebuilt on the span's tick grid). expand=False: one row per
+    span with its weight in column `n` (1 for a dense log), for readers that
+    only count or average.
+    '''
+    header = pd.read_csv(path, nrows=0).columns
+    rle = "n" in header
+    want = None if usecols is None else list(usecols)
+    if rle and want is not None:
+        want = want + [c for c in ["t"] + SPAN_FIELDS if c not in want]
+    a = read_artifact(path, "actions", usecols=want, dtype=dtype)
+    if not rle:
+        if not expand:
+            a["n"] = 1
+        return a
+    n = a["n"].to_numpy(dtype=np.int64)
+    if expand:
+        t0 = a["t"].to_numpy(dtype=float)
+        step = (a["t_last"].to_numpy(dtype=float) - t0) / np.maximum(n - 1, 1)
+        a = a.loc[a.index.repeat(n)].reset_index(drop=True)
+        off = np.arange(len(a)) - np.repeat(np.cumsum(n) - n, n)
+        a["t"] = np.round(np.repeat(t0, n) + off * np.repeat(step, n), 3)
+        a = a.sort_values("t", kind="stable").reset_index(drop=True)
+        a = a.drop(columns=[c for c in SPAN_FIELDS if usecols is None or c not in usecols])
+    elif usecols is not None:
+        a = a.drop(columns=[c for c in ["t","t_last"] if c not in usecols])
+    return a
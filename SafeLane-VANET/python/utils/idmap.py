@@ -1,9 +1,9 @@
-import pandas as pd
+from python.utils.schemas import read_artifact
 
 class VehNodeMap:
     def __init__(self, map_csv: str):
-        df = pd.read_csv(map_csv)
-        self.veh_to_node = {str(r["veh_id"]): int(r["node_id"]) for _, r in df.iterrows()}
+        df = read_artifact(map_csv, "veh_to_node")
+        self.veh_to_node = dict(zip(df["veh_id"].astype(str).tolist(), map(int, df["node_id"].tolist())))
 
     def node(self, veh_id: str) -> int:
         if veh_id not in self.veh_to_node:
@@ -1,22 +1,100 @@
 from __future__ import annotations
 import csv
+import io
+import queue
+import threading
 from pathlib import Path
+from typing import Optional
+
+from python.utils.memory import obj_bytes
 
 class CsvLogger:
-    def __init__(self, path: Path, fieldnames: list[str]):
+    def __init__(self, path: Path, fieldnames: list[str], resume_at: Optional[int] = None):
         self.path = Path(path)
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self.fieldnames = fieldnames
-        self._fh = open(self.path, "w", newline="", encoding="utf-8")
-        self._w = csv.DictWriter(self._fh, fieldnames=self.fieldnames)
-        self._w.writeheader()
+        if resume_at is None:
+            self._fh = open(self.path, "w", newline="", encoding="utf-8")
+            self._w = csv.DictWriter(self._fh, fieldnames=self.fieldnames)
+            self._w.writeheader()
+        else:
+            # continue a checkpointed log: drop rows written after the checkpoint
+            self._fh = open(self.path, "r+", newline="", encoding="utf-8")
+            self._fh.truncate(int(resume_at))
+            self._fh.seek(int(resume_at))
+            self._w = csv.DictWriter(self._fh, fieldnames=self.fieldnames)
 
     def write(self, row: dict):
         out = {k: row.get(k, "") for k in self.fieldnames}
         self._w.writerow(out)
 
+    def memory_bytes(self) -> int:
+        return io.DEFAULT_BUFFER_SIZE        # rows wait in the file buffer only
+
+    def flush(self) -> int:
+        '''Flushes buffered rows; returns the file offset (for checkpoints).'''
+        self._fh.flush()
+        return self._fh.tell()
+
     def close(self):
         try:
             self._fh.close()
         except Exception:
             pass
+
+class AsyncCsvLogger(CsvLogger):
+    '''
+    CsvLogger whose formatting and file I/O run on a background writer thread.
+    write() only enqueues; the bounded queue applies back-pressure when the
+    writer falls behind instead of buffering without limit.
+    '''
+    _STOP = object()
+
+    def __init__(self, path: Path, fieldnames: list[str], maxsize: int = 10000, resume_at: Optional[int] = None):
+        super().__init__(path, fieldnames, resume_at=resume_at)
+        self._q: queue.Queue = queue.Queue(maxsize=int(maxsize))
+        self._row_bytes = 0                  # size of the first queued row, for memory_bytes()
+        self._thread = threading.Thread(target=self._drain, name=f"csv-{self.path.name}", daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            row = self._q.get()
+            batch = [row]
+            # write whatever else is already queued in one go
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(r is self._STOP for r in batch)
+            for r in batch:
+                if r is not self._STOP:
+                    CsvLogger.write(self, r)
+            for _ in batch:
+                self._q.task_done()
+            if stop:
+                return
+
+    def write(self, row: dict):
+        if not self._row_bytes:
+            self._row_bytes = obj_bytes(row)
+        self._q.put(row)
+
+    def memory_bytes(self) -> int:
+        return super().memory_bytes() + self._q.qsize() * self._row_bytes
+
+    def flush(self) -> int:
+        self._q.join()      # wait for the writer to drain everything queued so far
+        return super().flush()
+
+    def close(self):
+        self._q.put(self._STOP)
+        self._thread.join()
+        super().close()
+
+def open_csv_logger(path: Path, fieldnames: list[str], background: bool = False, maxsize: int = 10000,
+                    resume_at: Optional[int] = None) -> CsvLogger:
+    if background:
+        return AsyncCsvLogger(path, fieldnames, maxsize=maxsize, resume_at=resume_at)
+    return CsvLogger(path, fieldnames, resume_at=resume_at)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from typing import Callable, Dict, Iterable, Mapping, Optional
+
+MB = 1024.0 * 1024.0
+
+def obj_bytes(obj) -> int:
+    '''Shallow size of a record object plus its attribute values (dataclass rows, dicts of scalars).'''
+    n = sys.getsizeof(obj)
+    d = obj if isinstance(obj, dict) else getattr(obj, "__dict__", None)
+    if d is not None:
+        n += sys.getsizeof(d) if d is not obj else 0
+        n += sum(sys.getsizeof(v) for v in d.values())
+    return n
+
+def dict_bytes(d: Mapping, sample: int = 8) -> int:
+    '''Estimate for a dict of similar records: its table + len(d) x the mean size of a few entries.'''
+    if not d:
+        return sys.getsizeof(d)
+    it = iter(d.items())
+    per = [sys.getsizeof(k) + obj_bytes(v) for _, (k, v) in zip(range(sample), it)]
+    return sys.getsizeof(d) + len(d) * sum(per) // len(per)
+
+def rss_bytes() -> int:
+    '''Resident set size of this process (Linux /proc; elsewhere the peak RSS from getrusage).'''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+    except Exception:
+        return 0
+
+class MemoryMonitor:
+    '''
+    Periodic memory samples of the closed loop -> memory.csv:
+      - process RSS, and with `trace` the Python heap (tracemalloc current/peak;
+        slows allocation-heavy code noticeably)
+      - one column per subsystem, from its memory_bytes() hook (`sources`:
+        name -> callable returning bytes); estimates of the Python objects
+        each subsystem holds, not of what the allocator keeps
+      - with worker processes, their summed RSS (`worker_rss`); `refresh` is
+        called first in every sample, so worker-side numbers can be gathered
+        in one round trip and read back by the sources
+    With ceiling_mb, a sample whose RSS (this process + workers) exceeds the
+    ceiling calls on_ceiling(t) (flush logs, evict stale state; returns the
+    number of evicted entries) and records the RSS after a gc pass.
+    '''
+    def __init__(self, sources: Mapping[str, Callable[[], int]], log=None, ceiling_mb: Optional[float] = None,
+                 on_ceiling: Optional[Callable[[float], int]] = None, trace: bool = False,
+                 refresh: Optional[Callable[[], None]] = None, worker_rss: Optional[Callable[[], int]] = None):
+        self.sources = dict(sources)
+        self.refresh = refresh
+        self.worker_rss = worker_rss
+        self.log = log
+        self.ceiling = float(ceiling_mb) * MB if ceiling_mb else None
+        self.on_ceiling = on_ceiling
+        self.trace = bool(trace)
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.samples = 0
+        self.peak_rss = 0
+        self.peak_total = 0
+        self.peak_by: Dict[str, int] = {name: 0 for name in self.sources}
+        self.ceiling_hits = 0
+        self.evicted = 0
+
+    @staticmethod
+    def fields(names: Iterable[str], workers: bool = False) -> list:
+        return (["t","rss_mb"] + (["workers_rss_mb"] if workers else []) + ["traced_mb","traced_peak_mb"]
+                + [f"{n}_mb" for n in names] + ["evicted","rss_after_mb"])
+
+    def _workers(self) -> int:
+        return int(self.worker_rss()) if self.worker_rss is not None else 0
+
+    def sample(self, t: float) -> dict:
+        if self.refresh is not None:
+            self.refresh()
+        rss = rss_bytes()
+        row = {"t": round(t, 3), "rss_mb": round(rss / MB, 2)}
+        total = rss
+        if self.worker_rss is not None:
+            w = self._workers()
+            row["workers_rss_mb"] = round(w / MB, 2)
+            total += w
+        if self.trace:
+            cur, peak = tracemalloc.get_traced_memory()
+            row["traced_mb"], row["traced_peak_mb"] = round(cur / MB, 2), round(peak / MB, 2)
+        for name, fn in self.sources.items():
+            b = int(fn())
+            self.peak_by[name] = max(self.peak_by[name], b)
+            row[f"{name}_mb"] = round(b / MB, 3)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_total = max(self.peak_total, total)
+        if self.ceiling is not None and total > self.ceiling:
+            self.ceiling_hits += 1
+            n = int(self.on_ceiling(t)) if self.on_ceiling is not None else 0
+            gc.collect()
+            self.evicted += n
+            row["evicted"] = n
+            if self.refresh is not None:
+                self.refresh()
+            row["rss_after_mb"] = round((rss_bytes() + self._workers()) / MB, 2)
+        self.samples += 1
+        if self.log is not None:
+            self.log.write(row)
+        return row
+
+    def report(self) -> dict:
+        out = {"samples": self.samples, "peak_rss_mb": round(self.peak_rss / MB, 2),
+               "peak_total_rss_mb": round(self.peak_total / MB, 2),
+               "ceiling_mb": round(self.ceiling / MB, 2) if self.ceiling is not None else None,
+               "ceiling_hits": self.ceiling_hits, "evicted": self.evicted,
+               "peak_by_subsystem_mb": {n: round(b / MB, 3) for n, b in self.peak_by.items()}}
+        if self.trace:
+            out["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / MB, 2)
+        return out
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
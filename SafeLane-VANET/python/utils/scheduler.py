@@ -0,0 +1,32 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Optional
+
+class MultiRateScheduler:
+    '''
+    Tick-based multi-rate scheduler on top of the SUMO step (dt).
+    A task registered at `hz` runs every round(1 / (hz * dt)) ticks; hz=None runs every tick.
+    Per-key work (e.g. one AV's decision) is phase-staggered: keys get phases
+    round-robin on first sight, so a task's load spreads evenly over its period.
+    '''
+    def __init__(self, dt: float):
+        self.dt = float(dt)
+        self.periods: Dict[str, int] = {}
+        self._phases: Dict[str, Dict[Hashable, int]] = {}
+
+    def register(self, name: str, hz: Optional[float] = None) -> int:
+        period = 1 if not hz else max(1, int(round(1.0 / (float(hz) * self.dt))))
+        self.periods[name] = period
+        self._phases[name] = {}
+        return period
+
+    def due(self, name: str, tick: int, key: Optional[Hashable] = None) -> bool:
+        p = self.periods[name]
+        if p == 1:
+            return True
+        if key is None:
+            return tick % p == 0
+        phases = self._phases[name]
+        ph = phases.get(key)
+        if ph is None:
+            ph = phases[key] = len(phases) % p
+        return (tick + ph) % p == 0
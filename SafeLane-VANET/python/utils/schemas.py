@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+
+# Column dtypes of every CSV artifact, as parsed by read_artifact().
+#   - times stay float64: window cuts, tick rounding and cooldowns compare them exactly
+#   - controller inputs (ns-3 RX payloads, actions.csv risk/link columns) stay float64 so
+#     replays and KPIs see the values the closed loop saw
+#   - ground-truth / predicted kinematics (mobility, rollouts) are float32
+#   - ids int32, small enums int8, repeated strings (vehicle/lane/edge ids, actions) categorical
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    "packets": {
+        "t_tx": "f8", "t_rx": "f8", "sender_id": "i4", "receiver_id": "i4", "msg_type": "i1",
+        "size_bytes": "i4", "dropped": "i1", "x": "f8", "y": "f8", "v": "f8", "psi": "f8",
+        "lane_idx": "i1", "target_lane_idx": "i1",
+    },
+    "tx": {
+        "t_tx": "f8", "sender_id": "i4", "msg_type": "i1", "size_bytes": "i4",
+        "lane_idx": "i1", "target_lane_idx": "i1",
+    },
+    "veh_to_node": {"veh_id": "category", "node_id": "i4"},
+    "mobility_ns3": {
+        "t": "f8", "node_id": "i4", "x": "f4", "y": "f4", "v": "f4", "psi": "f4", "lane_idx": "i1",
+    },
+    "mobility": {
+        "t": "f8", "veh_id": "category", "x": "f4", "y": "f4", "v": "f4", "psi": "f4",
+        "lane_id": "category", "road_id": "category", "is_av": "i1", "node_id": "i4",
+    },
+    "actions": {
+        "t": "f8", "ego_id": "category", "ego_node": "i4", "curr_lane": "category", "target_lane": "category",
+        "target_lane_idx": "i1", "action": "category", "reason": "category", "pdr": "f8", "lat_p95": "f8",
+        "min_ttc": "f8", "min_th": "f8", "gap_min": "f8", "coord_ok": "i1",
+        "p_coll": "f8",                                             # algo.mc_risk
+        "t_last": "f8", "n": "i4",                                  # run-length mode (sim.action_log.rle)
+    },
+    "pred_rollouts": {
+        "t": "f8", "ego_node": "i4", "track_id": "category", "h": "i4", "t_pred": "f8", "px": "f4", "py": "f4",
+    },
+    "safety_events": {
+        "t_start": "f8", "t_end": "f8", "kind": "category", "veh_a": "category", "veh_b": "category",
+        "lane_rel": "f4", "min_ttc": "f8", "min_gap": "f8",
+    },
+    "intent": {"t_tx": "f8", "sender_id": "i4", "target_lane_idx": "i1"},
+}
+
+def _engine() -> str:
+    '''pyarrow's multithreaded CSV reader when installed, else pandas' C parser.'''
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except Exception:
+        return "c"
+
+ENGINE = _engine()
+
+def _coerce(col: pd.Series, dtype: str) -> pd.Series:
+    '''Slow path for one column that did not parse as `dtype` (malformed cells become NaN).'''
+    if dtype == "category":
+        return col.astype("category")
+    col = pd.to_numeric(col, errors="coerce")
+    if dtype.startswith("i"):
+        if col.isna().any():
+            return col.astype("f8")          # gaps: keep NaN for the caller's dropna()
+        info = np.iinfo(np.dtype(dtype))
+        if col.min() < info.min or col.max() > info.max:
+            return col.astype("i8")
+    return col.astype(dtype)
+
+def read_artifact(path, kind: str, usecols: Optional[Iterable[str]] = None, dtype: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    '''
+    pd.read_csv with the artifact's compact dtypes and column projection.
+    usecols: columns to load (default: all schema columns); names missing from
+    the file are skipped, so callers test `in df.columns` as before; requested
+    columns outside the schema are read with pandas defaults. `dtype` overrides single
+    columns (e.g. "f8" where a computation needs full precision).
+    The typed parse is tried first; a file with malformed cells falls back to
+    a default parse plus per-column to_numeric(errors="coerce").
+    '''
+    schema = dict(SCHEMAS[kind])
+    schema.update(dtype or {})
+    header = pd.read_csv(path, nrows=0).columns
+    want = list(usecols) if usecols is not None else list(schema)
+    cols = [c for c in header if c in want]
+    types = {c: schema[c] for c in cols if c in schema}
+    try:
+        return pd.read_csv(path, usecols=cols, dtype=types, engine=ENGINE)
+    except (ValueError, TypeError, OverflowError):
+        pass
+    df = pd.read_csv(path, usecols=cols)
+    for c, t in types.items():
+        df[c] = _coerce(df[c], t)
+    return df